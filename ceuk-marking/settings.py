@@ -34,6 +34,11 @@ env = environ.Env(
     LOG_LEVEL=(str, "WARNING"),
     BRAND=(str, "default"),
     LOG_FAILED_LOGINS=(bool, False),
+    SCORING_ENGINE=(str, "default"),
+    SCORING_CONFIG_CACHE_TIMEOUT=(int, 60 * 60),
+    ASSIGNMENT_PROGRESS_CACHE_TIMEOUT=(int, 60 * 60),
+    EXPORT_JOB_TIMEOUT=(int, 60 * 60),
+    MARKING_SESSION_CACHE_TIMEOUT=(int, 60),
 )
 environ.Env.read_env(BASE_DIR / ".env")
 
@@ -47,6 +52,21 @@ MAPIT_API_KEY = env("MAPIT_API_KEY")
 LOG_LEVEL = env("LOG_LEVEL")
 BRAND = env("BRAND")
 LOG_FAILED_LOGINS = env("LOG_FAILED_LOGINS")
+SCORING_ENGINE = env("SCORING_ENGINE")
+SCORING_CONFIG_CACHE_TIMEOUT = env("SCORING_CONFIG_CACHE_TIMEOUT")
+ASSIGNMENT_PROGRESS_CACHE_TIMEOUT = env("ASSIGNMENT_PROGRESS_CACHE_TIMEOUT")
+# where background stats exports are written, and how long a running export
+# can take before it is assumed to have died
+EXPORT_DIR = Path(env.str("EXPORT_DIR", str(BASE_DIR / "data" / "exports")))
+EXPORT_JOB_TIMEOUT = env("EXPORT_JOB_TIMEOUT")
+MARKING_SESSION_CACHE_TIMEOUT = env("MARKING_SESSION_CACHE_TIMEOUT")
+# rolling back a test does not send the signals that clear the cached
+# sessions so they would leak into the next test
+if TEST_MODE:
+    MARKING_SESSION_CACHE_TIMEOUT = 0
+
+# use a shared cache, e.g. redis://, if running more than one worker
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://")}
 
 BRAND_TEMPLATES = BASE_DIR / "cobrands" / BRAND
 
@@ -214,6 +214,16 @@ session_patterns = [
         stats.SectionScoresDataCSVView.as_view(),
         name="raw_and_weighted_totals_csv",
     ),
+    path(
+        "stats/exports/<export>/",
+        stats.ExportJobView.as_view(),
+        name="export_job",
+    ),
+    path(
+        "stats/exports/download/<int:job>/",
+        stats.ExportJobDownloadView.as_view(),
+        name="export_job_download",
+    ),
     path(
         "stats/scores/bad_responses/",
         stats.BadResponsesView.as_view(),
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CrowdsourcerConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "crowdsourcer"
+
+    def ready(self):
+        import crowdsourcer.signals  # noqa: F401
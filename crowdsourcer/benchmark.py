@@ -0,0 +1,512 @@
+import json
+import random
+from datetime import date
+from statistics import mean
+from time import perf_counter
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+
+from crowdsourcer.management.commands.create_test_data import Command as TestDataCommand
+from crowdsourcer.marking import (
+    get_assignment_progress,
+    get_assignment_progress_bulk,
+    rebuild_progress_counters,
+)
+from crowdsourcer.models import (
+    Assigned,
+    Marker,
+    MarkingSession,
+    Option,
+    ProgressCounter,
+    PublicAuthority,
+    Question,
+    QuestionGroup,
+    Response,
+    ResponseType,
+    Section,
+    SessionConfig,
+)
+from crowdsourcer.scoring import (
+    SCORING_ENGINES,
+    clear_exception_cache,
+    get_all_question_data,
+    get_duplicate_responses,
+    get_exact_duplicates,
+    get_grouped_scores_queryset,
+    get_scoring_object,
+    get_section_scores_queryset,
+    rebuild_materialised_scores,
+)
+
+# council type, question group and country for synthetic councils
+COUNCIL_TYPES = [
+    ("UTA", "Single Tier", "england"),
+    ("NMD", "District", "england"),
+    ("CTY", "County", "england"),
+    ("LGD", "Northern Ireland", "northern ireland"),
+]
+
+QUESTION_TYPES = ["select_one", "select_one", "tiered", "yes_no", "multiple_choice"]
+WEIGHTINGS = ["low", "medium", "high"]
+
+
+class BenchmarkSession:
+    """
+    Creates a marking session full of synthetic data for benchmarking.
+
+    Everything is created with bulk_create so that large sessions can be
+    generated quickly. The random seed is fixed so the same parameters
+    always produce the same data.
+    """
+
+    def __init__(
+        self,
+        label="Benchmark",
+        councils=400,
+        sections=9,
+        questions=30,
+        options=4,
+        response_rate=0.9,
+        duplicate_rate=0.01,
+        exceptions=20,
+        volunteers=20,
+        seed=1,
+    ):
+        self.label = label
+        self.councils = councils
+        self.sections = sections
+        self.questions = questions
+        self.options = options
+        self.response_rate = response_rate
+        self.duplicate_rate = duplicate_rate
+        self.exceptions = exceptions
+        self.volunteers = volunteers
+        self.random = random.Random(seed)
+
+    @property
+    def parameters(self):
+        return {
+            "councils": self.councils,
+            "sections": self.sections,
+            "questions": self.questions,
+            "options": self.options,
+            "response_rate": self.response_rate,
+            "duplicate_rate": self.duplicate_rate,
+            "exceptions": self.exceptions,
+            "volunteers": self.volunteers,
+        }
+
+    def create(self):
+        for group in TestDataCommand.groups:
+            QuestionGroup.objects.get_or_create(description=group)
+
+        for r_type in TestDataCommand.response_types:
+            ResponseType.objects.get_or_create(
+                type=r_type, defaults={"priority": 1, "active": True}
+            )
+        self.stages = {rt.type: rt for rt in ResponseType.objects.all()}
+
+        self.session = MarkingSession.objects.create(
+            label=self.label,
+            active=True,
+            stage=self.stages["First Mark"],
+            start_date=date.today(),
+        )
+        self.groups = {}
+        for group in QuestionGroup.objects.filter(
+            description__in=TestDataCommand.groups
+        ):
+            group.marking_session.add(self.session)
+            self.groups[group.description] = group
+
+        self.create_questions()
+        self.create_councils()
+        self.create_responses()
+        self.create_config()
+        self.create_assignments()
+        # bulk_create does not send the signals that keep these up to date
+        rebuild_progress_counters(self.session)
+        self.analyze()
+
+        return self.session
+
+    def analyze(self):
+        """
+        Update the planner statistics, otherwise Postgres plans queries
+        as if the tables were still empty.
+        """
+        if connection.vendor != "postgresql":
+            return
+
+        models = [
+            Assigned,
+            Option,
+            ProgressCounter,
+            PublicAuthority,
+            Question,
+            Question.questiongroup.through,
+            Response,
+            Response.multi_option.through,
+            Section,
+        ]
+        with connection.cursor() as cursor:
+            for model in models:
+                cursor.execute(f"ANALYZE {model._meta.db_table}")
+
+    def create_questions(self):
+        sections = Section.objects.bulk_create(
+            [
+                Section(title=f"Section {i}", marking_session=self.session)
+                for i in range(1, self.sections + 1)
+            ]
+        )
+
+        questions = []
+        for section in sections:
+            for number in range(1, self.questions + 1):
+                questions.append(
+                    Question(
+                        section=section,
+                        number=number,
+                        description=f"{section.title} question {number}",
+                        question_type=self.random.choice(QUESTION_TYPES),
+                        weighting=self.random.choice(WEIGHTINGS),
+                    )
+                )
+        self.question_list = Question.objects.bulk_create(questions)
+
+        through = Question.questiongroup.through
+        through.objects.bulk_create(
+            [
+                through(question_id=q.id, questiongroup_id=group.id)
+                for q in self.question_list
+                for group in self.groups.values()
+            ]
+        )
+
+        options = []
+        for q in self.question_list:
+            count = 2 if q.question_type == "yes_no" else self.options
+            for i in range(count):
+                options.append(
+                    Option(
+                        question=q,
+                        description=f"Option {i}",
+                        score=i,
+                        ordering=i,
+                    )
+                )
+        self.question_options = {}
+        for option in Option.objects.bulk_create(options):
+            self.question_options.setdefault(option.question_id, []).append(option)
+
+    def create_councils(self):
+        councils = []
+        for i in range(1, self.councils + 1):
+            council_type, group, country = COUNCIL_TYPES[i % len(COUNCIL_TYPES)]
+            councils.append(
+                PublicAuthority(
+                    name=f"{self.label} Council {i}",
+                    unique_id=f"{self.label}-{i}",
+                    questiongroup=self.groups[group],
+                    type=council_type,
+                    country=country,
+                )
+            )
+        self.council_list = PublicAuthority.objects.bulk_create(councils)
+
+        through = PublicAuthority.marking_session.through
+        through.objects.bulk_create(
+            [
+                through(publicauthority_id=c.id, markingsession_id=self.session.id)
+                for c in self.council_list
+            ]
+        )
+
+    def create_responses(self):
+        self.user, _ = User.objects.get_or_create(username="benchmark@example.com")
+
+        responses = []
+        multi = []
+        for stage in ["First Mark", "Audit"]:
+            for council in self.council_list:
+                for q in self.question_list:
+                    if self.random.random() > self.response_rate:
+                        continue
+
+                    copies = 1
+                    if stage == "Audit" and self.random.random() < self.duplicate_rate:
+                        copies = 2
+
+                    options = self.question_options[q.id]
+                    for _ in range(copies):
+                        r = Response(
+                            authority=council,
+                            question=q,
+                            user=self.user,
+                            response_type=self.stages[stage],
+                            public_notes="https://example.org/",
+                            page_number="1",
+                            evidence="evidence",
+                            private_notes="notes",
+                        )
+                        if q.question_type == "multiple_choice":
+                            multi.append(
+                                (r, self.random.sample(options, len(options) // 2))
+                            )
+                        else:
+                            r.option = self.random.choice(options)
+                        responses.append(r)
+
+        Response.objects.bulk_create(responses, batch_size=5000)
+
+        through = Response.multi_option.through
+        through.objects.bulk_create(
+            [
+                through(response_id=r.id, option_id=o.id)
+                for r, options in multi
+                for o in options
+            ],
+            batch_size=5000,
+        )
+        Response.update_is_answered(
+            Response.objects.filter(question__section__marking_session=self.session)
+        )
+
+    def create_config(self):
+        exceptions = {}
+        answer_exceptions = {}
+        weightings = {}
+        sections = list(
+            Section.objects.filter(marking_session=self.session).values_list(
+                "title", flat=True
+            )
+        )
+        for section in sections:
+            weightings[section] = {group: 0.1 for group in self.groups.keys()}
+
+        for _ in range(self.exceptions):
+            section = self.random.choice(sections)
+            council = self.random.choice(self.council_list)
+            q = str(self.random.randint(1, self.questions))
+            exceptions.setdefault(section, {}).setdefault(council.name, []).append(q)
+
+            section = self.random.choice(sections)
+            answer_exceptions.setdefault(section, []).append(
+                {
+                    "question_number": str(self.random.randint(1, self.questions)),
+                    "question_part": None,
+                    "answer": "Option 0",
+                    "ignore": [str(self.random.randint(1, self.questions))],
+                }
+            )
+        exceptions["answer_exceptions"] = answer_exceptions
+
+        for name, value in [
+            ("exceptions", exceptions),
+            ("score_exceptions", {}),
+            ("score_weightings", weightings),
+        ]:
+            SessionConfig.objects.create(
+                marking_session=self.session,
+                name=name,
+                config_type="json",
+                json_value=value,
+            )
+
+    def create_assignments(self):
+        if not self.volunteers:
+            return
+
+        sections = list(Section.objects.filter(marking_session=self.session))
+        assignments = []
+        for stage in ["First Mark", "Audit"]:
+            slug = stage.lower().replace(" ", "-")
+            users = User.objects.bulk_create(
+                [
+                    User(username=f"{self.label}-{slug}-{i}@example.com")
+                    for i in range(self.volunteers)
+                ]
+            )
+            Marker.objects.bulk_create(
+                [Marker(user=user, response_type=self.stages[stage]) for user in users]
+            )
+
+            for i, council in enumerate(self.council_list):
+                user = users[i % len(users)]
+                for section in sections:
+                    assignments.append(
+                        Assigned(
+                            user=user,
+                            section=section,
+                            authority=council,
+                            response_type=self.stages[stage],
+                            marking_session=self.session,
+                        )
+                    )
+        Assigned.objects.bulk_create(assignments, batch_size=5000)
+
+
+class QueryCounter:
+    """
+    Counts queries using an execute wrapper, which unlike
+    CaptureQueriesContext has no limit on the number it can count.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def measure(fn, repeat=1):
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        clear_exception_cache()
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            start = perf_counter()
+            fn()
+            timings.append(perf_counter() - start)
+        queries = counter.count
+
+    return {
+        "seconds": min(timings),
+        "mean_seconds": mean(timings),
+        "queries": queries,
+    }
+
+
+def is_included(name, only=None):
+    return only is None or any(name.startswith(o) for o in only)
+
+
+def get_benchmarks(session, engines, only=None):
+    """
+    Return a list of (name, function) pairs to benchmark. Anything
+    excluded by only is skipped rather than built so the setup work for
+    it is not done either.
+    """
+    benchmarks = []
+    for engine in engines:
+        name = f"get_scoring_object[{engine}]"
+        if is_included(name, only):
+            benchmarks.append(
+                (
+                    name,
+                    lambda engine=engine: get_scoring_object(session, engine=engine),
+                )
+            )
+
+    if is_included("get_all_question_data", only):
+        scoring = get_scoring_object(session, engine=engines[0])
+        benchmarks.append(
+            (
+                "get_all_question_data",
+                lambda: get_all_question_data(scoring, marking_session=session.label),
+            )
+        )
+
+    if is_included("get_exact_duplicates", only):
+        benchmarks.append(
+            (
+                "get_exact_duplicates",
+                lambda: get_exact_duplicates(get_duplicate_responses(session), session),
+            )
+        )
+
+    for stage in ["First Mark", "Audit"]:
+        assignments = Assigned.objects.filter(
+            marking_session=session,
+            section__isnull=False,
+            active=True,
+            response_type__type=stage,
+            user__is_active=True,
+        )
+        for fn in [get_assignment_progress, get_assignment_progress_bulk]:
+            name = f"{fn.__name__}[{stage}]"
+            if is_included(name, only):
+                benchmarks.append(
+                    (
+                        name,
+                        lambda assignments=assignments, stage=stage, fn=fn: fn(
+                            assignments, session.label, stage
+                        ),
+                    )
+                )
+
+    return benchmarks
+
+
+def explain(queryset):
+    """
+    EXPLAIN a queryset. On Postgres the query is also run so the planner's
+    estimated cost can be compared with the actual execution time.
+    """
+    if connection.vendor != "postgresql":
+        return {"plan": queryset.explain()}
+
+    plan = json.loads(queryset.explain(format="json", analyze=True))[0]
+    return {
+        "total_cost": plan["Plan"]["Total Cost"],
+        "execution_time_ms": plan["Execution Time"],
+        "plan": plan["Plan"],
+    }
+
+
+def explain_scoring_queries(session):
+    """
+    Compare the plans for the per section score queries used by the
+    default engine with the single grouped query.
+    """
+    sections = []
+    for section in Section.objects.filter(marking_session=session):
+        sections.append(
+            {"section": section.title, **explain(get_section_scores_queryset(section))}
+        )
+
+    results = [
+        {"name": "get_section_scores_queryset", "queries": sections},
+        {
+            "name": "get_grouped_scores_queryset",
+            "queries": [explain(get_grouped_scores_queryset(session))],
+        },
+    ]
+
+    for result in results:
+        for key in ["total_cost", "execution_time_ms"]:
+            if all(key in q for q in result["queries"]):
+                result[key] = sum(q[key] for q in result["queries"])
+
+    return results
+
+
+def run_benchmarks(session, engines=None, repeat=1, only=None):
+    """
+    Time and count the queries for each of the scoring and progress entry
+    points against a session and return a list of results.
+
+    The materialised scores have to be built for that engine to be
+    measured, so the run happens inside a transaction that is always
+    rolled back to leave an existing session's scores untouched.
+    """
+    if engines is None:
+        engines = list(SCORING_ENGINES.keys())
+
+    results = []
+    with transaction.atomic():
+        if "materialised" in engines and is_included(
+            "get_scoring_object[materialised]", only
+        ):
+            rebuild_materialised_scores(session)
+
+        for name, fn in get_benchmarks(session, engines, only=only):
+            results.append({"name": name, **measure(fn, repeat=repeat)})
+
+        transaction.set_rollback(True)
+
+    return results
@@ -0,0 +1,557 @@
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+
+import pandas as pd
+
+from crowdsourcer.models import PublicAuthority, Question, Response, SessionConfig
+from crowdsourcer.scoring import (
+    get_duplicate_responses,
+    get_exact_duplicates,
+    get_scoring_object,
+    iter_all_question_data,
+)
+
+logger = logging.getLogger(__name__)
+
+WEIGHTED_TOTALS_SECTIONS = [
+    "Buildings & Heating",
+    "Transport",
+    "Planning & Land Use",
+    "Governance & Finance",
+    "Biodiversity",
+    "Collaboration & Engagement",
+    "Waste Reduction & Food",
+    "Transport (CA)",
+    "Buildings & Heating & Green Skills (CA)",
+    "Governance & Finance (CA)",
+    "Planning & Biodiversity (CA)",
+    "Collaboration & Engagement (CA)",
+]
+
+
+def get_weighted_totals_rows(scoring):
+    yield ["council"] + WEIGHTED_TOTALS_SECTIONS + ["total"]
+
+    for council, council_score in scoring["section_totals"].items():
+        row = [council]
+        for section in WEIGHTED_TOTALS_SECTIONS:
+            if council_score.get(section, None) is not None:
+                row.append(council_score[section]["weighted"])
+            else:
+                row.append(0)
+
+        row.append(scoring["council_totals"][council]["weighted_total"])
+
+        yield row
+
+
+def get_section_scores_rows(scoring):
+    yield [
+        "council",
+        "country",
+        "type",
+        "political_control",
+        "section",
+        "raw score",
+        "raw max",
+        "raw weighted",
+        "weighted max",
+        "weighted score",
+        "section weighted score",
+    ]
+
+    for council, council_score in scoring["section_totals"].items():
+        country = scoring["council_countries"][council]
+        council_type = scoring["council_type"][council]
+        control = scoring["council_control"][council]
+        for section, scores in council_score.items():
+            yield [
+                council,
+                country,
+                council_type,
+                control,
+                section,
+                scores["raw"],
+                scoring["council_maxes"][council]["raw"][section][
+                    scoring["council_groups"][council]
+                ],
+                scores["raw_weighted"],
+                scoring["council_maxes"][council]["weighted"][section][
+                    scoring["council_groups"][council]
+                ],
+                scores["unweighted_percentage"],
+                scores["weighted"],
+            ]
+
+        total = scoring["council_totals"][council]["weighted_total"]
+        yield [
+            council,
+            country,
+            council_type,
+            control,
+            "Total",
+            "-",
+            "-",
+            "-",
+            "-",
+            "-",
+            f"{total:.2f}",
+        ]
+
+
+def get_duplicate_response_sets(session, response_type="Audit", duplicates=None):
+    """
+    Returns a list of the responses for each question and authority with
+    more than one response, loaded in a single query.
+    """
+    if duplicates is None:
+        duplicates = get_duplicate_responses(session, response_type=response_type)
+
+    pairs = [(d["question_id"], d["authority_id"]) for d in duplicates]
+    if not pairs:
+        return []
+
+    responses = (
+        Response.objects.filter(
+            response_type__type=response_type,
+            question_id__in={q for q, _ in pairs},
+            authority_id__in={a for _, a in pairs},
+        )
+        .select_related("authority", "question", "question__section", "option")
+        .order_by("id")
+    )
+
+    by_pair = defaultdict(list)
+    for r in responses:
+        r.dupe_id = f"{r.question_id}:{r.authority_id}"
+        by_pair[(r.question_id, r.authority_id)].append(r)
+
+    return [by_pair[pair] for pair in pairs if by_pair[pair]]
+
+
+def get_exact_duplicate_ids(duplicates, session, response_type="Audit"):
+    return [
+        f"{exact[0].question_id}:{exact[0].authority_id}"
+        for exact in get_exact_duplicates(
+            duplicates, session, response_type=response_type
+        )
+    ]
+
+
+def get_duplicate_responses_rows(session, response_type="Audit"):
+    yield [
+        "authority",
+        "section",
+        "question",
+        "response id",
+        "last update",
+        "answer",
+        "public notes",
+        "private notes",
+        "evidence",
+        "page number",
+        "exact duplicate",
+    ]
+
+    duplicates = get_duplicate_responses(session, response_type=response_type)
+    exact_ids = set(
+        get_exact_duplicate_ids(duplicates, session, response_type=response_type)
+    )
+    for dupe in get_duplicate_response_sets(session, response_type, duplicates):
+        for r in dupe:
+            yield [
+                r.authority.name,
+                r.question.section.title,
+                r.question.number_and_part,
+                r.id,
+                r.last_update,
+                r.option,
+                r.public_notes,
+                r.private_notes,
+                r.evidence,
+                r.page_number,
+                "Y" if r.dupe_id in exact_ids else "N",
+            ]
+
+
+class ChangedAutomaticPoints:
+    """
+    Finds the audit responses in a session which do not match the answer
+    in the automatic points file.
+    """
+
+    cols = {
+        "answer": "answer in GRACE",
+        "section": "section",
+        "authority_type": "council type",
+        "authority_country": "council country",
+        "authority_list": "council list",
+        "page_number": "page no",
+        "public_notes": "evidence link",
+        "evidence": "evidence notes",
+    }
+
+    def __init__(self, session):
+        self.session = session
+        self.conf = self.get_config()
+
+    def scrub_council_type(self, types):
+        type_map = {
+            "COMB": "COMB",
+            "CTY": "CTY",
+            "LGD": "LGD",
+            "MD": "MTD",
+            "MTD": "MTD",
+            "UTA": "UTA",
+            "COI": "COI",
+            "NMD": "NMD",
+            "DIS": "DIS",
+            "CC": "LBO",
+            "LBO": "LBO",
+            "SCO": "UTA",
+            "WPA": "UTA",
+            "NID": "UTA",
+            "UA": "UTA",
+            "SRA": "COMB",
+        }
+        scrubbed = []
+        for t in types:
+            t = t.strip()
+            if type_map.get(t) is not None:
+                scrubbed.append(type_map[t])
+            else:
+                logger.warning(f"bad council type {t}")
+        return scrubbed
+
+    def get_config(self):
+        try:
+            c = SessionConfig.objects.get(
+                marking_session=self.session, name="automatic_points"
+            )
+            conf = c.value
+        except SessionConfig.DoesNotExist:
+            conf = {
+                "data_subdir": None,
+                "points_file": "automatic_points.csv",
+                "option_map_file": None,
+            }
+
+        return conf
+
+    def get_df(self, file_name, data_subdir=None):
+        data_dir = settings.BASE_DIR / "data"
+        if data_subdir:
+            data_dir = data_dir / data_subdir
+
+        file = data_dir / file_name
+        try:
+            df = pd.read_csv(file)
+        except FileNotFoundError:
+            return None
+
+        return df
+
+    def get_points_file(self):
+        df = self.get_df(self.conf["points_file"], self.conf.get("data_subdir"))
+
+        if df is not None:
+            df[self.cols["answer"]] = df[self.cols["answer"]].astype(str)
+
+        return df
+
+    def get_option_map(self):
+        df = self.get_df(self.conf["option_map_file"], self.conf.get("data_subdir"))
+
+        df.question = df.question.astype(str)
+
+        option_map = defaultdict(dict)
+        for _, option in df.iterrows():
+            if option_map[option["section"]].get(option["question"]) is None:
+                option_map[option["section"]][option["question"]] = {}
+
+            option_map[option["section"]][option["question"]][option["prev_option"]] = (
+                option["new_option"]
+            )
+
+        return option_map
+
+    def get_mapped_answer(self, answer, q, answer_map):
+        if (
+            answer_map.get(q.section.title) is not None
+            and answer_map[q.section.title].get(q.number_and_part) is not None
+            and answer_map[q.section.title][q.number_and_part].get(answer) is not None
+        ):
+            return answer_map[q.section.title][q.number_and_part][answer]
+
+        return answer
+
+    def get_bad_responses(self):
+        """
+        Returns the responses that differ from the points file by section
+        and question, or None if there is no points file.
+        """
+        bad_responses = defaultdict(dict)
+
+        points = self.get_points_file()
+        if points is None:
+            return None
+
+        answer_map = self.get_option_map()
+
+        for _, point in points.iterrows():
+            copy_last_year = False
+            if point[self.cols["section"]] == "Practice":
+                continue
+
+            if pd.isna(point["question number"]):
+                continue
+
+            if point[self.cols["section"]] == "":
+                continue
+
+            c_args = {}
+            if (
+                point.get(self.cols["authority_type"]) is not None
+                and pd.isna(point[self.cols["authority_type"]]) is False
+            ):
+                types = point[self.cols["authority_type"]].strip()
+                if types != "":
+                    types = self.scrub_council_type(types.split(","))
+                    c_args["type__in"] = types
+
+            if (
+                point.get(self.cols["authority_country"], None) is not None
+                and pd.isna(point[self.cols["authority_country"]]) is False
+            ):
+                countries = point[self.cols["authority_country"]].strip()
+                if countries != "":
+                    countries = countries.split(",")
+                    c_args["country__in"] = [c.lower() for c in countries]
+
+            if (
+                point.get(self.cols["authority_list"]) is not None
+                and pd.isna(point[self.cols["authority_list"]]) is False
+            ):
+                councils = point[self.cols["authority_list"]].strip()
+                if councils != "" and "Single-Tier" not in councils.split(","):
+                    councils = [c.strip() for c in councils.split(",")]
+                    c_args = {"name__in": councils}
+
+            councils = PublicAuthority.objects.filter(
+                marking_session=self.session, **c_args
+            )
+            q_args = {"number": point["question number"]}
+            if (
+                not pd.isna(point["question part"])
+                and point.get("question part", None) is not None
+            ):
+                q_args["number_part"] = point["question part"].strip()
+
+            try:
+                question = Question.objects.get(
+                    section__marking_session=self.session,
+                    section__title=point[self.cols["section"]],
+                    **q_args,
+                )
+            except Question.DoesNotExist:
+                continue
+
+            if not pd.isna(point["copy last year answer"]):
+                if point["copy last year answer"] == "Y":
+                    copy_last_year = True
+
+            responses = Response.objects.filter(
+                authority__in=councils,
+                question=question,
+                response_type__type="Audit",
+            )
+            bad_q_responses = []
+            for r in responses.all():
+                if copy_last_year:
+                    try:
+                        prev_response = Response.objects.get(
+                            authority=r.authority,
+                            question=question.previous_question,
+                            response_type__type="Audit",
+                        )
+                    except Response.DoesNotExist:
+                        continue
+
+                    if prev_response.option:
+                        past_answer = self.get_mapped_answer(
+                            prev_response.option.description, question, answer_map
+                        )
+                    else:
+                        continue
+                    page_number = prev_response.page_number
+                    if not pd.isna(point[self.cols["page_number"]]):
+                        page_number = point[self.cols["page_number"]]
+
+                    public_notes = prev_response.public_notes
+                    if not pd.isna(point[self.cols["public_notes"]]):
+                        public_notes = point[self.cols["public_notes"]]
+
+                    evidence = prev_response.evidence
+                    if not pd.isna(point[self.cols["evidence"]]):
+                        evidence = point[self.cols["evidence"]]
+
+                    if (
+                        r.option.description != past_answer
+                        or r.page_number != page_number
+                        or r.public_notes != public_notes
+                        or r.evidence != evidence
+                    ):
+                        bad_response = {
+                            "saved": r,
+                            "expected": {
+                                "option": past_answer,
+                                "page_number": page_number,
+                                "public_notes": public_notes,
+                                "evidence": evidence,
+                            },
+                        }
+                        bad_q_responses.append(bad_response)
+                else:
+                    answer = self.get_mapped_answer(
+                        point[self.cols["answer"]], question, answer_map
+                    )
+
+                    if (
+                        r.option.description != answer
+                        or r.page_number != point["page no"]
+                        or r.public_notes != point["evidence link"]
+                        or r.evidence != point["evidence notes"]
+                    ):
+                        bad_response = {
+                            "saved": r,
+                            "expected": {
+                                "option": answer,
+                                "page_number": point[self.cols["page_number"]],
+                                "public_notes": point[self.cols["public_notes"]],
+                                "evidence": point[self.cols["evidence"]],
+                            },
+                        }
+                        bad_q_responses.append(bad_response)
+
+            bad_responses[point[self.cols["section"]]][
+                question.number_and_part
+            ] = bad_q_responses
+
+        return dict(bad_responses)
+
+
+def get_changed_automatic_points_rows(session):
+    bad_responses = ChangedAutomaticPoints(session).get_bad_responses()
+    if bad_responses is None:
+        raise FileNotFoundError("Could not find points file")
+
+    yield [
+        "section",
+        "question",
+        "authority",
+        "answer",
+        "page number",
+        "evidence",
+        "public notes",
+        "expected answer",
+        "expected page number",
+        "expected evidence",
+        "expected public notes",
+    ]
+
+    for section, questions in bad_responses.items():
+        for question, responses in questions.items():
+            for response in responses:
+                saved = response["saved"]
+                # blank cells in the points file are read in as NaN
+                expected = {
+                    k: None if pd.isna(v) else v
+                    for k, v in response["expected"].items()
+                }
+                yield [
+                    section,
+                    question,
+                    saved.authority.name,
+                    saved.option.description,
+                    saved.page_number,
+                    saved.evidence,
+                    saved.public_notes,
+                    expected["option"],
+                    expected["page_number"],
+                    expected["evidence"],
+                    expected["public_notes"],
+                ]
+
+
+def all_answer_data(response_type):
+    def rows(session):
+        return iter_all_question_data(
+            get_scoring_object(session),
+            marking_session=session.label,
+            response_type=response_type,
+        )
+
+    return rows
+
+
+def weighted_totals(session):
+    return get_weighted_totals_rows(get_scoring_object(session))
+
+
+def section_scores(session):
+    return get_section_scores_rows(get_scoring_object(session))
+
+
+def duplicate_responses(response_type):
+    def rows(session):
+        return get_duplicate_responses_rows(session, response_type=response_type)
+
+    return rows
+
+
+# exports that can be run as background jobs, each rows function takes a
+# marking session and returns an iterable of CSV rows
+EXPORTS = {
+    "all_answer_data_first_mark": {
+        "title": "All First Mark answer data",
+        "file_name": "all_answer_data_first-mark.csv",
+        "rows": all_answer_data("First Mark"),
+    },
+    "all_answer_data_audit": {
+        "title": "All Audit answer data",
+        "file_name": "all_answer_data.csv",
+        "rows": all_answer_data("Audit"),
+    },
+    "weighted_totals": {
+        "title": "Weighted section totals",
+        "file_name": "all_sections_scores.csv",
+        "rows": weighted_totals,
+    },
+    "raw_and_weighted_totals": {
+        "title": "Raw and weighted scores and totals",
+        "file_name": "raw_and_weighted_sections_scores.csv",
+        "rows": section_scores,
+    },
+    "duplicate_responses_first_mark": {
+        "title": "First Mark responses with duplicate answers",
+        "file_name": "duplicate_responses_first-mark.csv",
+        "rows": duplicate_responses("First Mark"),
+    },
+    "duplicate_responses_right_of_reply": {
+        "title": "Right of Reply responses with duplicate answers",
+        "file_name": "duplicate_responses_right-of-reply.csv",
+        "rows": duplicate_responses("Right of Reply"),
+    },
+    "duplicate_responses_audit": {
+        "title": "Audit responses with duplicate answers",
+        "file_name": "duplicate_responses_audit.csv",
+        "rows": duplicate_responses("Audit"),
+    },
+    "changed_automatic_points": {
+        "title": "Responses with differing auto points",
+        "file_name": "changed_automatic_points.csv",
+        "rows": get_changed_automatic_points_rows,
+    },
+}
@@ -1,3 +1,5 @@
+from collections import defaultdict
+
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
@@ -22,6 +24,7 @@ from django.forms import (
     inlineformset_factory,
     modelformset_factory,
 )
+from django.forms.models import ModelChoiceIterator
 
 import pandas as pd
 
@@ -40,16 +43,71 @@ from crowdsourcer.volunteers import check_bulk_assignments
 
 
 class ResponseFormSet(BaseFormSet):
+    """
+    Fetches the existing responses, and the options for each question if
+    the form has option fields, for all the forms at once rather than in
+    each form.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        initial = self.initial or []
+        response_ids = [i["id"] for i in initial if i.get("id", None) is not None]
+        self.instances = Response.objects.prefetch_related("multi_option").in_bulk(
+            response_ids
+        )
+
+        if "option" in self.form.base_fields:
+            options = defaultdict(list)
+            question_ids = [i["question"].id for i in initial]
+            for option in Option.objects.filter(question_id__in=question_ids):
+                options[option.question_id].append(option)
+
+            for i in initial:
+                i["options"] = options[i["question"].id]
+
     def _construct_form(self, i, **kwargs):
         if self.initial[i].get("id", None) is not None:
-            response = Response.objects.get(id=self.initial[i]["id"])
-            kwargs["instance"] = response
+            kwargs["instance"] = self.instances.get(self.initial[i]["id"])
 
         form = super()._construct_form(i, **kwargs)
         return form
 
 
-class ResponseForm(ModelForm):
+class PrefetchedOptionIterator(ModelChoiceIterator):
+    """
+    Uses the list of options fetched by the formset rather than querying
+    for them each time the field is rendered.
+    """
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for option in self.field.options:
+            yield self.choice(option)
+
+    def __len__(self):
+        return len(self.field.options) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.field.options)
+
+
+class OptionFieldsMixin:
+    def set_option_fields(self):
+        options = self.initial.get("options", None)
+        for name in ["option", "multi_option"]:
+            field = self.fields[name]
+            # still used to validate the answer
+            field.queryset = Option.objects.filter(question=self.question_obj)
+            if options is not None:
+                field.options = options
+                field.iterator = PrefetchedOptionIterator
+                field.widget.choices = field.choices
+
+
+class ResponseForm(OptionFieldsMixin, ModelForm):
     mandatory_if_no = ["private_notes"]
     mandatory_if_response = ["public_notes", "page_number", "evidence", "private_notes"]
 
@@ -77,20 +135,10 @@ class ResponseForm(ModelForm):
         self.previous_response = self.initial.get("previous_response", None)
         self.session = self.question_obj.section.marking_session
 
-        self.fields["option"].queryset = Option.objects.filter(
-            question=self.question_obj
-        )
-
-        self.fields["multi_option"].queryset = Option.objects.filter(
-            question=self.question_obj
-        )
+        self.set_option_fields()
 
-        form_labels = settings.FORM_LABELS.get(
-            self.question_obj.section.marking_session.label, {}
-        )
-        form_hints = settings.FORM_HINTS.get(
-            self.question_obj.section.marking_session.label, {}
-        )
+        form_labels = settings.FORM_LABELS.get(self.session.label, {})
+        form_hints = settings.FORM_HINTS.get(self.session.label, {})
 
         for field in self.fields.keys():
             if form_labels.get(field):
@@ -284,7 +332,7 @@ RORResponseFormset = formset_factory(
 )
 
 
-class AuditResponseForm(ModelForm):
+class AuditResponseForm(OptionFieldsMixin, ModelForm):
     mandatory_if_no = ["private_notes"]
     mandatory_if_response = ["public_notes", "page_number", "evidence", "private_notes"]
     mandatory_if_national = []
@@ -294,13 +342,7 @@ class AuditResponseForm(ModelForm):
 
         self.authority_obj = self.initial.get("authority", None)
         self.question_obj = self.initial.get("question", None)
-        self.fields["option"].queryset = Option.objects.filter(
-            question=self.question_obj
-        )
-
-        self.fields["multi_option"].queryset = Option.objects.filter(
-            question=self.question_obj
-        )
+        self.set_option_fields()
         self.orig = self.initial.get("original_response", None)
         self.ror = self.initial.get("ror_response", None)
 
@@ -0,0 +1,145 @@
+import csv
+import logging
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from crowdsourcer.exports import EXPORTS
+from crowdsourcer.models import ExportJob
+
+logger = logging.getLogger(__name__)
+
+# how often to save the number of rows written while an export runs
+PROGRESS_EVERY = 1000
+
+
+def expire_stale_jobs():
+    """
+    Mark running jobs that have taken longer than EXPORT_JOB_TIMEOUT as
+    failed, on the assumption the worker running them has died, so they
+    no longer block new jobs for the same export.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.EXPORT_JOB_TIMEOUT)
+    return ExportJob.objects.filter(status="running", started__lt=cutoff).update(
+        status="failed", error="Timed out", finished=timezone.now()
+    )
+
+
+def enqueue_export(marking_session, export, user=None):
+    """
+    Returns the waiting or running job for the export in the session,
+    creating one if there isn't one, so concurrent requests for the same
+    export share a single job.
+    """
+    if export not in EXPORTS:
+        raise ValueError(f"No such export: {export}")
+
+    expire_stale_jobs()
+
+    jobs = ExportJob.objects.filter(
+        marking_session=marking_session,
+        export=export,
+        status__in=ExportJob.ACTIVE_STATUSES,
+    )
+    job = jobs.first()
+    if job is not None:
+        return job
+
+    try:
+        with transaction.atomic():
+            return ExportJob.objects.create(
+                marking_session=marking_session, export=export, requested_by=user
+            )
+    except IntegrityError:
+        # someone else created one in the meantime
+        return jobs.get()
+
+
+def claim_next_job():
+    """
+    Marks the oldest waiting job as running and returns it. Locked rows are
+    skipped so more than one worker can run at once.
+    """
+    with transaction.atomic():
+        job = (
+            ExportJob.objects.select_for_update(skip_locked=True)
+            .filter(status="pending")
+            .order_by("created")
+            .first()
+        )
+        if job is None:
+            return None
+
+        job.status = "running"
+        job.started = timezone.now()
+        job.save(update_fields=["status", "started"])
+
+    return job
+
+
+def get_export_path(job):
+    file_name = EXPORTS[job.export]["file_name"]
+    return settings.EXPORT_DIR / str(job.marking_session_id) / f"{job.id}_{file_name}"
+
+
+def remove_old_exports(job):
+    """
+    Delete earlier completed runs of the export and their files now there is
+    a newer one.
+    """
+    old_jobs = ExportJob.objects.filter(
+        marking_session=job.marking_session_id,
+        export=job.export,
+        status="complete",
+        finished__lt=job.finished,
+    )
+    for old_job in old_jobs:
+        if old_job.file_path and os.path.exists(old_job.file_path):
+            os.remove(old_job.file_path)
+    old_jobs.delete()
+
+
+def run_job(job):
+    """
+    Writes the export to a file, recording progress on the job as it goes.
+    The file is written under a temporary name and moved into place once
+    complete so a partial file is never served.
+    """
+    path = get_export_path(job)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+
+    try:
+        rows_written = 0
+        with open(tmp_path, "w", newline="") as fp:
+            writer = csv.writer(fp)
+            for row in EXPORTS[job.export]["rows"](job.marking_session):
+                writer.writerow(row)
+                rows_written += 1
+                if rows_written % PROGRESS_EVERY == 0:
+                    ExportJob.objects.filter(pk=job.pk).update(
+                        rows_written=rows_written
+                    )
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.exception(f"export job {job.id} failed")
+        if tmp_path.exists():
+            tmp_path.unlink()
+        job.status = "failed"
+        job.error = str(e)
+        job.finished = timezone.now()
+        job.save(update_fields=["status", "error", "finished"])
+        return job
+
+    job.status = "complete"
+    job.rows_written = rows_written
+    job.file_path = str(path)
+    job.finished = timezone.now()
+    job.save(update_fields=["status", "rows_written", "file_path", "finished"])
+
+    remove_old_exports(job)
+
+    return job
@@ -0,0 +1,164 @@
+import json
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from crowdsourcer.benchmark import (
+    BenchmarkSession,
+    explain_scoring_queries,
+    run_benchmarks,
+)
+from crowdsourcer.models import MarkingSession
+from crowdsourcer.scoring import SCORING_ENGINES, scoring_quiet
+
+
+class Command(BaseCommand):
+    help = "time and count queries for scoring and progress against a synthetic session"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--session",
+            action="store",
+            help="Benchmark an existing session rather than generating one",
+        )
+        parser.add_argument(
+            "--label",
+            action="store",
+            default="Benchmark",
+            help="Label for the generated session",
+        )
+        parser.add_argument("--councils", action="store", type=int, default=400)
+        parser.add_argument("--sections", action="store", type=int, default=9)
+        parser.add_argument(
+            "--questions",
+            action="store",
+            type=int,
+            default=30,
+            help="Number of questions in each section",
+        )
+        parser.add_argument(
+            "--options",
+            action="store",
+            type=int,
+            default=4,
+            help="Number of options for each question",
+        )
+        parser.add_argument(
+            "--response-rate",
+            action="store",
+            type=float,
+            default=0.9,
+            help="Fraction of questions answered for each council",
+        )
+        parser.add_argument(
+            "--duplicate-rate",
+            action="store",
+            type=float,
+            default=0.01,
+            help="Fraction of Audit responses that are duplicated",
+        )
+        parser.add_argument(
+            "--exceptions",
+            action="store",
+            type=int,
+            default=20,
+            help="Number of council and answer based exception rules",
+        )
+        parser.add_argument("--volunteers", action="store", type=int, default=20)
+        parser.add_argument("--seed", action="store", type=int, default=1)
+        parser.add_argument(
+            "--repeat",
+            action="store",
+            type=int,
+            default=1,
+            help="Number of times to run each benchmark",
+        )
+        parser.add_argument(
+            "--engine",
+            action="append",
+            choices=SCORING_ENGINES.keys(),
+            help="Scoring engine to benchmark, can be repeated, defaults to all",
+        )
+        parser.add_argument(
+            "--only",
+            action="append",
+            help="Only run benchmarks whose name starts with this, can be repeated",
+        )
+        parser.add_argument(
+            "--explain",
+            action="store_true",
+            help="Include EXPLAIN output for the per section and grouped score queries",
+        )
+        parser.add_argument(
+            "--output", action="store", help="File to write the JSON report to"
+        )
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="Keep the generated session rather than removing it afterwards",
+        )
+
+    def handle(self, *args, **options):
+        scoring_quiet()
+
+        with transaction.atomic():
+            report = self.run(options)
+            if not options["keep"]:
+                transaction.set_rollback(True)
+
+        report = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as fp:
+                fp.write(report)
+        else:
+            self.stdout.write(report)
+
+    def run(self, options):
+        parameters = None
+        if options["session"]:
+            try:
+                session = MarkingSession.objects.get(label=options["session"])
+            except MarkingSession.DoesNotExist:
+                raise CommandError(f"No such session: {options['session']}")
+        else:
+            if MarkingSession.objects.filter(label=options["label"]).exists():
+                raise CommandError(f"Session {options['label']} already exists")
+
+            benchmark = BenchmarkSession(
+                label=options["label"],
+                councils=options["councils"],
+                sections=options["sections"],
+                questions=options["questions"],
+                options=options["options"],
+                response_rate=options["response_rate"],
+                duplicate_rate=options["duplicate_rate"],
+                exceptions=options["exceptions"],
+                volunteers=options["volunteers"],
+                seed=options["seed"],
+            )
+            start = datetime.now()
+            session = benchmark.create()
+            parameters = benchmark.parameters
+            parameters["seconds_to_create"] = (datetime.now() - start).total_seconds()
+
+        results = run_benchmarks(
+            session,
+            engines=options["engine"],
+            repeat=options["repeat"],
+            only=options["only"],
+        )
+
+        report = {
+            "created": datetime.now().isoformat(),
+            "session": session.label,
+            "database": connection.vendor,
+            "parameters": parameters,
+            "repeat": options["repeat"],
+            "results": results,
+        }
+
+        if options["explain"]:
+            report["explain"] = explain_scoring_queries(session)
+
+        return report
@@ -1,7 +1,8 @@
 from django.core.management.base import BaseCommand
 
 from crowdsourcer.marking import (
-    get_assignment_progress,
+    get_assignment_progress_bulk,
+    get_assignment_progress_generation,
     save_cached_assignment_progress,
 )
 from crowdsourcer.models import Assigned, MarkingSession, ResponseType
@@ -11,7 +12,7 @@ NOBOLD = "\033[0m"
 
 
 class Command(BaseCommand):
-    help = "caches current progress for a stage and session to json"
+    help = "caches current progress for each stage of a session"
 
     def add_arguments(self, parser):
         parser.add_argument("--session", action="store", help="name of the session")
@@ -28,5 +29,6 @@ class Command(BaseCommand):
                 user__is_active=True,
             )
 
-            progress = get_assignment_progress(qs, session, t.type)
-            save_cached_assignment_progress(f"{session} {t.type}", progress)
+            generation = get_assignment_progress_generation(ms.id)
+            progress = get_assignment_progress_bulk(qs, session, t.type)
+            save_cached_assignment_progress(ms, t.type, progress, generation=generation)
@@ -1,3 +1,5 @@
+import csv
+
 from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.utils.text import slugify
@@ -6,9 +8,9 @@ import pandas as pd
 
 from crowdsourcer.models import MarkingSession, Question
 from crowdsourcer.scoring import (
-    clear_exception_cache,
-    get_all_question_data,
+    SCORING_ENGINES,
     get_scoring_object,
+    iter_all_question_data,
     scoring_quiet,
 )
 
@@ -40,6 +42,13 @@ class Command(BaseCommand):
             "--session", action="store", help="Name of the marking session to use"
         )
 
+        parser.add_argument(
+            "--engine",
+            action="store",
+            choices=SCORING_ENGINES.keys(),
+            help="Scoring engine to use, defaults to the SCORING_ENGINE setting",
+        )
+
         parser.add_argument(
             "--questions_only",
             action="store_true",
@@ -64,10 +73,11 @@ class Command(BaseCommand):
             df.to_csv(self.section_scores_file)
 
         if answers is not None:
-            df = pd.DataFrame(answers)
-            df = df.rename(columns=df.iloc[0]).drop(df.index[0])
-            df = df.set_index("council name")
-            df.to_csv(self.question_scores_file)
+            # answers can be very large so write it out a row at a time
+            with open(self.question_scores_file, "w", newline="") as fp:
+                writer = csv.writer(fp, lineterminator="\n")
+                for row in answers:
+                    writer.writerow(row)
 
         if questions is not None:
             df = pd.DataFrame(questions, index=None)
@@ -88,8 +98,6 @@ class Command(BaseCommand):
 
         self.questions_only = questions_only
 
-        # make sure we're not using old cached exceptions
-        clear_exception_cache()
         session_label = options["session"]
         try:
             session = MarkingSession.objects.get(label=session_label)
@@ -108,7 +116,7 @@ class Command(BaseCommand):
         scoring = {}
 
         if not questions_only:
-            scoring = get_scoring_object(session)
+            scoring = get_scoring_object(session, engine=options.get("engine"))
 
             for council, council_score in scoring["section_totals"].items():
 
@@ -151,7 +159,7 @@ class Command(BaseCommand):
         answer_data = None
         if output_answers or questions_only:
             if not questions_only:
-                answer_data = get_all_question_data(
+                answer_data = iter_all_question_data(
                     scoring, marking_session=session.label
                 )
 
@@ -5,7 +5,7 @@ from django.utils.text import slugify
 import pandas as pd
 
 from crowdsourcer.models import MarkingSession
-from crowdsourcer.scoring import get_scoring_object
+from crowdsourcer.scoring import SCORING_ENGINES, get_scoring_object
 
 
 class Command(BaseCommand):
@@ -27,6 +27,13 @@ class Command(BaseCommand):
             "--session", action="store", help="Name of the marking session to use"
         )
 
+        parser.add_argument(
+            "--engine",
+            action="store",
+            choices=SCORING_ENGINES.keys(),
+            help="Scoring engine to use, defaults to the SCORING_ENGINE setting",
+        )
+
     def handle(
         self,
         *args,
@@ -45,7 +52,7 @@ class Command(BaseCommand):
         self.session = session
         self.make_file_names(session_label)
 
-        scoring = get_scoring_object(session)
+        scoring = get_scoring_object(session, engine=options.get("engine"))
 
         rows = []
         cols = [
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+
+from crowdsourcer.models import MarkingSession
+from crowdsourcer.scoring import (
+    get_materialised_score_differences,
+    rebuild_materialised_scores,
+    scoring_quiet,
+)
+
+YELLOW = "\033[33m"
+NOBOLD = "\033[0m"
+
+
+class Command(BaseCommand):
+    help = "rebuild or check the materialised section scores for a session"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--session", action="store", help="Name of the marking session to use"
+        )
+
+        parser.add_argument(
+            "-q", "--quiet", action="store_true", help="Do not print scoring messages"
+        )
+
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Compare stored scores with a full calculation rather than rebuilding",
+        )
+
+    def handle(self, *args, **options):
+        if options["quiet"]:
+            scoring_quiet()
+
+        session_label = options["session"]
+        try:
+            session = MarkingSession.objects.get(label=session_label)
+        except MarkingSession.DoesNotExist:
+            self.stderr.write(f"No such session: {session_label}")
+            sessions = [s.label for s in MarkingSession.objects.all()]
+            self.stderr.write(f"Available sessions are {sessions}")
+            return
+
+        if not options["check"]:
+            count = rebuild_materialised_scores(session)
+            self.stdout.write(f"Stored {count} section scores for {session_label}")
+            return
+
+        differences = get_materialised_score_differences(session)
+        for authority, section, stored, calculated in differences:
+            self.stdout.write(
+                f"{YELLOW}{authority}, {section}: stored {stored}, calculated {calculated}{NOBOLD}"
+            )
+
+        if differences:
+            self.stdout.write(f"{len(differences)} section scores do not match")
+        else:
+            self.stdout.write("All section scores match")
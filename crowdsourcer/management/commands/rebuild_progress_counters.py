@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+
+from crowdsourcer.marking import (
+    get_progress_counter_differences,
+    rebuild_progress_counters,
+)
+from crowdsourcer.models import MarkingSession
+
+YELLOW = "\033[33m"
+NOBOLD = "\033[0m"
+
+
+class Command(BaseCommand):
+    help = "rebuild or check the progress counters for a session"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--session", action="store", help="Name of the marking session to use"
+        )
+
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Compare stored counters with a full calculation rather than rebuilding",
+        )
+
+    def handle(self, *args, **options):
+        session_label = options["session"]
+        try:
+            session = MarkingSession.objects.get(label=session_label)
+        except MarkingSession.DoesNotExist:
+            self.stderr.write(f"No such session: {session_label}")
+            sessions = [s.label for s in MarkingSession.objects.all()]
+            self.stderr.write(f"Available sessions are {sessions}")
+            return
+
+        if not options["check"]:
+            count = rebuild_progress_counters(session)
+            self.stdout.write(f"Stored {count} progress counters for {session_label}")
+            return
+
+        differences = get_progress_counter_differences(session)
+        for stage, authority, section, how_marked, stored, calculated in differences:
+            self.stdout.write(
+                f"{YELLOW}{stage}, {authority}, {section}, {how_marked}: stored {stored}, calculated {calculated}{NOBOLD}"
+            )
+
+        if differences:
+            self.stdout.write(f"{len(differences)} progress counters do not match")
+        else:
+            self.stdout.write("All progress counters match")
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from crowdsourcer.jobs import claim_next_job, expire_stale_jobs, run_job
+from crowdsourcer.scoring import scoring_quiet
+
+
+class Command(BaseCommand):
+    help = "run background stats exports requested from the stats pages"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once there are no jobs waiting rather than polling for more",
+        )
+        parser.add_argument(
+            "--sleep",
+            action="store",
+            type=int,
+            default=5,
+            help="Seconds to wait between checking for new jobs",
+        )
+
+    def handle(self, *args, **options):
+        scoring_quiet()
+
+        while True:
+            expire_stale_jobs()
+            job = claim_next_job()
+            if job is None:
+                if options["once"]:
+                    break
+                time.sleep(options["sleep"])
+                continue
+
+            self.stdout.write(f"Running {job.export} for {job.marking_session}")
+            job = run_job(job)
+            if job.status == "complete":
+                self.stdout.write(f"Wrote {job.rows_written} rows to {job.file_path}")
+            else:
+                self.stderr.write(f"Export failed: {job.error}")
@@ -1,39 +1,149 @@
-import pickle
+from collections import defaultdict
+from datetime import datetime
+from uuid import uuid4
 
 from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.utils.text import slugify
 
 from crowdsourcer.models import (
     Assigned,
     MarkingSession,
+    ProgressCounter,
     PublicAuthority,
     Question,
+    Response,
     ResponseType,
+    Section,
 )
 
+# bump this if the layout of the cached progress records changes
+PROGRESS_CACHE_FORMAT = 1
 
-def get_assignment_progress_cache_name(name):
-    name = slugify(name)
-    file = settings.BASE_DIR / "data" / f"assignment_progress_{name}.pkl"
 
-    return file
+def get_assignment_progress_cache_key(marking_session, stage):
+    return f"assignment_progress:{marking_session.id}:{slugify(stage)}"
 
 
-def get_cached_assignment_progress(name):
-    file = get_assignment_progress_cache_name(name)
+def get_assignment_progress_generation_key(marking_session_id):
+    return f"assignment_progress_generation:{marking_session_id}"
 
-    progress = None
-    if file.exists():
-        with open(file, "rb") as fp:
-            progress = pickle.load(fp)
 
-    return progress
+def get_assignment_progress_generation(marking_session_id):
+    """
+    Cached progress is only used if it was computed at the current
+    generation for the session, which changes whenever a response or
+    assignment in the session is saved.
+    """
+    key = get_assignment_progress_generation_key(marking_session_id)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, uuid4().hex, timeout=None)
+        generation = cache.get(key)
+
+    return generation
+
+
+def invalidate_assignment_progress(marking_session_id):
+    cache.set(
+        get_assignment_progress_generation_key(marking_session_id),
+        uuid4().hex,
+        timeout=None,
+    )
+
+
+def invalidate_assignment_progress_for_question(question_id):
+    marking_session_id = (
+        Section.objects.filter(question=question_id)
+        .values_list("marking_session_id", flat=True)
+        .first()
+    )
+    if marking_session_id is not None:
+        invalidate_assignment_progress(marking_session_id)
+
+
+def serialise_assignment_progress(progress):
+    """
+    Convert the output of get_assignment_progress to plain data with just
+    the fields the overview page needs.
+    """
+    records = []
+    for p in progress:
+        assignment = p["assignment"]
+        response_type = None
+        if assignment.response_type is not None:
+            response_type = assignment.response_type.type
+
+        records.append(
+            {
+                "assignment": {
+                    "id": assignment.id,
+                    "user": {
+                        "id": assignment.user_id,
+                        "username": assignment.user.username,
+                    },
+                    "section": {
+                        "id": assignment.section_id,
+                        "title": assignment.section.title,
+                    },
+                    "response_type": response_type,
+                },
+                "complete": p["complete"],
+                "started": p["started"],
+                "total": p["total"],
+                "section_link": p["section_link"],
+            }
+        )
+
+    return records
+
+
+def get_cached_assignment_progress(marking_session, stage):
+    """
+    Returns a dict with the cached progress and when it was computed, or
+    None if there is nothing cached or it is out of date.
+    """
+    record = cache.get(get_assignment_progress_cache_key(marking_session, stage))
+    if record is None or record.get("format") != PROGRESS_CACHE_FORMAT:
+        return None
 
+    if record["generation"] != get_assignment_progress_generation(marking_session.id):
+        return None
 
-def save_cached_assignment_progress(name, progress):
-    file = get_assignment_progress_cache_name(name)
-    with open(file, "wb") as fp:
-        pickle.dump(progress, fp)
+    return {
+        "computed_at": datetime.fromisoformat(record["computed_at"]),
+        "progress": record["progress"],
+    }
+
+
+def save_cached_assignment_progress(marking_session, stage, progress, generation=None):
+    """
+    Cache progress for a session and stage and return it in the same form
+    as get_cached_assignment_progress. generation should be fetched before
+    calculating the progress so that anything saved while it is being
+    calculated invalidates it.
+    """
+    if generation is None:
+        generation = get_assignment_progress_generation(marking_session.id)
+
+    computed_at = timezone.now()
+    progress = serialise_assignment_progress(progress)
+    cache.set(
+        get_assignment_progress_cache_key(marking_session, stage),
+        {
+            "format": PROGRESS_CACHE_FORMAT,
+            "generation": generation,
+            "computed_at": computed_at.isoformat(),
+            "progress": progress,
+        },
+        timeout=settings.ASSIGNMENT_PROGRESS_CACHE_TIMEOUT,
+    )
+
+    return {"computed_at": computed_at, "progress": progress}
 
 
 def get_assignment_progress(assignments, marking_session, stage):
@@ -103,23 +213,640 @@ def get_assignment_progress(assignments, marking_session, stage):
                 if count.num_responses == count.num_questions:
                     complete += 1
 
-        if assignment.response_type is None:
-            section_link = "home"
-        elif assignment.response_type.type == "First Mark":
-            section_link = "section_authorities"
-        elif assignment.response_type.type == "Right of Reply":
-            section_link = "authority_ror_authorities"
-        elif assignment.response_type.type == "Audit":
-            section_link = "audit_section_authorities"
-
         progress.append(
             {
                 "assignment": assignment,
                 "complete": complete,
                 "started": started,
                 "total": total,
-                "section_link": section_link,
+                "section_link": get_section_link(assignment.response_type),
             }
         )
 
     return progress
+
+
+def get_section_link(response_type):
+    section_link = None
+    if response_type is None:
+        section_link = "home"
+    elif response_type.type == "First Mark":
+        section_link = "section_authorities"
+    elif response_type.type == "Right of Reply":
+        section_link = "authority_ror_authorities"
+    elif response_type.type == "Audit":
+        section_link = "audit_section_authorities"
+
+    return section_link
+
+
+def get_assignment_progress_bulk(assignments, marking_session, stage):
+    """
+    Produces the same results as get_assignment_progress but fetches the
+    questions, authorities, assignments and response counts for the whole
+    session up front in grouped queries and works out the progress for
+    each assignment in memory, so the number of queries does not depend on
+    the number of assignments.
+    """
+    return list(iter_assignment_progress_bulk(assignments, marking_session, stage))
+
+
+def iter_assignment_progress_bulk(assignments, marking_session, stage, chunk_size=2000):
+    """
+    Yields the progress for each assignment as get_assignment_progress_bulk
+    does, fetching the assignments in chunks so they are never all held in
+    memory.
+    """
+    current_session = MarkingSession.objects.get(label=marking_session)
+
+    section_ids = set(
+        assignments.filter(section__isnull=False)
+        .order_by()
+        .values_list("section_id", flat=True)
+        .distinct()
+    )
+
+    assignments = assignments.distinct(
+        "user_id", "section_id", "response_type_id"
+    ).select_related("section", "response_type", "user", "user__marker__response_type")
+
+    types = Question.VOLUNTEER_TYPES
+    if stage == "Audit":
+        types = ["volunteer", "national_volunteer", "foi"]
+
+    first_mark = ResponseType.objects.get(type="First Mark")
+
+    # question ids for each section and question group
+    section_questions = defaultdict(lambda: defaultdict(set))
+    for q in Question.objects.filter(
+        section__marking_session=current_session,
+        how_marked__in=types,
+        questiongroup__isnull=False,
+    ).values("id", "section_id", "questiongroup"):
+        section_questions[q["section_id"]][q["questiongroup"]].add(q["id"])
+
+    authority_groups = dict(
+        PublicAuthority.objects.filter(marking_session=current_session).values_list(
+            "id", "questiongroup_id"
+        )
+    )
+
+    assigned_authorities = defaultdict(set)
+    for a in Assigned.objects.filter(active=True, section_id__in=section_ids).values(
+        "user_id", "section_id", "response_type_id", "authority_id"
+    ):
+        key = (a["user_id"], a["section_id"], a["response_type_id"])
+        assigned_authorities[key].add(a["authority_id"])
+
+    # number of questions answered for each authority, section and stage,
+    # only counting questions in the authority's question group
+    response_counts = {}
+    for count in (
+        Response.objects.filter(
+            question__section_id__in=section_ids,
+            question__how_marked__in=types,
+            question__questiongroup=F("authority__questiongroup"),
+        )
+        .filter(is_answered=True)
+        .values("authority_id", "question__section_id", "response_type_id")
+        .annotate(num_responses=Count("question_id", distinct=True))
+        .order_by()
+    ):
+        key = (
+            count["authority_id"],
+            count["question__section_id"],
+            count["response_type_id"],
+        )
+        response_counts[key] = count["num_responses"]
+
+    for assignment in assignments.iterator(chunk_size=chunk_size):
+        assignment_user = assignment.user
+        if hasattr(assignment_user, "marker"):
+            stage = assignment_user.marker.response_type
+        else:
+            stage = first_mark
+
+        total = 0
+        complete = 0
+        started = 0
+
+        if assignment.section is not None:
+            group_questions = section_questions[assignment.section_id]
+
+            if assignment.authority_id is not None:
+                stage_id = stage.id if stage is not None else None
+                authorities = assigned_authorities[
+                    (assignment.user_id, assignment.section_id, stage_id)
+                ]
+            else:
+                authorities = authority_groups.keys()
+
+            for authority in authorities:
+                group = authority_groups.get(authority)
+                if not group_questions.get(group):
+                    continue
+
+                num_responses = response_counts.get(
+                    (authority, assignment.section_id, assignment.response_type_id)
+                )
+
+                total += 1
+                if num_responses is not None and num_responses > 0:
+                    started += 1
+                if num_responses == len(group_questions[group]):
+                    complete += 1
+
+        yield {
+            "assignment": assignment,
+            "complete": complete,
+            "started": started,
+            "total": total,
+            "section_link": get_section_link(assignment.response_type),
+        }
+
+
+PROGRESS_COUNTER_KEY = [
+    "response_type_id",
+    "authority_id",
+    "section_id",
+    "how_marked",
+]
+
+
+def get_progress_counts(
+    marking_session, authority_ids=None, section_ids=None, response_type_ids=None
+):
+    """
+    Calculate the progress counts for a session, or just some authorities,
+    sections or response types in it, keyed by response type, authority,
+    section and how the questions are marked.
+
+    Only responses to questions in the authority's question group count.
+    """
+    questions = Question.objects.filter(
+        section__marking_session=marking_session, questiongroup__isnull=False
+    )
+    authorities = PublicAuthority.objects.filter(marking_session=marking_session)
+    responses = Response.objects.filter(
+        question__section__marking_session=marking_session,
+        question__questiongroup=F("authority__questiongroup"),
+    )
+
+    if authority_ids is not None:
+        authorities = authorities.filter(id__in=authority_ids)
+        responses = responses.filter(authority_id__in=authority_ids)
+    if section_ids is not None:
+        questions = questions.filter(section_id__in=section_ids)
+        responses = responses.filter(question__section_id__in=section_ids)
+
+    response_types = ResponseType.objects.values_list("id", flat=True)
+    if response_type_ids is not None:
+        response_types = response_types.filter(id__in=response_type_ids)
+        responses = responses.filter(response_type_id__in=response_type_ids)
+    response_types = list(response_types)
+
+    required = defaultdict(list)
+    for q in (
+        questions.values("section_id", "how_marked", "questiongroup")
+        .annotate(count=Count("pk", distinct=True))
+        .order_by()
+    ):
+        required[q["questiongroup"]].append(
+            (q["section_id"], q["how_marked"], q["count"])
+        )
+
+    counts = {}
+    for authority_id, group_id in authorities.values_list("id", "questiongroup_id"):
+        for section_id, how_marked, count in required[group_id]:
+            for response_type_id in response_types:
+                key = (response_type_id, authority_id, section_id, how_marked)
+                counts[key] = {"required": count, "answered": 0, "challenged": 0}
+
+    for count in (
+        responses.values(
+            "response_type_id",
+            "authority_id",
+            "question__section_id",
+            "question__how_marked",
+        )
+        .annotate(
+            answered=Count("question_id", distinct=True, filter=Q(is_answered=True)),
+            challenged=Count(
+                "question_id", distinct=True, filter=Q(agree_with_response=False)
+            ),
+        )
+        .order_by()
+    ):
+        key = (
+            count["response_type_id"],
+            count["authority_id"],
+            count["question__section_id"],
+            count["question__how_marked"],
+        )
+        if key in counts:
+            counts[key]["answered"] = count["answered"]
+            counts[key]["challenged"] = count["challenged"]
+
+    return counts
+
+
+def update_progress_counters(
+    marking_session, authority_ids=None, section_ids=None, response_type_ids=None
+):
+    """
+    Recalculate the stored progress counts for a session, or just some
+    authorities, sections or response types in it, and return the number
+    of counters.
+    """
+    if isinstance(marking_session, MarkingSession):
+        marking_session = marking_session.id
+
+    counts = get_progress_counts(
+        marking_session, authority_ids, section_ids, response_type_ids
+    )
+
+    existing = ProgressCounter.objects.filter(marking_session_id=marking_session)
+    if authority_ids is not None:
+        existing = existing.filter(authority_id__in=authority_ids)
+    if section_ids is not None:
+        existing = existing.filter(section_id__in=section_ids)
+    if response_type_ids is not None:
+        existing = existing.filter(response_type_id__in=response_type_ids)
+
+    with transaction.atomic():
+        removed = [
+            pk
+            for pk, *key in existing.values_list("pk", *PROGRESS_COUNTER_KEY)
+            if tuple(key) not in counts
+        ]
+        if removed:
+            ProgressCounter.objects.filter(pk__in=removed).delete()
+
+        ProgressCounter.objects.bulk_create(
+            [
+                ProgressCounter(
+                    marking_session_id=marking_session,
+                    **dict(zip(PROGRESS_COUNTER_KEY, key)),
+                    **values,
+                )
+                for key, values in counts.items()
+            ],
+            update_conflicts=True,
+            unique_fields=[
+                "marking_session",
+                "response_type",
+                "authority",
+                "section",
+                "how_marked",
+            ],
+            update_fields=["required", "answered", "challenged"],
+            batch_size=5000,
+        )
+
+    return len(counts)
+
+
+def rebuild_progress_counters(marking_session):
+    return update_progress_counters(marking_session)
+
+
+def update_response_progress_counters(authority_id, question_id, response_type_id):
+    """
+    Update the answered and challenged counts for the section of a response
+    in a single statement, falling back to recalculating the whole section
+    for the authority if there are no counters for it yet.
+    """
+    section = (
+        Section.objects.filter(question=question_id)
+        .values("id", "marking_session_id")
+        .first()
+    )
+    if section is None or authority_id is None or response_type_id is None:
+        return
+
+    responses = (
+        Response.objects.filter(
+            authority_id=authority_id,
+            response_type_id=response_type_id,
+            question__section_id=section["id"],
+            question__how_marked=OuterRef("how_marked"),
+            question__questiongroup=F("authority__questiongroup"),
+        )
+        .values("authority_id")
+        .order_by()
+    )
+
+    updated = ProgressCounter.objects.filter(
+        authority_id=authority_id,
+        section_id=section["id"],
+        response_type_id=response_type_id,
+    ).update(
+        answered=Coalesce(
+            Subquery(
+                responses.annotate(
+                    count=Count(
+                        "question_id", distinct=True, filter=Q(is_answered=True)
+                    )
+                ).values("count")
+            ),
+            0,
+        ),
+        challenged=Coalesce(
+            Subquery(
+                responses.annotate(
+                    count=Count(
+                        "question_id",
+                        distinct=True,
+                        filter=Q(agree_with_response=False),
+                    )
+                ).values("count")
+            ),
+            0,
+        ),
+    )
+
+    if updated == 0:
+        update_progress_counters(
+            section["marking_session_id"],
+            authority_ids=[authority_id],
+            section_ids=[section["id"]],
+        )
+
+
+def update_section_progress_counters(section_ids):
+    """
+    Recalculate the counters for all authorities in some sections, e.g.
+    after a question is added or its question groups change.
+    """
+    sections = defaultdict(set)
+    for section_id, marking_session_id in Section.objects.filter(
+        id__in=section_ids
+    ).values_list("id", "marking_session_id"):
+        sections[marking_session_id].add(section_id)
+
+    for marking_session_id, section_ids in sections.items():
+        update_progress_counters(marking_session_id, section_ids=section_ids)
+
+
+def update_question_progress_counters(question_ids):
+    update_section_progress_counters(
+        Section.objects.filter(question__in=question_ids).values("id")
+    )
+
+
+def get_progress_counter_differences(marking_session):
+    """
+    Compare the stored progress counters with a full calculation and return
+    a list of (stage, authority, section, how marked, stored, calculated)
+    for any that do not match.
+    """
+    counts = get_progress_counts(marking_session)
+
+    stored = {}
+    for c in ProgressCounter.objects.filter(marking_session=marking_session).values(
+        *PROGRESS_COUNTER_KEY, "required", "answered", "challenged"
+    ):
+        key = tuple(c[k] for k in PROGRESS_COUNTER_KEY)
+        stored[key] = {
+            "required": c["required"],
+            "answered": c["answered"],
+            "challenged": c["challenged"],
+        }
+
+    stages = dict(ResponseType.objects.values_list("id", "type"))
+    authorities = dict(
+        PublicAuthority.objects.filter(marking_session=marking_session).values_list(
+            "id", "name"
+        )
+    )
+    sections = dict(
+        Section.objects.filter(marking_session=marking_session).values_list(
+            "id", "title"
+        )
+    )
+
+    differences = []
+    for key in sorted(set(counts.keys()) | set(stored.keys()), key=str):
+        calculated = counts.get(key)
+        current = stored.get(key)
+        if calculated != current:
+            response_type_id, authority_id, section_id, how_marked = key
+            differences.append(
+                (
+                    stages.get(response_type_id, response_type_id),
+                    authorities.get(authority_id, authority_id),
+                    sections.get(section_id, section_id),
+                    how_marked,
+                    current,
+                    calculated,
+                )
+            )
+
+    return differences
+
+
+def annotate_progress_counts(
+    authorities, marking_session, response_type, question_types, section=None
+):
+    """
+    Add num_questions, num_responses and num_challenges from the progress
+    counters to a queryset of authorities.
+    """
+    counters = ProgressCounter.objects.filter(
+        marking_session=marking_session,
+        response_type=response_type,
+        authority=OuterRef("pk"),
+        how_marked__in=question_types,
+    )
+    if section is not None:
+        counters = counters.filter(section=section)
+    counters = counters.values("authority").order_by()
+
+    return authorities.annotate(
+        num_questions=Subquery(
+            counters.annotate(count=Sum("required")).values("count")
+        ),
+        num_responses=Subquery(
+            counters.annotate(count=Sum("answered")).values("count")
+        ),
+        num_challenges=Subquery(
+            counters.annotate(count=Sum("challenged")).values("count")
+        ),
+    )
+
+
+def get_section_progress(marking_session, response_type, question_types):
+    """
+    Count how many authorities have started and completed each section, and
+    how many questions have been challenged, using a single query that
+    groups the progress counters by section and authority. Returns a dict
+    keyed by section id.
+    """
+    progress = defaultdict(
+        lambda: {"total": 0, "complete": 0, "started": 0, "challenges": 0}
+    )
+
+    counters = (
+        ProgressCounter.objects.filter(
+            marking_session=marking_session,
+            response_type=response_type,
+            how_marked__in=question_types,
+        )
+        .values("section_id", "authority_id")
+        .annotate(
+            num_questions=Sum("required"),
+            num_responses=Sum("answered"),
+            num_challenges=Sum("challenged"),
+        )
+        .filter(num_questions__gt=0)
+        .order_by()
+    )
+
+    for counter in counters:
+        section = progress[counter["section_id"]]
+        section["total"] += 1
+        if counter["num_responses"] > 0:
+            section["started"] += 1
+        if counter["num_responses"] == counter["num_questions"]:
+            section["complete"] += 1
+        section["challenges"] += counter["num_challenges"]
+
+    return progress
+
+
+def get_authority_ror_section_progress(
+    authority, sections, marking_session, question_types, responses_to_ignore=None
+):
+    """
+    Count the questions the authority can respond to in each section and
+    how many they have answered in Right of Reply, using a single query
+    grouped by section. Questions where the First Mark response is one of
+    responses_to_ignore are left out. Returns a dict keyed by section id.
+    """
+    progress = defaultdict(lambda: {"total": 0, "complete": 0})
+
+    if not authority.marking_session.filter(pk=marking_session.pk).exists():
+        return progress
+
+    questions = Question.objects.filter(
+        section__in=sections,
+        how_marked__in=question_types,
+        questiongroup=authority.questiongroup_id,
+    )
+
+    if responses_to_ignore:
+        first_mark = (
+            Response.objects.filter(
+                authority=authority,
+                question=OuterRef("pk"),
+                response_type__type="First Mark",
+            )
+            .exclude(option__description__in=responses_to_ignore)
+            .exclude(multi_option__description__in=responses_to_ignore)
+        )
+        questions = questions.filter(Exists(first_mark))
+
+    answered = Response.objects.filter(
+        authority=authority,
+        question=OuterRef("pk"),
+        response_type__type="Right of Reply",
+        is_answered=True,
+    )
+
+    counts = (
+        questions.values("section_id")
+        .annotate(
+            total=Count("pk", distinct=True),
+            complete=Count("pk", distinct=True, filter=Exists(answered)),
+        )
+        .order_by()
+    )
+
+    for count in counts:
+        progress[count["section_id"]] = {
+            "total": count["total"],
+            "complete": count["complete"],
+        }
+
+    return progress
+
+
+# question types counted in volunteer progress for each stage
+STAGE_QUESTION_TYPES = {
+    "First Mark": Question.VOLUNTEER_TYPES,
+    "Right of Reply": Question.VOLUNTEER_TYPES,
+    "Audit": ["volunteer", "national_volunteer", "foi"],
+}
+
+
+def get_volunteer_progress(assignments, marking_session):
+    """
+    Get the progress for every authority in a set of assignments, across all
+    stages, using one query for the assignments and one for the progress
+    counters.
+
+    Returns a dict keyed by (user id, section id, response type id) with a
+    list of dicts with the name, num_questions and num_responses for each
+    assigned authority.
+    """
+    assignments = assignments.filter(
+        section__marking_session=marking_session,
+        section__isnull=False,
+        authority__isnull=False,
+    )
+
+    assigned = defaultdict(dict)
+    for a in assignments.values(
+        "user_id", "section_id", "response_type_id", "authority_id", "authority__name"
+    ).distinct():
+        key = (a["user_id"], a["section_id"], a["response_type_id"])
+        assigned[key][a["authority_id"]] = a["authority__name"]
+
+    counts = defaultdict(lambda: defaultdict(dict))
+    for c in (
+        ProgressCounter.objects.filter(
+            marking_session=marking_session,
+            section__in=assignments.values("section_id"),
+            authority__in=assignments.values("authority_id"),
+        )
+        .values(
+            "section_id",
+            "authority_id",
+            "response_type_id",
+            "response_type__type",
+            "how_marked",
+            "required",
+            "answered",
+        )
+        .order_by()
+    ):
+        types = STAGE_QUESTION_TYPES.get(
+            c["response_type__type"], Question.VOLUNTEER_TYPES
+        )
+        if c["how_marked"] not in types:
+            continue
+
+        key = (c["section_id"], c["response_type_id"])
+        authority = counts[key].setdefault(
+            c["authority_id"], {"num_questions": 0, "num_responses": 0}
+        )
+        authority["num_questions"] += c["required"]
+        authority["num_responses"] += c["answered"]
+
+    progress = {}
+    for key, authorities in assigned.items():
+        user_id, section_id, response_type_id = key
+        section_counts = counts[(section_id, response_type_id)]
+
+        progress[key] = []
+        for authority_id, name in authorities.items():
+            authority_counts = section_counts.get(authority_id, {})
+            progress[key].append(
+                {
+                    "name": name,
+                    "num_questions": authority_counts.get("num_questions"),
+                    "num_responses": authority_counts.get("num_responses"),
+                }
+            )
+
+    return progress
@@ -1,8 +1,87 @@
+import copy
+import threading
+import time
+
 from django.conf import settings
 from django.http import Http404
 
 from crowdsourcer.models import MarkingSession, ResponseType
 
+# the active sessions are needed on every request but rarely change so are
+# cached in each process for MARKING_SESSION_CACHE_TIMEOUT seconds, and
+# cleared by signals when a session or response type is saved. The cached
+# instances are shared between requests and threads so only copies of them
+# are handed out.
+_session_metadata = {"data": None, "expires": 0}
+_session_metadata_lock = threading.Lock()
+
+
+def clear_session_metadata():
+    with _session_metadata_lock:
+        _session_metadata["data"] = None
+        _session_metadata["expires"] = 0
+
+
+def load_session_metadata():
+    sessions = list(
+        MarkingSession.objects.filter(active=True)
+        .select_related("stage")
+        .order_by("id")
+    )
+
+    # matches ordering the active sessions by -default and taking the first
+    default = next((s for s in sessions if s.default), None)
+    if default is None and sessions:
+        default = sessions[0]
+
+    first_mark = None
+    if any(s.stage is None for s in sessions):
+        first_mark = ResponseType.objects.filter(type="First Mark").first()
+
+    return {
+        "sessions": sessions,
+        "by_label": {s.label: s for s in sessions},
+        "default": default,
+        "first_mark": first_mark,
+    }
+
+
+def get_session_metadata():
+    """
+    Returns the active sessions, the default session and the stage to use
+    for sessions without one.
+    """
+    timeout = settings.MARKING_SESSION_CACHE_TIMEOUT
+    now = time.monotonic()
+
+    with _session_metadata_lock:
+        data = _session_metadata["data"]
+        if data is not None and now < _session_metadata["expires"]:
+            return data
+
+    data = load_session_metadata()
+    if timeout > 0:
+        with _session_metadata_lock:
+            _session_metadata["data"] = data
+            _session_metadata["expires"] = now + timeout
+
+    return data
+
+
+def copy_session(session):
+    """
+    Copy a cached session, and its stage, so anything set on them while
+    handling a request is not seen by other requests.
+    """
+    session = copy.copy(session)
+    if session.stage is not None:
+        session.stage = copy.copy(session.stage)
+    return session
+
+
+def get_active_sessions():
+    return [copy_session(s) for s in get_session_metadata()["sessions"]]
+
 
 class AddStateMiddleware:
     def __init__(self, get_response):
@@ -18,21 +97,19 @@ class AddStateMiddleware:
         request.current_session = None
         request.current_stage = None
 
+        metadata = get_session_metadata()
         if session_name is not None:
-            current_session = MarkingSession.objects.filter(
-                label=session_name, active=True
-            ).first()
+            current_session = metadata["by_label"].get(session_name)
             if current_session is None:
                 raise Http404
         else:
-            current_session = (
-                MarkingSession.objects.filter(active=True).order_by("-default").first()
-            )
+            current_session = metadata["default"]
 
         if current_session is not None:
+            current_session = copy_session(current_session)
             current_stage = current_session.stage
-            if current_stage is None:
-                current_stage = ResponseType.objects.filter(type="First Mark").first()
+            if current_stage is None and metadata["first_mark"] is not None:
+                current_stage = copy.copy(metadata["first_mark"])
 
             request.current_stage = current_stage
             request.current_session = current_session
@@ -42,7 +119,7 @@ class AddStateMiddleware:
 
         if request.current_session is not None:
             context["marking_session"] = request.current_session
-            context["sessions"] = MarkingSession.objects.filter(active=True)
+            context["sessions"] = get_active_sessions()
             context["brand"] = settings.BRAND
             context["brand_include"] = (
                 f"crowdsourcer/cobrand/navbar_{context['brand']}.html"
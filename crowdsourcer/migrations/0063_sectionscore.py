@@ -0,0 +1,48 @@
+# Generated by Django 4.2.30 on 2026-10-17 02:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crowdsourcer", "0062_marker_first_login"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SectionScore",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("raw", models.FloatField(default=0)),
+                ("weighted", models.FloatField(default=0)),
+                ("last_update", models.DateTimeField(auto_now=True)),
+                (
+                    "authority",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="crowdsourcer.publicauthority",
+                    ),
+                ),
+                (
+                    "section",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="crowdsourcer.section",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("authority", "section")},
+            },
+        ),
+    ]
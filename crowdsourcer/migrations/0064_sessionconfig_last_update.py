@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crowdsourcer", "0063_sectionscore"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="sessionconfig",
+            name="last_update",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
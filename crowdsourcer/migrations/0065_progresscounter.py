@@ -0,0 +1,89 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crowdsourcer", "0064_sessionconfig_last_update"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProgressCounter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "how_marked",
+                    models.CharField(
+                        choices=[
+                            ("foi", "FOI"),
+                            ("national_data", "National Data"),
+                            (
+                                "national_data_ror_visible",
+                                "National Data visible in Right of Reply",
+                            ),
+                            ("volunteer", "Volunteer Research"),
+                            (
+                                "national_volunteer",
+                                "National Data and Volunteer Research",
+                            ),
+                        ],
+                        max_length=30,
+                    ),
+                ),
+                ("required", models.IntegerField(default=0)),
+                ("answered", models.IntegerField(default=0)),
+                ("challenged", models.IntegerField(default=0)),
+                (
+                    "authority",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="crowdsourcer.publicauthority",
+                    ),
+                ),
+                (
+                    "marking_session",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="crowdsourcer.markingsession",
+                    ),
+                ),
+                (
+                    "response_type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="crowdsourcer.responsetype",
+                    ),
+                ),
+                (
+                    "section",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="crowdsourcer.section",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {
+                    (
+                        "marking_session",
+                        "response_type",
+                        "authority",
+                        "section",
+                        "how_marked",
+                    )
+                },
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-17 05:20
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+
+def set_is_answered(apps, schema_editor):
+    Response = apps.get_model("crowdsourcer", "Response")
+    ResponseType = apps.get_model("crowdsourcer", "ResponseType")
+
+    right_of_reply = ResponseType.objects.filter(type="Right of Reply")
+    multi_option = Response.multi_option.through.objects.filter(
+        response_id=OuterRef("pk")
+    )
+
+    Response.objects.filter(
+        response_type__in=right_of_reply, agree_with_response__isnull=False
+    ).update(is_answered=True)
+
+    responses = Response.objects.exclude(response_type__in=right_of_reply)
+    responses.filter(option__isnull=False).update(is_answered=True)
+    responses.filter(Exists(multi_option)).update(is_answered=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crowdsourcer", "0065_progresscounter"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="historicalresponse",
+            name="is_answered",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name="response",
+            name="is_answered",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="response",
+            index=models.Index(
+                fields=["response_type", "authority", "question", "is_answered"],
+                name="response_answered_idx",
+            ),
+        ),
+        migrations.RunPython(set_is_answered, migrations.RunPython.noop),
+    ]
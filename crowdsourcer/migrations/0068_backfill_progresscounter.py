@@ -0,0 +1,108 @@
+from collections import defaultdict
+
+from django.db import migrations
+from django.db.models import Count, F, Q
+
+
+def get_progress_counts(apps, marking_session):
+    # a copy of crowdsourcer.marking.get_progress_counts using the
+    # historical models
+    PublicAuthority = apps.get_model("crowdsourcer", "PublicAuthority")
+    Question = apps.get_model("crowdsourcer", "Question")
+    Response = apps.get_model("crowdsourcer", "Response")
+    ResponseType = apps.get_model("crowdsourcer", "ResponseType")
+
+    required = defaultdict(list)
+    for q in (
+        Question.objects.filter(
+            section__marking_session=marking_session, questiongroup__isnull=False
+        )
+        .values("section_id", "how_marked", "questiongroup")
+        .annotate(count=Count("pk", distinct=True))
+        .order_by()
+    ):
+        required[q["questiongroup"]].append(
+            (q["section_id"], q["how_marked"], q["count"])
+        )
+
+    response_types = list(ResponseType.objects.values_list("id", flat=True))
+
+    counts = {}
+    for authority_id, group_id in PublicAuthority.objects.filter(
+        marking_session=marking_session
+    ).values_list("id", "questiongroup_id"):
+        for section_id, how_marked, count in required[group_id]:
+            for response_type_id in response_types:
+                key = (response_type_id, authority_id, section_id, how_marked)
+                counts[key] = {"required": count, "answered": 0, "challenged": 0}
+
+    for count in (
+        Response.objects.filter(
+            question__section__marking_session=marking_session,
+            question__questiongroup=F("authority__questiongroup"),
+        )
+        .values(
+            "response_type_id",
+            "authority_id",
+            "question__section_id",
+            "question__how_marked",
+        )
+        .annotate(
+            answered=Count("question_id", distinct=True, filter=Q(is_answered=True)),
+            challenged=Count(
+                "question_id", distinct=True, filter=Q(agree_with_response=False)
+            ),
+        )
+        .order_by()
+    ):
+        key = (
+            count["response_type_id"],
+            count["authority_id"],
+            count["question__section_id"],
+            count["question__how_marked"],
+        )
+        if key in counts:
+            counts[key]["answered"] = count["answered"]
+            counts[key]["challenged"] = count["challenged"]
+
+    return counts
+
+
+def create_progress_counters(apps, schema_editor):
+    MarkingSession = apps.get_model("crowdsourcer", "MarkingSession")
+    ProgressCounter = apps.get_model("crowdsourcer", "ProgressCounter")
+
+    for marking_session in MarkingSession.objects.all():
+        counts = get_progress_counts(apps, marking_session)
+
+        ProgressCounter.objects.filter(marking_session=marking_session).delete()
+        ProgressCounter.objects.bulk_create(
+            [
+                ProgressCounter(
+                    marking_session=marking_session,
+                    response_type_id=response_type_id,
+                    authority_id=authority_id,
+                    section_id=section_id,
+                    how_marked=how_marked,
+                    **values,
+                )
+                for (
+                    response_type_id,
+                    authority_id,
+                    section_id,
+                    how_marked,
+                ), values in counts.items()
+            ],
+            batch_size=5000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crowdsourcer", "0067_exportjob"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_progress_counters, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,17 @@
 import re
 
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models import Count, OuterRef, Subquery
+from django.db import models, transaction
+from django.db.models import (
+    Count,
+    Exists,
+    ExpressionWrapper,
+    Max,
+    OuterRef,
+    Q,
+    Subquery,
+)
+from django.dispatch import Signal
 from django.urls import reverse
 
 from simple_history.models import HistoricalRecords
@@ -37,6 +46,7 @@ class SessionConfig(models.Model):
     config_type = models.CharField(max_length=200, choices=CONFIG_TYPES)
     text_value = models.TextField(null=True, blank=True)
     json_value = models.JSONField(null=True, blank=True)
+    last_update = models.DateTimeField(auto_now=True)
 
     @property
     def value(self):
@@ -54,6 +64,21 @@ class SessionConfig(models.Model):
         except cls.DoesNotExist:
             return None
 
+    @classmethod
+    def get_version(cls, marking_session):
+        """
+        A value that changes whenever config for the session is added,
+        changed or deleted.
+        """
+        version = cls.objects.filter(marking_session=marking_session).aggregate(
+            count=Count("id"), last_update=Max("last_update")
+        )
+        last_update = version["last_update"]
+        if last_update is not None:
+            last_update = last_update.isoformat()
+
+        return f"{version['count']}:{last_update}"
+
 
 class SessionProperties(models.Model):
     """Used to define extra properties that can be added as part of marking"""
@@ -167,6 +192,18 @@ class Question(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     last_update = models.DateTimeField(auto_now=True)
 
+    # the fields the materialised section scores depend on
+    SCORE_FIELDS = ["section_id", "number", "number_part", "question_type", "weighting"]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_score_values = instance.get_score_values()
+        return instance
+
+    def get_score_values(self):
+        return {f: self.__dict__.get(f) for f in self.SCORE_FIELDS}
+
     @property
     def number_and_part(self):
         if self.number_part is not None:
@@ -228,6 +265,14 @@ class PublicAuthority(models.Model):
     political_coalition = models.CharField(max_length=100, blank=True, null=True)
     marking_session = models.ManyToManyField(MarkingSession)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the question group is the only thing about an authority the
+        # progress counters depend on
+        instance._saved_questiongroup_id = instance.__dict__.get("questiongroup_id")
+        return instance
+
     def __str__(self):
         name = self.name
         if self.do_not_mark:
@@ -243,7 +288,7 @@ class PublicAuthority(models.Model):
         types = {}
         control = {}
 
-        for a in cls.objects.filter(do_not_mark=False).all():
+        for a in cls.objects.filter(do_not_mark=False).select_related("questiongroup"):
             gss_map[a.name] = a.unique_id
             groups[a.name] = a.questiongroup.description
             countries[a.name] = a.country
@@ -271,11 +316,6 @@ class PublicAuthority(models.Model):
         if question_types is None:
             question_types = Question.VOLUNTEER_TYPES
 
-        stage_name = ""
-        if right_of_reply:
-            stage_name = "Right of Reply"
-        null_responses = Response.null_responses(stage_name=stage_name)
-
         authorities = cls.objects.filter(
             marking_session=marking_session, questiongroup__question__in=questions
         ).annotate(
@@ -312,7 +352,7 @@ class PublicAuthority(models.Model):
                     response_type=response_type,
                     **args,
                 )
-                .exclude(id__in=null_responses)
+                .filter(is_answered=True)
                 .values("authority")
                 .annotate(response_count=Count("question_id", distinct=True))
                 .values("response_count")
@@ -343,6 +383,19 @@ class Option(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     last_update = models.DateTimeField(auto_now=True)
 
+    # the fields the materialised section scores depend on, the description
+    # is used by answer based exceptions
+    SCORE_FIELDS = ["question_id", "score", "description"]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_score_values = instance.get_score_values()
+        return instance
+
+    def get_score_values(self):
+        return {f: self.__dict__.get(f) for f in self.SCORE_FIELDS}
+
     def __str__(self):
         return self.description
 
@@ -364,6 +417,66 @@ class ResponseType(models.Model):
         return self.type
 
 
+# Sent after responses have changed without being saved, e.g. with update()
+# or bulk_update(), with the (authority_id, question_id, response_type_id) of
+# each of them before and after the change so anything kept up to date by
+# the save signals can be updated.
+responses_changed = Signal()
+
+
+class ResponseQuerySet(models.QuerySet):
+    # the fields is_answered or the progress counts depend on
+    ANSWER_FIELDS = {
+        "authority",
+        "authority_id",
+        "question",
+        "question_id",
+        "option",
+        "option_id",
+        "response_type",
+        "response_type_id",
+        "agree_with_response",
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.send_changed = True
+
+    def _clone(self):
+        clone = super()._clone()
+        clone.send_changed = self.send_changed
+        return clone
+
+    def without_changed_signal(self):
+        """
+        For callers that update is_answered and the progress counts
+        themselves once they have finished making changes.
+        """
+        clone = self._clone()
+        clone.send_changed = False
+        return clone
+
+    def get_cells(self):
+        return set(self.values_list("authority_id", "question_id", "response_type_id"))
+
+    def update(self, **kwargs):
+        if not self.send_changed or not self.ANSWER_FIELDS.intersection(kwargs):
+            return super().update(**kwargs)
+
+        with transaction.atomic(using=self.db, savepoint=False):
+            pks = list(self.values_list("pk", flat=True))
+            responses = self.model.objects.filter(pk__in=pks)
+            cells = responses.get_cells()
+
+            rows = super().update(**kwargs)
+
+            self.model.update_is_answered(responses)
+            cells |= responses.get_cells()
+
+        responses_changed.send(sender=self.model, cells=cells)
+        return rows
+
+
 class Response(models.Model):
     authority = models.ForeignKey(PublicAuthority, on_delete=models.CASCADE)
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
@@ -413,6 +526,19 @@ class Response(models.Model):
     points = models.FloatField(
         blank=True, null=True, help_text="overide marks for this response"
     )
+    # kept up to date by signals so progress queries do not need to join the
+    # options
+    is_answered = models.BooleanField(default=False, editable=False)
+
+    objects = ResponseQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["response_type", "authority", "question", "is_answered"],
+                name="response_answered_idx",
+            )
+        ]
 
     def get_absolute_url(self):
         return reverse(
@@ -432,12 +558,84 @@ class Response(models.Model):
         links = re.findall(r"((?:https?://|www\.)[^ \r\n]*)", text)
         return links
 
+    # the fields the progress counters depend on
+    PROGRESS_FIELDS = [
+        "authority_id",
+        "question_id",
+        "response_type_id",
+        "is_answered",
+        "agree_with_response",
+    ]
+
     @classmethod
-    def null_responses(cls, stage_name=""):
-        if stage_name == "Right of Reply":
-            return cls.objects.filter(agree_with_response__isnull=True)
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.set_saved_progress()
+        return instance
+
+    def get_progress_values(self):
+        return {f: self.__dict__.get(f) for f in self.PROGRESS_FIELDS}
 
-        return cls.objects.filter(option__isnull=True, multi_option__isnull=True)
+    def set_saved_progress(self):
+        """
+        Remember the values the progress counters were last calculated
+        with so saves that don't change them can skip updating them.
+        """
+        self._saved_progress = self.get_progress_values()
+
+    @property
+    def version(self):
+        """
+        Changes each time the response is saved so autosaves can spot an
+        answer that has been changed since the page was loaded.
+        """
+        if self.last_update is None:
+            return ""
+        return self.last_update.isoformat()
+
+    def get_is_answered(self):
+        """
+        A response is answered once an option has been picked, or for Right
+        of Reply once the council has said if they agree with the mark.
+        """
+        if (
+            self.response_type_id is not None
+            and self.response_type.type == "Right of Reply"
+        ):
+            return self.agree_with_response is not None
+
+        if self.option_id is not None:
+            return True
+
+        return self.pk is not None and self.multi_option.exists()
+
+    @classmethod
+    def update_is_answered(cls, responses):
+        """
+        Recalculate is_answered for a queryset of responses in one UPDATE,
+        e.g. after their multi options have changed.
+        """
+        right_of_reply = Exists(
+            ResponseType.objects.filter(
+                pk=OuterRef("response_type_id"), type="Right of Reply"
+            )
+        )
+        multi_option = Exists(
+            cls.multi_option.through.objects.filter(response_id=OuterRef("pk"))
+        )
+        responses.update(
+            is_answered=ExpressionWrapper(
+                Q(right_of_reply, agree_with_response__isnull=False)
+                | Q(~right_of_reply, Q(option__isnull=False) | multi_option),
+                output_field=models.BooleanField(),
+            )
+        )
+
+    @classmethod
+    def null_responses(cls, stage_name=""):
+        # stage_name is no longer needed as is_answered takes the stage of
+        # the response into account
+        return cls.objects.filter(is_answered=False)
 
     @classmethod
     def get_response_for_question(
@@ -498,39 +696,76 @@ class Assigned(models.Model):
 
         return ", ".join(parts)
 
+    @classmethod
+    def get_user_assignments(cls, user):
+        """
+        Returns the user's active assignments as a set of (marking session
+        id, stage id, section title, authority name). They are stored on the
+        user object so are only fetched once per request.
+        """
+        assignments = getattr(user, "_active_assignments", None)
+        if assignments is None:
+            assignments = set(
+                cls.objects.filter(user=user, active=True).values_list(
+                    "marking_session_id",
+                    "response_type_id",
+                    "section__title",
+                    "authority__name",
+                )
+            )
+            user._active_assignments = assignments
+
+        return assignments
+
     @classmethod
     def is_user_assigned(cls, user, **kwargs):
+        """
+        Checks if the user has an assignment matching all the section,
+        authority, marking_session and current_stage passed in. An
+        assignment to a whole section, or to everything in a stage, also
+        counts whatever the session.
+        """
         if user.is_superuser:
             return True
 
         if user.is_anonymous:
             return False
 
-        q = cls.objects.filter(user=user, active=True)
-        q_all_stage = None
-
-        if kwargs.get("section", None) is not None:
-            q = q.filter(section__title=kwargs["section"])
-            q_section = q.filter(section__title=kwargs["section"], authority=None)
-        if kwargs.get("authority", None) is not None:
-            q = q.filter(authority__name=kwargs["authority"])
-        if kwargs.get("marking_session", None) is not None:
-            q = q.filter(marking_session=kwargs["marking_session"])
-        if kwargs.get("current_stage", None) is not None:
-            q = q.filter(response_type=kwargs["current_stage"])
-            q_all_stage = cls.objects.filter(
-                user=user,
-                active=True,
-                section__isnull=True,
-                authority__isnull=True,
-                response_type=kwargs["current_stage"],
-            )
-
-        return (
-            q.exists()
-            or q_section.exists()
-            or (q_all_stage is not None and q_all_stage.exists())
-        )
+        section = kwargs.get("section", None)
+        authority = kwargs.get("authority", None)
+        marking_session = kwargs.get("marking_session", None)
+        current_stage = kwargs.get("current_stage", None)
+        marking_session_id = getattr(marking_session, "pk", marking_session)
+        stage_id = getattr(current_stage, "pk", current_stage)
+
+        for (
+            a_session_id,
+            a_stage_id,
+            a_section,
+            a_authority,
+        ) in cls.get_user_assignments(user):
+            if (
+                (section is None or a_section == section)
+                and (authority is None or a_authority == authority)
+                and (marking_session is None or a_session_id == marking_session_id)
+                and (current_stage is None or a_stage_id == stage_id)
+            ):
+                return True
+
+            # assigned the whole section
+            if section is not None and a_section == section and a_authority is None:
+                return True
+
+            # assigned everything in the stage
+            if (
+                current_stage is not None
+                and a_stage_id == stage_id
+                and a_section is None
+                and a_authority is None
+            ):
+                return True
+
+        return False
 
     class Meta:
         verbose_name = "assignment"
@@ -569,3 +804,104 @@ class Marker(models.Model):
             ("can_view_stats", "Can view stats"),
             ("can_manage_users", "Can manage users"),
         ]
+
+
+class SectionScore(models.Model):
+    """Materialised Audit scores
+
+    Raw and weighted score for an authority in a section. Kept up to date as
+    responses are saved when the materialised scoring engine is in use.
+    """
+
+    authority = models.ForeignKey(PublicAuthority, on_delete=models.CASCADE)
+    section = models.ForeignKey(Section, on_delete=models.CASCADE)
+    raw = models.FloatField(default=0)
+    weighted = models.FloatField(default=0)
+    last_update = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.authority.name}, {self.section.title}: {self.raw}"
+
+    class Meta:
+        unique_together = [["authority", "section"]]
+
+
+class ProgressCounter(models.Model):
+    """Denormalised progress counts
+
+    How many questions an authority needs answering in a section for a
+    stage, and how many have been answered and challenged, split by how
+    the questions are marked so pages can pick the question types they
+    show. Kept up to date as responses, questions and assignments are
+    saved.
+    """
+
+    marking_session = models.ForeignKey(MarkingSession, on_delete=models.CASCADE)
+    response_type = models.ForeignKey(ResponseType, on_delete=models.CASCADE)
+    authority = models.ForeignKey(PublicAuthority, on_delete=models.CASCADE)
+    section = models.ForeignKey(Section, on_delete=models.CASCADE)
+    how_marked = models.CharField(max_length=30, choices=Question.MARKING_TYPES)
+    required = models.IntegerField(default=0)
+    answered = models.IntegerField(default=0)
+    challenged = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.authority.name}, {self.section.title}, {self.response_type}: {self.answered} of {self.required}"
+
+    class Meta:
+        unique_together = [
+            [
+                "marking_session",
+                "response_type",
+                "authority",
+                "section",
+                "how_marked",
+            ]
+        ]
+
+
+class ExportJob(models.Model):
+    """A stats export run in the background
+
+    Created by the stats pages and picked up by the run_export_jobs
+    command, which writes the CSV to disk so it can be downloaded once
+    complete. Only one job for each session and export can be waiting or
+    running at a time so repeated requests share the same run.
+    """
+
+    STATUSES = [
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("complete", "Complete"),
+        ("failed", "Failed"),
+    ]
+    ACTIVE_STATUSES = ["pending", "running"]
+
+    marking_session = models.ForeignKey(MarkingSession, on_delete=models.CASCADE)
+    export = models.CharField(max_length=100)
+    status = models.CharField(max_length=20, default="pending", choices=STATUSES)
+    requested_by = models.ForeignKey(
+        User, null=True, blank=True, on_delete=models.SET_NULL
+    )
+    rows_written = models.IntegerField(default=0)
+    file_path = models.CharField(max_length=500, blank=True)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.export}, {self.marking_session}: {self.status}"
+
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["marking_session", "export"],
+                condition=Q(status__in=["pending", "running"]),
+                name="exportjob_one_active",
+            )
+        ]
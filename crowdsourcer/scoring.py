@@ -1,8 +1,28 @@
+import re
 from collections import defaultdict
-from copy import deepcopy
-from functools import cache
+from collections.abc import Mapping
+from copy import copy, deepcopy
+from math import isclose
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import (
+    Case,
+    Count,
+    F,
+    IntegerField,
+    Max,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
 
-from django.db.models import Count, Max, OuterRef, Q, Subquery, Sum
+import numpy as np
+import pandas as pd
 
 from crowdsourcer.models import (
     MarkingSession,
@@ -13,6 +33,7 @@ from crowdsourcer.models import (
     Response,
     ResponseType,
     Section,
+    SectionScore,
     SessionConfig,
 )
 
@@ -36,27 +57,103 @@ def get_scoring_config(marking_session, name):
     return conf
 
 
-@cache
-def get_exceptions(marking_session):
+class ConfigCache:
+    """
+    Caches the scoring config for a session, keyed by the session id and
+    the version of its SessionConfig rows, so any change to the config
+    means it gets loaded again.
+
+    The version is read from the database every time the config is used,
+    which is a single aggregate query, so a change made by one worker is
+    picked up by all the others whatever cache backend is in use. The
+    config itself is kept in this process and in the Django cache so it
+    is only loaded once for each version.
+    """
+
+    def __init__(self):
+        self.entries = {}
+
+    def key(self, marking_session_id):
+        return f"scoring_config:{marking_session_id}"
+
+    def get_entry(self, marking_session):
+        # the label decides whether the housing exceptions apply
+        version = (marking_session.label, SessionConfig.get_version(marking_session))
+
+        entry = self.entries.get(marking_session.id)
+        if entry is None or entry["version"] != version:
+            entry = cache.get(self.key(marking_session.id))
+        if entry is None or entry["version"] != version:
+            entry = {"version": version, "values": {}}
+
+        self.entries[marking_session.id] = entry
+        return entry
+
+    def get(self, marking_session, name, load):
+        if marking_session is None:
+            return load(marking_session)
+
+        entry = self.get_entry(marking_session)
+        if name not in entry["values"]:
+            entry["values"][name] = load(marking_session)
+            cache.set(
+                self.key(marking_session.id),
+                entry,
+                settings.SCORING_CONFIG_CACHE_TIMEOUT,
+            )
+
+        return entry["values"][name]
+
+    def invalidate(self, marking_session_id=None):
+        if marking_session_id is not None:
+            ids = [marking_session_id]
+        else:
+            ids = MarkingSession.objects.values_list("id", flat=True)
+
+        for i in ids:
+            self.entries.pop(i, None)
+        cache.delete_many([self.key(i) for i in ids])
+
+
+config_cache = ConfigCache()
+
+
+def load_exceptions(marking_session):
     exceptions = get_scoring_config(marking_session, "exceptions")
     exceptions = update_with_housing_exceptions(exceptions, marking_session)
     return exceptions
 
 
-@cache
+def get_exceptions(marking_session):
+    return config_cache.get(marking_session, "exceptions", load_exceptions)
+
+
 def get_score_exceptions(marking_session):
-    return get_scoring_config(marking_session, "score_exceptions")
+    return config_cache.get(
+        marking_session,
+        "score_exceptions",
+        lambda s: get_scoring_config(s, "score_exceptions"),
+    )
 
 
-@cache
 def get_weightings(marking_session):
-    return get_scoring_config(marking_session, "score_weightings")
+    return config_cache.get(
+        marking_session,
+        "score_weightings",
+        lambda s: get_scoring_config(s, "score_weightings"),
+    )
 
 
-def clear_exception_cache():
-    get_exceptions.cache_clear()
-    get_score_exceptions.cache_clear()
-    get_weightings.cache_clear()
+def clear_exception_cache(marking_session=None):
+    """
+    Only needed if the config has been changed without saving the
+    SessionConfig, e.g. using update() on a queryset.
+    """
+    marking_session_id = None
+    if marking_session is not None:
+        marking_session_id = marking_session.id
+
+    config_cache.invalidate(marking_session_id)
 
 
 def number_and_part(number=None, number_part=None):
@@ -198,8 +295,144 @@ def get_section_maxes(scoring, session, quiet=False):
     scoring["negative_q"] = negative_q
 
 
-def q_is_exception(q, section, group, country, council, session, response_type):
-    config_exceptions = get_exceptions(session)
+def get_question_data(session, section=None):
+    """
+    Load all the questions, groups and options for a session, or just one
+    section in it, in a fixed number of queries rather than one set per
+    section and group.
+    """
+    sections = Section.objects.filter(marking_session=session)
+    question_filter = {"section__marking_session": session}
+    if section is not None:
+        sections = sections.filter(pk=section.pk)
+        question_filter["section"] = section
+    sections = list(sections.values_list("id", "title"))
+    groups = list(QuestionGroup.objects.values_list("id", "description"))
+
+    questions = {}
+    for q in Question.objects.filter(**question_filter).values(
+        "id", "section_id", "number", "number_part", "question_type", "weighting"
+    ):
+        q["number_and_part"] = number_and_part(q["number"], q["number_part"])
+        q["groups"] = set()
+        q["scores"] = []
+        questions[q["id"]] = q
+
+    for q_id, group_id in Question.questiongroup.through.objects.filter(
+        **{f"question__{k}": v for k, v in question_filter.items()}
+    ).values_list("question_id", "questiongroup_id"):
+        questions[q_id]["groups"].add(group_id)
+
+    option_scores = {}
+    for o_id, q_id, score in Option.objects.filter(
+        **{f"question__{k}": v for k, v in question_filter.items()}
+    ).values_list("id", "question_id", "score"):
+        questions[q_id]["scores"].append(score)
+        option_scores[o_id] = score
+
+    return {
+        "sections": sections,
+        "groups": groups,
+        "questions": questions,
+        "option_scores": option_scores,
+    }
+
+
+def get_section_maxes_bulk(scoring, session, quiet=False, section=None):
+    """
+    Produces the same results as get_section_maxes but works from data
+    loaded up front so the number of queries does not depend on the
+    number of sections or groups.
+
+    Passing a section only works out the maxes for that section.
+    """
+    data = get_question_data(session, section=section)
+    scoring["question_data"] = data
+
+    section_maxes = defaultdict(dict)
+    section_weighted_maxes = defaultdict(dict)
+    group_totals = defaultdict(int)
+    q_maxes = defaultdict(int)
+    q_weighted_maxes = defaultdict(int)
+    negative_q = defaultdict(int)
+    score_exceptions = get_score_exceptions(session)
+    all_negative_exceptions = get_scoring_config(session, "negative_exceptions")
+
+    max_types = ["yes_no", "select_one", "tiered"]
+
+    by_section = defaultdict(list)
+    for q in data["questions"].values():
+        by_section[q["section_id"]].append(q)
+
+    for section_id, section_title in data["sections"]:
+        q_section_maxes = {}
+        q_section_weighted_maxes = {}
+        q_section_negatives = {}
+
+        negative_exceptions = all_negative_exceptions.get(section_title) or []
+        section_score_exceptions = score_exceptions.get(section_title, None)
+
+        for group_id, group_description in data["groups"]:
+            group_questions = [
+                q for q in by_section[section_id] if group_id in q["groups"]
+            ]
+            questions = [q for q in group_questions if q["question_type"] != "negative"]
+
+            max_score = 0
+            for q in questions:
+                if not q["scores"]:
+                    continue
+                q_number = q["number_and_part"]
+                if q_number in negative_exceptions:
+                    continue
+
+                if q["question_type"] in max_types:
+                    highest = max(q["scores"])
+                else:
+                    highest = sum(q["scores"])
+                    if (
+                        section_score_exceptions is not None
+                        and section_score_exceptions.get(q_number, None) is not None
+                    ):
+                        highest = section_score_exceptions[q_number]["max_score"]
+
+                q_section_maxes[q_number] = highest
+                max_score += highest
+
+            # this stops lookup errors later on
+            for q in group_questions:
+                if q["question_type"] == "negative":
+                    q_section_negatives[q["number_and_part"]] = 1
+                    q_section_maxes[q["number_and_part"]] = 0
+
+            for q in negative_exceptions:
+                q_section_negatives[q] = 1
+                q_section_maxes[q] = 0
+
+            weighted_max = 0
+            for q in questions:
+                q_max = weighting_to_points(q["weighting"])
+                if q["weighting"] == "unweighted":
+                    q_max = q_section_maxes[q["number_and_part"]]
+                q_section_weighted_maxes[q["number_and_part"]] = q_max
+                weighted_max += q_max
+
+            section_maxes[section_title][group_description] = max_score
+            section_weighted_maxes[section_title][group_description] = weighted_max
+            group_totals[group_description] += max_score
+            q_weighted_maxes[section_title] = deepcopy(q_section_weighted_maxes)
+            q_maxes[section_title] = deepcopy(q_section_maxes)
+            negative_q[section_title] = deepcopy(q_section_negatives)
+
+    scoring["section_maxes"] = section_maxes
+    scoring["group_maxes"] = group_totals
+    scoring["q_maxes"] = q_maxes
+    scoring["section_weighted_maxes"] = section_weighted_maxes
+    scoring["q_section_weighted_maxes"] = q_weighted_maxes
+    scoring["negative_q"] = negative_q
+
+
+def get_config_exceptions(config_exceptions, section, group, country, council):
     all_exceptions = []
     try:
         exceptions = config_exceptions[section][group][country]
@@ -219,6 +452,15 @@ def q_is_exception(q, section, group, country, council, session, response_type):
     except KeyError:
         pass
 
+    return all_exceptions
+
+
+def q_is_exception(q, section, group, country, council, session, response_type):
+    config_exceptions = get_exceptions(session)
+    all_exceptions = get_config_exceptions(
+        config_exceptions, section, group, country, council
+    )
+
     exceptions = get_score_based_exceptions(
         section, council.name, session, response_type
     )
@@ -229,6 +471,146 @@ def q_is_exception(q, section, group, country, council, session, response_type):
     return False
 
 
+class ExceptionIndex:
+    """
+    Works out which questions are excluded for each council in a session.
+
+    q_is_exception and get_score_based_exceptions look up the config and
+    the answers for answer based exceptions every time they are called.
+    This loads everything needed for answer based exceptions in a fixed
+    number of queries and then remembers the set of excluded questions
+    for each council and section.
+    """
+
+    def __init__(self, session, response_type="Audit", authority=None, section=None):
+        self.session = session
+        self.response_type = getattr(response_type, "type", response_type)
+        self.config_exceptions = get_exceptions(session)
+        self.answer_exceptions = self.config_exceptions.get("answer_exceptions") or {}
+        self.council_exceptions = {}
+
+        # only load the answers needed for one authority or section
+        self.authority = authority
+        if section is not None:
+            self.answer_exceptions = {
+                k: v for k, v in self.answer_exceptions.items() if k == section.title
+            }
+
+        self.answers = defaultdict(list)
+        self.questions = defaultdict(list)
+        if self.answer_exceptions:
+            self.load_answer_data()
+
+    def load_answer_data(self):
+        sections = self.answer_exceptions.keys()
+        numbers = set()
+        for exceptions in self.answer_exceptions.values():
+            for exception in exceptions:
+                numbers.add(exception["question_number"])
+
+        responses = Response.objects.filter(
+            question__section__marking_session=self.session,
+            question__section__title__in=sections,
+            question__number__in=numbers,
+            response_type__type=self.response_type,
+        )
+        if self.authority is not None:
+            responses = responses.filter(authority=self.authority)
+        responses = responses.values(
+            "authority__name",
+            "authority__questiongroup_id",
+            "question__section__title",
+            "question__number",
+            "question__number_part",
+            "option__description",
+        )
+        for r in responses:
+            key = (
+                r["question__section__title"],
+                r["authority__name"],
+                str(r["question__number"]),
+            )
+            self.answers[key].append(r)
+
+        questions = (
+            Question.objects.filter(
+                section__marking_session=self.session,
+                section__title__in=sections,
+            )
+            .select_related("section")
+            .prefetch_related("questiongroup")
+        )
+        for q in questions:
+            self.questions[(q.section.title, str(q.number))].append(
+                (q.number_part, {g.pk for g in q.questiongroup.all()})
+            )
+
+    def get_response(self, section, council, number, part):
+        responses = self.answers[(section, council, str(number))]
+        if part:
+            responses = [r for r in responses if r["question__number_part"] == part]
+
+        if len(responses) == 1:
+            return responses[0]
+        return None
+
+    def get_question_groups(self, section, q):
+        number, part = re.search(r"(\d+)([a-z]?)", q).groups()
+        questions = self.questions[(section, number)]
+        if part:
+            questions = [question for question in questions if question[0] == part]
+
+        if len(questions) == 1:
+            return questions[0][1]
+        return set()
+
+    def get_answer_exceptions(self, section, council):
+        all_exceptions = []
+        for exception in self.answer_exceptions.get(section, []):
+            if exception.get("councils_excluded"):
+                if council.name in exception["councils_excluded"]:
+                    continue
+
+            r = self.get_response(
+                section,
+                council.name,
+                exception["question_number"],
+                exception["question_part"],
+            )
+            if r and r["option__description"] == exception["answer"]:
+                for question in exception["ignore"]:
+                    groups = self.get_question_groups(section, question)
+                    if r["authority__questiongroup_id"] in groups:
+                        all_exceptions.append(question)
+
+        return all_exceptions
+
+    def get(self, section, group, country, council):
+        key = (council.name, section)
+        if key not in self.council_exceptions:
+            all_exceptions = get_config_exceptions(
+                self.config_exceptions, section, group, country, council
+            )
+            all_exceptions = all_exceptions + self.get_answer_exceptions(
+                section, council
+            )
+            self.council_exceptions[key] = set(all_exceptions)
+
+        return self.council_exceptions[key]
+
+    def is_exception(self, q, section, group, country, council):
+        return q in self.get(section, group, country, council)
+
+
+def get_exception_index(scoring, session, response_type="Audit"):
+    response_type = getattr(response_type, "type", response_type)
+    indexes = scoring.setdefault("exception_indexes", {})
+    if response_type not in indexes:
+        indexes[response_type] = ExceptionIndex(session, response_type)
+
+    return indexes[response_type]
+
+
 def update_with_housing_exceptions(exceptions, session):
     if session.label != "Scorecards 2023":
         return exceptions
@@ -295,56 +677,137 @@ def get_score_based_exceptions(section, council, session, response_type):
     return all_exceptions
 
 
-def get_maxes_for_council(scoring, group, country, council, session, response_type):
-    maxes = deepcopy(scoring["section_maxes"])
-    weighted_maxes = deepcopy(scoring["section_weighted_maxes"])
-    config_exceptions = get_exceptions(session)
-    for section in maxes.keys():
-        all_exceptions = []
-        try:
-            exceptions = config_exceptions[section][group][country]
-            all_exceptions = all_exceptions + exceptions
-        except KeyError:
-            pass
+class SectionMaxes(Mapping):
+    """
+    Read only view of the maxes for each group in a section with the
+    excluded questions for a council's group taken off.
+    """
 
-        try:
-            exceptions = config_exceptions[section][council.type]
-            all_exceptions = all_exceptions + exceptions
-        except KeyError:
-            pass
+    def __init__(self, base, group, excluded):
+        self.base = base
+        self.group = group
+        self.excluded = excluded
 
-        try:
-            exceptions = config_exceptions[section][council.name]
-            all_exceptions = all_exceptions + exceptions
-        except KeyError:
-            pass
+    def __getitem__(self, group):
+        value = self.base[group]
+        if group == self.group:
+            for q_max in self.excluded:
+                value -= q_max
 
-        exceptions = get_score_based_exceptions(
-            section, council.name, session, response_type
-        )
-        all_exceptions = all_exceptions + exceptions
+        return value
+
+    def __iter__(self):
+        return iter(self.base)
+
+    def __len__(self):
+        return len(self.base)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class CouncilMaxes(Mapping):
+    """
+    Read only view of the section maxes for a council.
+
+    Rather than copying the maxes for every section and group for each
+    council this holds the shared session maxes and the maxes of the
+    questions excluded for the council, and works out the values for the
+    council's group when they are asked for.
+    """
+
+    def __init__(self, base, group, excluded, group_maxes=None):
+        self.base = base
+        self.group = group
+        self.excluded = excluded
+        self.group_maxes = group_maxes
+
+    def __getitem__(self, section):
+        if section == "group_maxes" and self.group_maxes is not None:
+            return self.get_group_maxes()
+
+        if self.excluded.get(section):
+            return SectionMaxes(self.base[section], self.group, self.excluded[section])
+
+        return self.base[section]
+
+    def __iter__(self):
+        yield from self.base
+        if self.group_maxes is not None:
+            yield "group_maxes"
+
+    def __len__(self):
+        return len(self.base) + (1 if self.group_maxes is not None else 0)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def get_group_maxes(self):
+        group_maxes = copy(self.group_maxes["shared"])
+        if self.group in group_maxes:
+            total = self.group_maxes["base"][self.group]
+            for section in self.base.keys():
+                if self.group in self.base[section]:
+                    total += self[section][self.group]
+            group_maxes[self.group] = total
+
+        return group_maxes
+
+
+def get_shared_group_maxes(scoring):
+    """
+    The group maxes for a council are the session group maxes plus the
+    section maxes. This is the same for every council apart from the
+    council's own group so work it out once.
+    """
+    if scoring.get("shared_group_maxes") is None:
+        group_maxes = deepcopy(scoring["group_maxes"])
+        for section, groups in scoring["section_maxes"].items():
+            for group, max_score in groups.items():
+                group_maxes[group] += max_score
+
+        scoring["shared_group_maxes"] = {
+            "base": scoring["group_maxes"],
+            "shared": group_maxes,
+        }
 
-        all_exceptions = set(all_exceptions)
+    return scoring["shared_group_maxes"]
+
+
+def get_maxes_for_council(scoring, group, country, council, session, response_type):
+    exception_index = get_exception_index(scoring, session, response_type)
+
+    excluded = defaultdict(list)
+    excluded_weighted = defaultdict(list)
+    for section in scoring["section_maxes"].keys():
+        all_exceptions = exception_index.get(section, group, country, council)
         for q in all_exceptions:
             try:
-                maxes[section][group] -= scoring["q_maxes"][section][q]
-                weighted_maxes[section][group] -= scoring["q_section_weighted_maxes"][
-                    section
-                ][q]
+                q_max = scoring["q_maxes"][section][q]
+                if group not in scoring["section_maxes"][section]:
+                    raise KeyError(group)
+                excluded[section].append(q_max)
+                q_weighted_max = scoring["q_section_weighted_maxes"][section][q]
+                if group not in scoring["section_weighted_maxes"][section]:
+                    raise KeyError(group)
+                excluded_weighted[section].append(q_weighted_max)
             except KeyError:
                 print(f"no question found for exception {section}, {q}")
 
-    group_maxes = deepcopy(scoring["group_maxes"])
-    for section, groups in maxes.items():
-        for group, max_score in groups.items():
-            group_maxes[group] += maxes[section][group]
-
-    maxes["group_maxes"] = group_maxes
+    maxes = CouncilMaxes(
+        scoring["section_maxes"],
+        group,
+        excluded,
+        group_maxes=get_shared_group_maxes(scoring),
+    )
+    weighted_maxes = CouncilMaxes(
+        scoring["section_weighted_maxes"], group, excluded_weighted
+    )
 
     return maxes, weighted_maxes
 
 
-def get_blank_section_scores(session):
+def get_blank_section_scores(session, authority=None):
     raw_scores = defaultdict(dict)
     weighted = defaultdict(dict)
 
@@ -361,11 +824,15 @@ def get_blank_section_scores(session):
         ).values_list("title", flat=True)
     }
 
-    for council in PublicAuthority.objects.filter(
+    councils = PublicAuthority.objects.filter(
         marking_session=session,
         questiongroup__marking_session=session,
         do_not_mark=False,
-    ).all():
+    ).order_by("pk")
+    if authority is not None:
+        councils = councils.filter(pk=authority.pk)
+
+    for council in councils:
         if council.type == "COMB":
             weighted[council.name] = ca_sections.copy()
             raw_scores[council.name] = ca_sections.copy()
@@ -385,6 +852,116 @@ def get_weighted_question_score(score, max_score, weighting):
     return percentage * weighting_to_points(weighting)
 
 
+def add_response_score(
+    scoring, session, section, score, raw_scores, weighted, score_exceptions, rt
+):
+    # skip qs in sections that are not for that council
+    if weighted[score["authority__name"]].get(section, None) is None:
+        return
+
+    if score["authority__name"] in NEW_COUNCILS.get(session.label, {}):
+        score["score"] = 0
+        score["points"] = 0
+
+    q = number_and_part(score["question__number"], score["question__number_part"])
+    q_max = scoring["q_maxes"][section][q]
+
+    exception_index = get_exception_index(scoring, session, rt)
+    if exception_index.is_exception(
+        q,
+        section,
+        scoring["council_groups"][score["authority__name"]],
+        scoring["council_countries"][score["authority__name"]],
+        scoring["councils"][score["authority__name"]],
+    ):
+        scoring_print(f"exception: {q}")
+        return
+
+    if score["score"] is None:
+        scoring_print(
+            "score is None:",
+            score["authority__name"],
+            section,
+            q,
+            score["score"],
+            q_max,
+        )
+        return
+    if scoring["negative_q"][section].get(q, None) is None and (
+        q_max is None or q_max == 0
+    ):
+        scoring_print(
+            "Max score is None or 0:",
+            score["authority__name"],
+            section,
+            q,
+            score["score"],
+            q_max,
+        )
+        return
+
+    q_score = score["score"]
+    if scoring["negative_q"][section].get(q, None) is not None:
+        if score["points"] is not None:
+            q_score = score["points"]
+        else:
+            q_score = 0
+    if (
+        score_exceptions.get(section, None) is not None
+        and score_exceptions[section].get(q, None) is not None
+    ):
+        if q_score >= score_exceptions[section][q]["points_for_max"]:
+            q_score = score_exceptions[section][q]["max_score"]
+        else:
+            q_score = 0
+
+    raw_scores[score["authority__name"]][section] += q_score
+
+    if scoring["negative_q"][section].get(q, None) is None:
+        weighted_score = get_weighted_question_score(
+            q_score, q_max, score["question__weighting"]
+        )
+    else:
+        weighted_score = q_score
+    weighted[score["authority__name"]][section] += weighted_score
+
+
+def get_section_scores_queryset(section):
+    options = (
+        Response.objects.filter(
+            response_type__type="Audit",
+            question__section=section,
+            authority__do_not_mark=False,
+        )
+        .annotate(
+            score=Subquery(
+                Option.objects.filter(
+                    Q(pk=OuterRef("option")) | Q(pk__in=OuterRef("multi_option"))
+                )
+                .values("question")
+                .annotate(total=Sum("score"))
+                .values("total")
+            )
+        )
+        .select_related("authority")
+    )
+
+    scores = (
+        options.select_related("questions")
+        .annotate(score=Sum("score"))
+        .values(
+            "points",
+            "score",
+            "authority__name",
+            "question__number",
+            "question__number_part",
+            "question__weighting",
+        )
+    )
+
+    return scores
+
+
 def get_section_scores(scoring, session):
     raw_scores, weighted = get_blank_section_scores(session)
 
@@ -392,118 +969,173 @@ def get_section_scores(scoring, session):
     rt = ResponseType.objects.get(type="Audit")
 
     for section in Section.objects.filter(marking_session=session):
-        options = (
-            Response.objects.filter(
-                response_type__type="Audit",
-                question__section=section,
-                authority__do_not_mark=False,
-            )
-            .annotate(
-                score=Subquery(
-                    Option.objects.filter(
-                        Q(pk=OuterRef("option")) | Q(pk__in=OuterRef("multi_option"))
-                    )
-                    .values("question")
-                    .annotate(total=Sum("score"))
-                    .values("total")
-                )
-            )
-            .select_related("authority")
-        )
+        scores = get_section_scores_queryset(section)
 
-        scores = (
-            options.select_related("questions")
-            .annotate(score=Sum("score"))
-            .values(
-                "points",
-                "score",
-                "authority__name",
-                "question__number",
-                "question__number_part",
-                "question__weighting",
+        for score in scores:
+            add_response_score(
+                scoring,
+                session,
+                section.title,
+                score,
+                raw_scores,
+                weighted,
+                score_exceptions,
+                rt,
             )
+
+    scoring["raw_scores"] = raw_scores
+    scoring["weighted_scores"] = weighted
+
+
+def get_grouped_scores_queryset(session):
+    """
+    Scores for every Audit response in a session in a single grouped
+    query.
+
+    Joins the option and the multi option table directly rather than
+    using a correlated subquery for each response. The score for each
+    joined row is the answer plus the multi option, counting the option
+    once if it appears in both, which matches the subquery.
+    """
+    row_score = Case(
+        When(option__isnull=True, multi_option__isnull=True, then=Value(None)),
+        When(multi_option__isnull=True, then=F("option__score")),
+        When(option__isnull=True, then=F("multi_option__score")),
+        When(multi_option=F("option"), then=F("option__score")),
+        default=F("option__score") + F("multi_option__score"),
+        output_field=IntegerField(),
+    )
+
+    return (
+        Response.objects.filter(
+            response_type__type="Audit",
+            question__section__marking_session=session,
+            authority__do_not_mark=False,
         )
+        .values(
+            "id",
+            "points",
+            "authority__name",
+            "question__section__title",
+            "question__number",
+            "question__number_part",
+            "question__weighting",
+        )
+        .annotate(score=Sum(row_score))
+        .order_by()
+    )
 
-        for score in scores:
-            # skip qs in sections that are not for that council
-            if weighted[score["authority__name"]].get(section.title, None) is None:
-                continue
 
-            if score["authority__name"] in NEW_COUNCILS.get(session.label, {}):
-                score["score"] = 0
-                score["points"] = 0
+def get_section_scores_grouped(scoring, session):
+    raw_scores, weighted = get_blank_section_scores(session)
 
-            q = number_and_part(
-                score["question__number"], score["question__number_part"]
-            )
-            q_max = scoring["q_maxes"][section.title][q]
+    score_exceptions = get_score_exceptions(session)
+    rt = ResponseType.objects.get(type="Audit")
 
-            if q_is_exception(
-                q,
-                section.title,
-                scoring["council_groups"][score["authority__name"]],
-                scoring["council_countries"][score["authority__name"]],
-                scoring["councils"][score["authority__name"]],
-                session,
-                response_type=rt,
-            ):
-                scoring_print(f"exception: {q}")
-                continue
+    for score in get_grouped_scores_queryset(session):
+        add_response_score(
+            scoring,
+            session,
+            score["question__section__title"],
+            score,
+            raw_scores,
+            weighted,
+            score_exceptions,
+            rt,
+        )
 
-            if score["score"] is None:
-                scoring_print(
-                    "score is None:",
-                    score["authority__name"],
-                    section.title,
-                    q,
-                    score["score"],
-                    q_max,
-                )
-                continue
-            if scoring["negative_q"][section.title].get(q, None) is None and (
-                q_max is None or q_max == 0
-            ):
-                scoring_print(
-                    "Max score is None or 0:",
-                    score["authority__name"],
-                    section.title,
-                    q,
-                    score["score"],
-                    q_max,
-                )
-                continue
+    scoring["raw_scores"] = raw_scores
+    scoring["weighted_scores"] = weighted
 
-            q_score = score["score"]
-            if scoring["negative_q"][section.title].get(q, None) is not None:
-                if score["points"] is not None:
-                    q_score = score["points"]
-                else:
-                    q_score = 0
-            if (
-                score_exceptions.get(section.title, None) is not None
-                and score_exceptions[section.title].get(q, None) is not None
-            ):
-                if q_score >= score_exceptions[section.title][q]["points_for_max"]:
-                    q_score = score_exceptions[section.title][q]["max_score"]
-                else:
-                    q_score = 0
 
-            raw_scores[score["authority__name"]][section.title] += q_score
+def get_section_scores_bulk(scoring, session, authority=None, section=None):
+    """
+    Produces the same results as get_section_scores but loads all the
+    Audit responses and their multi option answers in two queries and
+    adds up the scores in memory.
 
-            if scoring["negative_q"][section.title].get(q, None) is None:
-                weighted_score = get_weighted_question_score(
-                    q_score, q_max, score["question__weighting"]
-                )
-            else:
-                weighted_score = q_score
-            weighted[score["authority__name"]][section.title] += weighted_score
+    Can be limited to a single authority and section, which is what is
+    used to keep the materialised scores up to date.
+    """
+    raw_scores, weighted = get_blank_section_scores(session, authority=authority)
+
+    score_exceptions = get_score_exceptions(session)
+    rt = ResponseType.objects.get(type="Audit")
+
+    data = scoring.get("question_data")
+    if data is None:
+        data = get_question_data(session)
+        scoring["question_data"] = data
+    questions = data["questions"]
+    option_scores = data["option_scores"]
+    section_titles = dict(data["sections"])
+
+    responses = Response.objects.filter(
+        response_type__type="Audit",
+        question__section__marking_session=session,
+        authority__do_not_mark=False,
+    )
+    if authority is not None:
+        responses = responses.filter(authority=authority)
+    if section is not None:
+        responses = responses.filter(question__section=section)
+
+    multi_options = defaultdict(list)
+    multi_filter = {
+        "response__response_type__type": "Audit",
+        "response__question__section__marking_session": session,
+        "response__authority__do_not_mark": False,
+    }
+    if authority is not None:
+        multi_filter["response__authority"] = authority
+    if section is not None:
+        multi_filter["response__question__section"] = section
+    for r_id, o_id in Response.multi_option.through.objects.filter(
+        **multi_filter
+    ).values_list("response_id", "option_id"):
+        multi_options[r_id].append(o_id)
+
+    # the database version sums the option scores across every multi
+    # option row for a response so mirror that to get identical results
+    for r_id, authority, q_id, option_id, points in responses.values_list(
+        "id", "authority__name", "question_id", "option_id", "points"
+    ):
+        q = questions[q_id]
+
+        total = None
+        for multi_id in multi_options.get(r_id, [None]):
+            option_ids = {option_id, multi_id} - {None}
+            if not option_ids:
+                continue
+            row_score = sum(option_scores[o] for o in option_ids)
+            total = row_score if total is None else total + row_score
+
+        score = {
+            "points": points,
+            "score": total,
+            "authority__name": authority,
+            "question__number": q["number"],
+            "question__number_part": q["number_part"],
+            "question__weighting": q["weighting"],
+        }
+        add_response_score(
+            scoring,
+            session,
+            section_titles[q["section_id"]],
+            score,
+            raw_scores,
+            weighted,
+            score_exceptions,
+            rt,
+        )
 
     scoring["raw_scores"] = raw_scores
     scoring["weighted_scores"] = weighted
 
 
-def get_section_weighting(section, council_group, session):
-    section_weightings = get_weightings(session)
+def get_section_weighting(section, council_group, session, section_weightings=None):
+    if section_weightings is None:
+        section_weightings = get_weightings(session)
 
     if (
         section_weightings.get(section, None) is not None
@@ -519,6 +1151,7 @@ def calculate_council_totals(scoring, session, response_type):
     section_totals = defaultdict(dict)
     totals = {}
     scoring["council_maxes"] = {}
+    section_weightings = get_weightings(session)
 
     for council, raw in scoring["raw_scores"].items():
         total = 0
@@ -534,8 +1167,8 @@ def calculate_council_totals(scoring, session, response_type):
             response_type,
         )
         scoring["council_maxes"][council] = {
-            "raw": deepcopy(council_max),
-            "weighted": deepcopy(council_weighted_max),
+            "raw": council_max,
+            "weighted": council_weighted_max,
         }
 
         for section, score in raw.items():
@@ -558,7 +1191,7 @@ def calculate_council_totals(scoring, session, response_type):
                 )
 
                 weighted_score = unweighted_percentage * get_section_weighting(
-                    section, council_group, session
+                    section, council_group, session, section_weightings
                 )
                 weighted_score = round(weighted_score, 2)
 
@@ -585,7 +1218,628 @@ def calculate_council_totals(scoring, session, response_type):
     scoring["section_totals"] = section_totals
 
 
-def get_scoring_object(session, response_type="Audit"):
+def round_values(values, places=2):
+    """
+    Rounds every value in a Series to the same result as round().
+
+    np.round rounds the value scaled by 10 ** places, which can end up on
+    the other side of a half to the exact value round() looks at, so
+    anything near a half is passed to round() instead. Ints are left as
+    they are, as round() does.
+    """
+    floats = values.astype(float).to_numpy()
+    scaled = floats * 10**places
+    rounded = pd.Series(
+        np.round(floats, places).tolist(), index=values.index, dtype=object
+    )
+
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_half.any():
+        rounded[near_half] = [round(v, places) for v in values[near_half].tolist()]
+
+    if values.dtype == object:
+        is_int = values.map(type).eq(int).to_numpy()
+        rounded[is_int] = values[is_int]
+
+    return rounded
+
+
+def get_councils_frame(scoring):
+    return pd.DataFrame(
+        [
+            (
+                council,
+                scoring["council_groups"][council],
+                scoring["council_countries"][council],
+                scoring["councils"][council].type,
+            )
+            for council in scoring["raw_scores"].keys()
+        ],
+        columns=["council", "group", "country", "type"],
+    )
+
+
+def get_config_exceptions_frame(config_exceptions, sections, councils):
+    """
+    The same exceptions as get_config_exceptions but for every council
+    and section at once, as council, section, question rows.
+    """
+    by_country = []
+    by_council = []
+    for section in sections:
+        for key, value in (config_exceptions.get(section) or {}).items():
+            if isinstance(value, dict):
+                by_country += [
+                    (section, key, country, q)
+                    for country, questions in value.items()
+                    for q in questions
+                ]
+            else:
+                by_council += [(section, key, q) for q in value]
+
+    by_country = pd.DataFrame(by_country, columns=["section", "group", "country", "q"])
+    by_council = pd.DataFrame(by_council, columns=["section", "key", "q"])
+
+    exceptions = pd.concat(
+        [
+            by_country.merge(councils, on=["group", "country"]),
+            by_council.merge(councils, left_on="key", right_on="type"),
+            by_council.merge(councils, left_on="key", right_on="council"),
+        ]
+    )
+
+    return exceptions[["council", "section", "q"]]
+
+
+def get_answer_exceptions_frame(exception_index, sections, councils):
+    """
+    The same exceptions as ExceptionIndex.get_answer_exceptions but for
+    every council and section at once, as council, section, question rows.
+    """
+    columns = ["council", "section", "q"]
+
+    rules = []
+    ignore = []
+    excluded = []
+    for section, exceptions in exception_index.answer_exceptions.items():
+        if section not in sections:
+            continue
+        for rule, exception in enumerate(exceptions):
+            rules.append(
+                (
+                    section,
+                    rule,
+                    str(exception["question_number"]),
+                    exception["question_part"] or "",
+                    exception["answer"],
+                )
+            )
+            ignore += [(section, rule, q) for q in exception["ignore"]]
+            excluded += [
+                (section, rule, council)
+                for council in exception.get("councils_excluded") or []
+            ]
+
+    if not rules or not ignore:
+        return pd.DataFrame([], columns=columns)
+
+    rules = pd.DataFrame(
+        rules, columns=["section", "rule", "number", "rule_part", "answer"]
+    )
+    answers = pd.DataFrame(
+        [r for responses in exception_index.answers.values() for r in responses],
+        columns=[
+            "authority__name",
+            "authority__questiongroup_id",
+            "question__section__title",
+            "question__number",
+            "question__number_part",
+            "option__description",
+        ],
+    ).rename(
+        columns={
+            "authority__name": "council",
+            "authority__questiongroup_id": "group_id",
+            "question__section__title": "section",
+            "question__number": "number",
+            "question__number_part": "part",
+            "option__description": "description",
+        }
+    )
+    answers["number"] = answers["number"].astype(str)
+
+    # only use the answer if there is exactly one for the question and part
+    matches = rules.merge(answers, on=["section", "number"])
+    matches = matches[
+        (matches["rule_part"] == "") | (matches["part"] == matches["rule_part"])
+    ]
+    counts = matches.groupby(["section", "rule", "council"])["council"].transform(
+        "size"
+    )
+    matches = matches[(counts == 1) & (matches["description"] == matches["answer"])]
+
+    if excluded:
+        excluded = pd.DataFrame(excluded, columns=["section", "rule", "council"])
+        matches = matches.merge(excluded, how="left", indicator=True)
+        matches = matches[matches["_merge"] == "left_only"]
+
+    # the groups of the question being ignored, if there is exactly one
+    questions = pd.DataFrame(
+        [
+            (section, number, position, part)
+            for (section, number), parts in exception_index.questions.items()
+            for position, (part, groups) in enumerate(parts)
+        ],
+        columns=["section", "number", "position", "part"],
+    )
+    question_groups = pd.DataFrame(
+        [
+            (section, number, position, group)
+            for (section, number), parts in exception_index.questions.items()
+            for position, (part, groups) in enumerate(parts)
+            for group in groups
+        ],
+        columns=["section", "number", "position", "group_id"],
+    )
+
+    ignore = pd.DataFrame(ignore, columns=["section", "rule", "q"])
+    ignore[["number", "q_part"]] = ignore["q"].str.extract(r"(\d+)([a-z]?)")
+    ignore = ignore.merge(questions, on=["section", "number"])
+    ignore = ignore[(ignore["q_part"] == "") | (ignore["part"] == ignore["q_part"])]
+    counts = ignore.groupby(["section", "rule", "q"])["q"].transform("size")
+    ignore = ignore[counts == 1]
+    if matches.empty or ignore.empty or question_groups.empty:
+        return pd.DataFrame([], columns=columns)
+
+    ignore = ignore.merge(question_groups, on=["section", "number", "position"])
+
+    exceptions = matches[["section", "rule", "council", "group_id"]].merge(
+        ignore[["section", "rule", "q", "group_id"]],
+        on=["section", "rule", "group_id"],
+    )
+    exceptions = exceptions[exceptions["council"].isin(councils["council"])]
+
+    return exceptions[columns]
+
+
+def get_excluded_maxes(scoring, session, response_type, councils):
+    """
+    Returns the maxes of the questions excluded for each council, added up
+    by council and section, with the same checks as get_maxes_for_council.
+    """
+    exception_index = get_exception_index(scoring, session, response_type)
+    sections = list(scoring["section_maxes"].keys())
+
+    excluded = pd.concat(
+        [
+            get_config_exceptions_frame(
+                exception_index.config_exceptions, sections, councils
+            ),
+            get_answer_exceptions_frame(exception_index, sections, councils),
+        ]
+    ).drop_duplicates()
+    excluded = excluded.merge(councils[["council", "group"]], on="council")
+
+    q_maxes = pd.DataFrame(
+        [
+            (section, q, q_max)
+            for section, questions in scoring["q_maxes"].items()
+            for q, q_max in questions.items()
+        ],
+        columns=["section", "q", "raw"],
+        dtype=object,
+    )
+    q_weighted_maxes = pd.DataFrame(
+        [
+            (section, q, q_max)
+            for section, questions in scoring["q_section_weighted_maxes"].items()
+            for q, q_max in questions.items()
+        ],
+        columns=["section", "q", "weighted"],
+        dtype=object,
+    )
+    excluded = excluded.merge(q_maxes, how="left").merge(q_weighted_maxes, how="left")
+
+    keys = pd.MultiIndex.from_frame(excluded[["section", "group"]])
+    has_raw = excluded["raw"].notna() & keys.isin(
+        [(s, g) for s, groups in scoring["section_maxes"].items() for g in groups]
+    )
+    has_weighted = (
+        has_raw
+        & excluded["weighted"].notna()
+        & keys.isin(
+            [
+                (s, g)
+                for s, groups in scoring["section_weighted_maxes"].items()
+                for g in groups
+            ]
+        )
+    )
+    for section, q in excluded.loc[~has_weighted, ["section", "q"]].itertuples(
+        index=False
+    ):
+        print(f"no question found for exception {section}, {q}")
+
+    index = ["council", "section"]
+    return (
+        excluded[has_raw].groupby(index)["raw"].sum(),
+        excluded[has_weighted].groupby(index)["weighted"].sum(),
+    )
+
+
+def calculate_council_totals_vectorized(scoring, session, response_type):
+    """
+    Produces the same results as calculate_council_totals but works out
+    the exceptions, maxes, percentages and totals for all councils at
+    once using DataFrames with a row for each council and section.
+
+    Totals are added up a section at a time in the same order as
+    calculate_council_totals so they come out identical.
+    """
+    if not any(scoring["raw_scores"].values()):
+        calculate_council_totals(scoring, session, response_type)
+        return
+
+    councils = get_councils_frame(scoring)
+    council_order = councils["council"].tolist()
+
+    excluded_raw, excluded_weighted = get_excluded_maxes(
+        scoring, session, response_type, councils
+    )
+
+    scoring["council_maxes"] = {}
+    shared_group_maxes = get_shared_group_maxes(scoring)
+    excluded_by_council = defaultdict(lambda: (defaultdict(list), defaultdict(list)))
+    for (council, section), q_max in excluded_raw.items():
+        excluded_by_council[council][0][section].append(q_max)
+    for (council, section), q_max in excluded_weighted.items():
+        excluded_by_council[council][1][section].append(q_max)
+    for council, group in zip(council_order, councils["group"]):
+        excluded, weighted = excluded_by_council[council]
+        scoring["council_maxes"][council] = {
+            "raw": CouncilMaxes(
+                scoring["section_maxes"],
+                group,
+                excluded,
+                group_maxes=shared_group_maxes,
+            ),
+            "weighted": CouncilMaxes(
+                scoring["section_weighted_maxes"], group, weighted
+            ),
+        }
+
+    scores = pd.DataFrame(
+        [
+            (council, section, raw, scoring["weighted_scores"][council][section])
+            for council, sections in scoring["raw_scores"].items()
+            for section, raw in sections.items()
+        ],
+        columns=["council", "section", "raw", "weighted"],
+        dtype=object,
+    ).merge(councils[["council", "group"]], on="council", how="left")
+
+    base_maxes = pd.DataFrame(
+        [
+            (section, group, raw, scoring["section_weighted_maxes"][section].get(group))
+            for section, groups in scoring["section_maxes"].items()
+            for group, raw in groups.items()
+        ],
+        columns=["section", "group", "raw_max", "weighted_max"],
+        dtype=object,
+    )
+    weightings = pd.DataFrame(
+        [
+            (section, group, weighting)
+            for section, groups in get_weightings(session).items()
+            for group, weighting in (groups or {}).items()
+            if weighting is not None
+        ],
+        columns=["section", "group", "weighting"],
+        dtype=object,
+    )
+    scores = scores.merge(base_maxes, on=["section", "group"], how="left").merge(
+        weightings, on=["section", "group"], how="left"
+    )
+    scores = scores.set_index(["council", "section"])
+
+    max_raw = scores["raw_max"] - excluded_raw.reindex(scores.index, fill_value=0)
+    max_weighted = scores["weighted_max"] - excluded_weighted.reindex(
+        scores.index, fill_value=0
+    )
+
+    raw = scores["raw"].astype(float)
+    has_max = (max_raw != 0).to_numpy()
+    bad = ((raw > 0) & ~has_max).to_numpy()
+    divide_by_zero = ((raw < 0) & ~has_max).to_numpy() | (
+        has_max & (max_weighted == 0).to_numpy()
+    )
+    if bad.any() or divide_by_zero.any():
+        first = np.flatnonzero(bad | divide_by_zero)[0]
+        council, section = scores.index[first]
+        if bad[first]:
+            raise ZeroDivisionError(
+                f"Division by zero when calculating percentage score for {council}, {section}, {scores['group'].iloc[first]}"
+            )
+        raise ZeroDivisionError("division by zero")
+
+    missing = scores.loc[has_max & scores["weighting"].isna().to_numpy(), ["group"]]
+    for section, group in (
+        missing.reset_index()[["section", "group"]].drop_duplicates().to_numpy()
+    ):
+        scoring_print(f"No weighting for {section} and {group}")
+
+    percentage = raw / max_raw.where(has_max, 1).astype(float)
+    unweighted = scores["weighted"].astype(float) / max_weighted.where(
+        has_max, 1
+    ).astype(float)
+    weighted = round_values(unweighted * scores["weighting"].fillna(0).astype(float))
+
+    percentage = round_values(percentage).where(has_max, 0)
+    unweighted = round_values(unweighted).where(has_max, 0)
+    weighted = weighted.where(has_max, 0)
+    raw_weighted = round_values(scores["weighted"])
+
+    section_totals = defaultdict(dict)
+    for (council, section), values in zip(
+        scores.index,
+        zip(
+            scores["raw"].tolist(),
+            percentage.tolist(),
+            raw_weighted.tolist(),
+            unweighted.tolist(),
+            weighted.tolist(),
+        ),
+    ):
+        section_totals[council][section] = dict(
+            zip(
+                [
+                    "raw",
+                    "raw_percent",
+                    "raw_weighted",
+                    "unweighted_percentage",
+                    "weighted",
+                ],
+                values,
+            )
+        )
+
+    # add up a section at a time to match the order of additions in the loop
+    section_order = list(dict.fromkeys(scores.index.get_level_values("section")))
+    raw_wide = (
+        scores["raw"]
+        .unstack("section", fill_value=0)
+        .reindex(index=council_order, columns=section_order, fill_value=0)
+    )
+    weighted_wide = (
+        weighted.where(has_max, 0.0)
+        .astype(float)
+        .unstack("section", fill_value=0.0)
+        .reindex(index=council_order, columns=section_order, fill_value=0.0)
+    )
+    raw_total = pd.Series(0, index=council_order, dtype=object)
+    weighted_total = pd.Series(0.0, index=council_order)
+    for section in section_order:
+        raw_total = raw_total + raw_wide[section]
+        weighted_total = weighted_total + weighted_wide[section]
+
+    any_calculated = (
+        pd.Series(has_max, index=scores.index)
+        .groupby("council")
+        .any()
+        .reindex(council_order, fill_value=False)
+    )
+    weighted_total = round_values(weighted_total).where(any_calculated, 0)
+
+    groups = councils.set_index("council")["group"]
+    own_group_max = groups.map(shared_group_maxes["shared"]) - excluded_raw.groupby(
+        "council"
+    ).sum().reindex(council_order, fill_value=0)
+    has_group_max = (own_group_max > 0).to_numpy()
+    group_max = groups.map(scoring["group_maxes"]).astype(float)
+    if (has_group_max & (group_max == 0).to_numpy()).any():
+        raise ZeroDivisionError("division by zero")
+    percent_total = round_values(
+        raw_total.astype(float) / group_max.where(has_group_max, 1)
+    ).where(has_group_max, 0)
+
+    scoring["council_totals"] = {
+        council: {
+            "raw_total": total,
+            "percent_total": percent,
+            "weighted_total": weighted_sum,
+        }
+        for council, total, percent, weighted_sum in zip(
+            council_order,
+            raw_total.tolist(),
+            percent_total.tolist(),
+            weighted_total.tolist(),
+        )
+    }
+    scoring["section_totals"] = section_totals
+
+
+def get_section_scores_materialised(scoring, session):
+    """
+    Reads the section scores from the SectionScore table rather than
+    calculating them from the responses.
+    """
+    raw_scores, weighted = get_blank_section_scores(session)
+
+    scores = SectionScore.objects.filter(
+        section__marking_session=session, authority__do_not_mark=False
+    ).values_list("authority__name", "section__title", "raw", "weighted")
+
+    for authority, section, raw, weighted_score in scores:
+        if raw_scores[authority].get(section, None) is None:
+            continue
+
+        raw_scores[authority][section] = raw
+        weighted[authority][section] = weighted_score
+
+    scoring["raw_scores"] = raw_scores
+    scoring["weighted_scores"] = weighted
+
+
+# the scoring config that the materialised section scores depend on, the
+# section weightings are only applied to the totals
+MATERIALISED_SCORE_CONFIG = ["exceptions", "score_exceptions", "negative_exceptions"]
+
+
+def materialised_scores_enabled():
+    return settings.SCORING_ENGINE == "materialised"
+
+
+def get_authority_section_score(session, authority, section):
+    """
+    Calculate the raw and weighted score for one authority in one section.
+
+    Returns None for both if the section is not marked for the authority.
+    """
+    scoring = {
+        "council_groups": {authority.name: authority.questiongroup.description},
+        "council_countries": {authority.name: authority.country},
+        "councils": {authority.name: authority},
+        "exception_indexes": {
+            "Audit": ExceptionIndex(
+                session, "Audit", authority=authority, section=section
+            )
+        },
+    }
+
+    # only the maxes for the section are needed
+    get_section_maxes_bulk(scoring, session, quiet=True, section=section)
+    get_section_scores_bulk(scoring, session, authority=authority, section=section)
+
+    raw = scoring["raw_scores"][authority.name].get(section.title, None)
+    weighted = scoring["weighted_scores"][authority.name].get(section.title, None)
+
+    return raw, weighted
+
+
+def update_section_score(authority, section):
+    session = section.marking_session
+    raw, weighted = get_authority_section_score(session, authority, section)
+
+    if raw is None:
+        SectionScore.objects.filter(authority=authority, section=section).delete()
+        return None
+
+    score, _ = SectionScore.objects.update_or_create(
+        authority=authority,
+        section=section,
+        defaults={"raw": raw, "weighted": weighted},
+    )
+
+    return score
+
+
+def update_response_section_score(response):
+    if response.response_type.type != "Audit":
+        return
+
+    update_section_score(response.authority, response.question.section)
+
+
+def get_materialised_score_differences(session, scoring=None):
+    """
+    Compare the SectionScore table with a full calculation of the scores
+    and return a list of (authority, section, stored, calculated) for any
+    that do not match.
+    """
+    if scoring is None:
+        scoring = {}
+        get_section_maxes_bulk(scoring, session, quiet=True)
+        scoring.update(get_scoring_object_councils(session))
+        get_section_scores_bulk(scoring, session)
+
+    stored = {}
+    for authority, section, raw, weighted in SectionScore.objects.filter(
+        section__marking_session=session
+    ).values_list("authority__name", "section__title", "raw", "weighted"):
+        stored[(authority, section)] = (raw, weighted)
+
+    differences = []
+    for authority, sections in scoring["raw_scores"].items():
+        for section, raw in sections.items():
+            calculated = (raw, scoring["weighted_scores"][authority][section])
+            current = stored.pop((authority, section), None)
+            if current is None or not all(
+                isclose(a, b, abs_tol=1e-9) for a, b in zip(current, calculated)
+            ):
+                differences.append((authority, section, current, calculated))
+
+    for (authority, section), current in stored.items():
+        differences.append((authority, section, current, None))
+
+    return differences
+
+
+def rebuild_materialised_scores(session, section=None):
+    """
+    Recalculate the stored section scores for a session, or just one
+    section in it, e.g. after an option or question in it has changed.
+    """
+    scoring = {}
+    get_section_maxes_bulk(scoring, session, quiet=True, section=section)
+    scoring.update(get_scoring_object_councils(session))
+    get_section_scores_bulk(scoring, session, section=section)
+
+    authorities = dict(
+        PublicAuthority.objects.filter(marking_session=session).values_list(
+            "name", "id"
+        )
+    )
+    sections = dict(
+        Section.objects.filter(marking_session=session).values_list("title", "id")
+    )
+
+    scores = []
+    for authority, section_scores in scoring["raw_scores"].items():
+        for title, raw in section_scores.items():
+            if section is not None and title != section.title:
+                continue
+            scores.append(
+                SectionScore(
+                    authority_id=authorities[authority],
+                    section_id=sections[title],
+                    raw=raw,
+                    weighted=scoring["weighted_scores"][authority][title],
+                )
+            )
+
+    existing = SectionScore.objects.filter(section__marking_session=session)
+    if section is not None:
+        existing = existing.filter(section=section)
+
+    with transaction.atomic():
+        existing.delete()
+        SectionScore.objects.bulk_create(scores)
+
+    return len(scores)
+
+
+SCORING_ENGINES = {
+    "default": (get_section_maxes, get_section_scores, calculate_council_totals),
+    "bulk": (get_section_maxes_bulk, get_section_scores_bulk, calculate_council_totals),
+    "grouped": (
+        get_section_maxes_bulk,
+        get_section_scores_grouped,
+        calculate_council_totals,
+    ),
+    "vectorized": (
+        get_section_maxes_bulk,
+        get_section_scores_bulk,
+        calculate_council_totals_vectorized,
+    ),
+    "materialised": (
+        get_section_maxes_bulk,
+        get_section_scores_materialised,
+        calculate_council_totals,
+    ),
+}
+
+
+def get_scoring_object_councils(session):
     scoring = {}
 
     council_gss_map, groups, countries, types, control = PublicAuthority.maps()
@@ -600,13 +1854,47 @@ def get_scoring_object(session, response_type="Audit"):
     ):
         scoring["councils"][council.name] = council
 
-    get_section_maxes(scoring, session)
-    get_section_scores(scoring, session)
-    calculate_council_totals(scoring, session, response_type)
+    return scoring
+
+
+def get_scoring_object(session, response_type="Audit", engine=None):
+    if engine is None:
+        engine = settings.SCORING_ENGINE
+    get_maxes, get_scores, get_totals = SCORING_ENGINES[engine]
+
+    scoring = get_scoring_object_councils(session)
+
+    get_maxes(scoring, session)
+    get_scores(scoring, session)
+    get_totals(scoring, session, response_type)
 
     return scoring
 
 
+def get_multi_option_index(**filters):
+    """
+    Map of response id to a list of (option id, score, description) for
+    the multiple choice answers of all the responses matching filters,
+    loaded in one query.
+
+    Options are in the same order as response.multi_option.all(), with
+    the option id breaking any ties so the order is the same however the
+    rows are fetched.
+    """
+    through = Response.multi_option.through
+    rows = (
+        through.objects.filter(**{f"response__{k}": v for k, v in filters.items()})
+        .values_list("response_id", "option_id", "option__score", "option__description")
+        .order_by("response_id", "option__ordering", "option__score", "option_id")
+    )
+
+    index = defaultdict(list)
+    for response_id, option_id, score, description in rows:
+        index[response_id].append((option_id, score, description))
+
+    return dict(index)
+
+
 def get_duplicate_responses(session, response_type="Audit"):
     responses = (
         Response.objects.filter(
@@ -624,32 +1912,47 @@ def get_duplicate_responses(session, response_type="Audit"):
 def get_exact_duplicates(duplicates, session, response_type="Audit"):
     rt = ResponseType.objects.get(type=response_type)
 
-    potentials = {}
-    for d in duplicates:
-        rs = Response.objects.filter(
-            question_id=d["question_id"],
-            authority_id=d["authority_id"],
+    pairs = {(d["question_id"], d["authority_id"]) for d in duplicates}
+    if not pairs:
+        return []
+
+    multi_options = get_multi_option_index(
+        response_type=rt,
+        question_id__in={q for q, _ in pairs},
+        authority_id__in={a for _, a in pairs},
+    )
+
+    rs = (
+        Response.objects.filter(
             response_type=rt,
-        ).select_related("question", "authority")
+            question_id__in={q for q, _ in pairs},
+            authority_id__in={a for _, a in pairs},
+        )
+        .select_related("question", "authority")
+        .order_by("id")
+    )
 
-        for r in rs:
-            if potentials.get(r.authority.name, None) is None:
-                potentials[r.authority.name] = {}
+    potentials = {}
+    for r in rs:
+        # the question and authority lists will also match some
+        # responses that are not duplicates
+        if (r.question_id, r.authority_id) not in pairs:
+            continue
 
-            if (
-                potentials[r.authority.name].get(r.question.number_and_part, None)
-                is None
-            ):
-                potentials[r.authority.name][r.question.number_and_part] = []
+        if potentials.get(r.authority.name, None) is None:
+            potentials[r.authority.name] = {}
+
+        if potentials[r.authority.name].get(r.question.number_and_part, None) is None:
+            potentials[r.authority.name][r.question.number_and_part] = []
 
-            potentials[r.authority.name][r.question.number_and_part].append(r)
+        potentials[r.authority.name][r.question.number_and_part].append(r)
 
     dupes = []
     for authority, questions in potentials.items():
         for question, responses in questions.items():
             diff = False
             first = responses[0]
-            first_multi = sorted([o.pk for o in first.multi_option.all()])
+            first_multi = sorted(o[0] for o in multi_options.get(first.id, []))
             for response in responses:
                 for prop in [
                     "evidence",
@@ -662,18 +1965,10 @@ def get_exact_duplicates(duplicates, session, response_type="Audit"):
                     if getattr(response, prop) != getattr(first, prop):
                         diff = True
 
-                if response.option is None and first.option is not None:
-                    diff = True
-                elif response.option is not None and first.option is None:
-                    diff = True
-                elif (
-                    response.option is not None
-                    and first.option is not None
-                    and response.option.id != first.option.id
-                ):
+                if response.option_id != first.option_id:
                     diff = True
 
-                multi = sorted([o.pk for o in response.multi_option.all()])
+                multi = sorted(o[0] for o in multi_options.get(response.id, []))
                 if multi != first_multi:
                     diff = True
 
@@ -690,15 +1985,29 @@ def get_response_data(
     process_links=False,
     marking_session=None,
     is_negative=False,
+    multi_option_index=None,
+    score_exceptions=None,
 ):
+    """
+    Passing multi_option_index, from get_multi_option_index, means the
+    multiple choice answers don't need to be fetched for each response,
+    and passing score_exceptions that the config is only looked up once.
+    """
     score = 0
     answer = ""
 
-    if response.multi_count > 0:
+    if multi_option_index is not None:
+        multi = multi_option_index.get(response.id, [])
+    elif response.multi_count > 0:
+        multi = [(o.id, o.score, o.description) for o in response.multi_option.all()]
+    else:
+        multi = []
+
+    if multi:
         descs = []
-        for opt in response.multi_option.all():
-            descs.append(opt.description)
-            score += opt.score
+        for _, opt_score, description in multi:
+            descs.append(description)
+            score += opt_score
         answer = "|".join(descs)
     elif response.option is not None:
         score = response.option.score
@@ -708,7 +2017,11 @@ def get_response_data(
 
     section = response.question.section
     q = response.question.number_and_part
-    exceptions = get_score_exceptions(marking_session)
+    exceptions = {}
+    if score_exceptions is not None:
+        exceptions = score_exceptions
+    elif marking_session is not None:
+        exceptions = get_score_exceptions(marking_session)
     if (
         exceptions.get(section.title, None) is not None
         and exceptions[section.title].get(q, None) is not None
@@ -744,6 +2057,43 @@ def get_response_data(
 
 
 def get_all_question_data(scoring, marking_session=None, response_type="Audit"):
+    return list(
+        iter_all_question_data(
+            scoring, marking_session=marking_session, response_type=response_type
+        )
+    )
+
+
+def iter_with_multi_option_index(responses, chunk_size=2000):
+    """
+    Yields each response along with a multi option index for the chunk it
+    was fetched in, so only the multiple choice answers for the responses
+    currently in memory are loaded.
+    """
+    chunk = []
+    for response in responses.iterator(chunk_size=chunk_size):
+        chunk.append(response)
+        if len(chunk) == chunk_size:
+            yield from iter_chunk_with_multi_option_index(chunk)
+            chunk = []
+
+    if chunk:
+        yield from iter_chunk_with_multi_option_index(chunk)
+
+
+def iter_chunk_with_multi_option_index(chunk):
+    index = get_multi_option_index(id__in=[r.id for r in chunk])
+    for response in chunk:
+        yield response, index
+
+
+def iter_all_question_data(
+    scoring, marking_session=None, response_type="Audit", chunk_size=2000
+):
+    """
+    Yields the header and then a row for each response, fetching the
+    responses in chunks so the whole set is never held in memory.
+    """
     rt = ResponseType.objects.get(type=response_type)
     session = MarkingSession.objects.get(label=marking_session)
     responses = (
@@ -752,39 +2102,39 @@ def get_all_question_data(scoring, marking_session=None, response_type="Audit"):
             response_type=rt,
             question__section__marking_session=session,
         )
-        .annotate(multi_count=Count("multi_option__pk"))
         .order_by(
             "authority__name",
             "question__section__title",
             "question__number",
             "question__number_part",
         )
-        .select_related("question", "question__section", "authority")
+        .select_related("question", "question__section", "authority", "option")
     )
 
-    answers = [
-        [
-            "council name",
-            "local-authority-type-code",
-            "local-authority-gss-code",
-            "section",
-            "question-number",
-            "question-weighting",
-            "max_score",
-            "answer",
-            "score",
-            "evidence",
-            "page_number",
-            "public_notes",
-            "weighted_score",
-            "max_weighted_score",
-            "negatively_marked",
-        ]
+    yield [
+        "council name",
+        "local-authority-type-code",
+        "local-authority-gss-code",
+        "section",
+        "question-number",
+        "question-weighting",
+        "max_score",
+        "answer",
+        "score",
+        "evidence",
+        "page_number",
+        "public_notes",
+        "weighted_score",
+        "max_weighted_score",
+        "negatively_marked",
     ]
 
     negative_exceptions = scoring["negative_q"]
+    exception_index = get_exception_index(scoring, session, rt)
 
-    for response in responses:
+    for response, multi_option_index in iter_with_multi_option_index(
+        responses, chunk_size
+    ):
         section = response.question.section.title
         q_number = response.question.number_and_part
         council = response.authority.name
@@ -793,19 +2143,21 @@ def get_all_question_data(scoring, marking_session=None, response_type="Audit"):
         if response.authority.do_not_mark:
             continue
 
-        if q_is_exception(
+        if exception_index.is_exception(
             q_number,
             section,
             scoring["council_groups"][council],
             scoring["council_countries"][council],
             response.authority,
-            session,
-            response.response_type,
         ):
             continue
 
         q_data = get_response_data(
-            response, include_name=False, process_links=True, is_negative=is_negative
+            response,
+            include_name=False,
+            process_links=True,
+            is_negative=is_negative,
+            multi_option_index=multi_option_index,
         )
 
         try:
@@ -850,6 +2202,4 @@ def get_all_question_data(scoring, marking_session=None, response_type="Audit"):
 
         data += [weighted_score, max_weighted, negative]
 
-        answers.append(data)
-
-    return answers
+        yield data
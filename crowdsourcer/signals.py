@@ -0,0 +1,463 @@
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from crowdsourcer.marking import (
+    invalidate_assignment_progress,
+    invalidate_assignment_progress_for_question,
+    update_progress_counters,
+    update_question_progress_counters,
+    update_response_progress_counters,
+    update_section_progress_counters,
+)
+from crowdsourcer.middleware import clear_session_metadata
+from crowdsourcer.models import (
+    Assigned,
+    MarkingSession,
+    Option,
+    ProgressCounter,
+    PublicAuthority,
+    Question,
+    Response,
+    ResponseType,
+    Section,
+    SessionConfig,
+    responses_changed,
+)
+from crowdsourcer.scoring import (
+    MATERIALISED_SCORE_CONFIG,
+    clear_exception_cache,
+    materialised_scores_enabled,
+    rebuild_materialised_scores,
+    update_response_section_score,
+    update_section_score,
+)
+
+
+# these need to come before anything else that uses is_answered
+@receiver(pre_save, sender=Response)
+def set_is_answered(sender, instance, **kwargs):
+    instance.is_answered = instance.get_is_answered()
+
+
+@receiver(m2m_changed, sender=Response.multi_option.through)
+def set_is_answered_for_multi_option(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if action not in ["post_add", "post_remove", "post_clear"]:
+        return
+
+    if not reverse:
+        instance.is_answered = instance.get_is_answered()
+        Response.objects.filter(pk=instance.pk).update(is_answered=instance.is_answered)
+    elif pk_set is None:
+        Response.update_is_answered(
+            Response.objects.filter(question_id=instance.question_id)
+        )
+    else:
+        Response.update_is_answered(Response.objects.filter(pk__in=pk_set))
+
+
+@receiver(post_save, sender=Response)
+@receiver(post_delete, sender=Response)
+def update_score_for_response(sender, instance, raw=False, **kwargs):
+    # raw is set when loading fixtures
+    if raw or not materialised_scores_enabled():
+        return
+
+    update_response_section_score(instance)
+
+
+@receiver(m2m_changed, sender=Response.multi_option.through)
+def update_score_for_multi_option(sender, instance, action, reverse, **kwargs):
+    if action not in ["post_add", "post_remove", "post_clear"]:
+        return
+
+    if reverse or not materialised_scores_enabled():
+        return
+
+    update_response_section_score(instance)
+
+
+@receiver(post_save, sender=SessionConfig)
+@receiver(post_delete, sender=SessionConfig)
+def clear_cache_for_config(sender, instance, **kwargs):
+    clear_exception_cache(instance.marking_session)
+
+
+def rebuild_scores_on_commit(marking_session_id, section_id=None):
+    """
+    Rebuild the materialised scores for a session, or a section of it, once
+    the current transaction has committed. Waiting means anything deleted
+    along with the session or section has gone, and a section with no
+    Audit responses is skipped as all its scores will be 0 anyway.
+    """
+
+    def rebuild():
+        session = MarkingSession.objects.filter(pk=marking_session_id).first()
+        if session is None:
+            return
+
+        section = None
+        if section_id is not None:
+            section = Section.objects.filter(pk=section_id, marking_session=session)
+            if not Response.objects.filter(
+                question__section__in=section, response_type__type="Audit"
+            ).exists():
+                return
+            section = section.get()
+
+        rebuild_materialised_scores(session, section=section)
+
+    transaction.on_commit(rebuild)
+
+
+def rebuild_scores_for_sections(section_ids):
+    for section_id, marking_session_id in Section.objects.filter(
+        pk__in=section_ids
+    ).values_list("pk", "marking_session_id"):
+        rebuild_scores_on_commit(marking_session_id, section_id)
+
+
+@receiver(post_save, sender=SessionConfig)
+@receiver(post_delete, sender=SessionConfig)
+def update_scores_for_config(sender, instance, raw=False, **kwargs):
+    if raw or not materialised_scores_enabled():
+        return
+
+    if instance.name in MATERIALISED_SCORE_CONFIG:
+        rebuild_scores_on_commit(instance.marking_session_id)
+
+
+@receiver(post_save, sender=Option)
+def update_scores_for_option(sender, instance, created, raw=False, **kwargs):
+    if raw or not materialised_scores_enabled():
+        return
+
+    saved = getattr(instance, "_saved_score_values", None)
+    if not created and saved == instance.get_score_values():
+        return
+
+    question_ids = {instance.question_id}
+    if saved is not None:
+        question_ids.add(saved["question_id"])
+    rebuild_scores_for_sections(
+        Question.objects.filter(pk__in=question_ids).values("section_id")
+    )
+    instance._saved_score_values = instance.get_score_values()
+
+
+@receiver(post_save, sender=Question)
+def update_scores_for_question(sender, instance, created, raw=False, **kwargs):
+    # a new question has no options or responses yet
+    if created or raw or not materialised_scores_enabled():
+        return
+
+    saved = getattr(instance, "_saved_score_values", None)
+    if saved == instance.get_score_values():
+        return
+
+    section_ids = {instance.section_id}
+    if saved is not None:
+        section_ids.add(saved["section_id"])
+    rebuild_scores_for_sections(section_ids)
+    instance._saved_score_values = instance.get_score_values()
+
+
+@receiver(post_delete, sender=Option)
+@receiver(post_delete, sender=Question)
+def update_scores_for_deleted_question(sender, instance, **kwargs):
+    if not materialised_scores_enabled():
+        return
+
+    if sender is Option:
+        # the question may have been deleted too, in which case that
+        # rebuilds the section
+        rebuild_scores_for_sections(
+            Question.objects.filter(pk=instance.question_id).values("section_id")
+        )
+    else:
+        rebuild_scores_for_sections([instance.section_id])
+
+
+@receiver(m2m_changed, sender=Question.questiongroup.through)
+def update_scores_for_question_groups(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if action not in ["post_add", "post_remove", "post_clear"]:
+        return
+
+    if not materialised_scores_enabled():
+        return
+
+    if not reverse:
+        rebuild_scores_for_sections([instance.section_id])
+    elif pk_set is None:
+        rebuild_scores_for_sections(
+            Question.objects.filter(questiongroup=instance).values("section_id")
+        )
+    else:
+        rebuild_scores_for_sections(
+            Question.objects.filter(pk__in=pk_set).values("section_id")
+        )
+
+
+@receiver(post_save, sender=Response)
+@receiver(post_delete, sender=Response)
+def clear_progress_for_response(sender, instance, **kwargs):
+    # unlike the scores this also runs when loading fixtures so that any
+    # progress cached before they were loaded is not used
+    invalidate_assignment_progress_for_question(instance.question_id)
+
+
+@receiver(m2m_changed, sender=Response.multi_option.through)
+def clear_progress_for_multi_option(sender, instance, action, reverse, **kwargs):
+    if action not in ["post_add", "post_remove", "post_clear"]:
+        return
+
+    # with reverse the instance is the Option, which is in the same
+    # question as the responses
+    invalidate_assignment_progress_for_question(instance.question_id)
+
+
+@receiver(post_save, sender=Assigned)
+@receiver(post_delete, sender=Assigned)
+def clear_progress_for_assigned(sender, instance, **kwargs):
+    invalidate_assignment_progress(instance.marking_session_id)
+
+
+# The progress counters are also updated when loading fixtures as the
+# progress pages read from them.
+@receiver(post_save, sender=Response)
+def update_progress_for_response(sender, instance, created, **kwargs):
+    saved = getattr(instance, "_saved_progress", None)
+    if not created and saved == instance.get_progress_values():
+        return
+
+    cell = (instance.authority_id, instance.question_id, instance.response_type_id)
+    if saved is not None:
+        saved_cell = (
+            saved["authority_id"],
+            saved["question_id"],
+            saved["response_type_id"],
+        )
+        if saved_cell != cell:
+            update_response_progress_counters(*saved_cell)
+
+    update_response_progress_counters(*cell)
+    instance.set_saved_progress()
+
+
+@receiver(post_delete, sender=Response)
+def update_progress_for_deleted_response(sender, instance, **kwargs):
+    update_response_progress_counters(
+        instance.authority_id, instance.question_id, instance.response_type_id
+    )
+
+
+@receiver(m2m_changed, sender=Response.multi_option.through)
+def update_progress_for_multi_option(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if action not in ["post_add", "post_remove", "post_clear"]:
+        return
+
+    if not reverse:
+        update_response_progress_counters(
+            instance.authority_id, instance.question_id, instance.response_type_id
+        )
+    elif pk_set is None:
+        update_question_progress_counters([instance.question_id])
+    else:
+        cells = Response.objects.filter(pk__in=pk_set).values_list(
+            "authority_id", "question_id", "response_type_id"
+        )
+        for authority_id, question_id, response_type_id in set(cells):
+            update_response_progress_counters(
+                authority_id, question_id, response_type_id
+            )
+
+
+def update_for_changed_responses(cells):
+    """
+    Bring the progress counts, cached progress and scores back in step for
+    responses that changed without being saved, given the (authority_id,
+    question_id, response_type_id) of each of them.
+    """
+    if not cells:
+        return
+
+    question_sections = {}
+    question_sessions = {}
+    for pk, section_id, marking_session_id in Question.objects.filter(
+        pk__in={question_id for _, question_id, _ in cells}
+    ).values_list("pk", "section_id", "section__marking_session_id"):
+        question_sections[pk] = section_id
+        question_sessions[pk] = marking_session_id
+
+    updates = {}
+    for authority_id, question_id, _ in cells:
+        if authority_id is None or question_id not in question_sessions:
+            continue
+        authority_ids, section_ids = updates.setdefault(
+            question_sessions[question_id], (set(), set())
+        )
+        authority_ids.add(authority_id)
+        section_ids.add(question_sections[question_id])
+
+    for marking_session_id, (authority_ids, section_ids) in updates.items():
+        update_progress_counters(
+            marking_session_id, authority_ids=authority_ids, section_ids=section_ids
+        )
+        invalidate_assignment_progress(marking_session_id)
+
+    if not materialised_scores_enabled():
+        return
+
+    audit_ids = set(
+        ResponseType.objects.filter(type="Audit").values_list("pk", flat=True)
+    )
+    scores = {
+        (authority_id, question_sections[question_id])
+        for authority_id, question_id, response_type_id in cells
+        if response_type_id in audit_ids and question_id in question_sections
+    }
+    authorities = PublicAuthority.objects.in_bulk({a for a, _ in scores})
+    section_objects = Section.objects.select_related("marking_session").in_bulk(
+        {s for _, s in scores}
+    )
+    for authority_id, section_id in scores:
+        if authority_id in authorities:
+            update_section_score(authorities[authority_id], section_objects[section_id])
+
+
+@receiver(responses_changed, sender=Response)
+def update_for_responses_changed(sender, cells, **kwargs):
+    update_for_changed_responses(cells)
+
+
+# Deleting an option removes it from any multiple choice answers without
+# sending m2m_changed, so note which responses had it before it goes.
+@receiver(pre_delete, sender=Option)
+def remember_multi_option_responses(sender, instance, **kwargs):
+    instance._multi_option_response_ids = list(
+        Response.multi_option.through.objects.filter(option=instance).values_list(
+            "response_id", flat=True
+        )
+    )
+
+
+@receiver(post_delete, sender=Option)
+def update_multi_option_responses(sender, instance, **kwargs):
+    response_ids = getattr(instance, "_multi_option_response_ids", None)
+    if not response_ids:
+        return
+
+    responses = Response.objects.filter(pk__in=response_ids)
+    Response.update_is_answered(responses)
+    update_for_changed_responses(responses.get_cells())
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def update_progress_for_question(sender, instance, **kwargs):
+    # use the section as the question will not exist if it was deleted
+    update_section_progress_counters([instance.section_id])
+
+
+@receiver(m2m_changed, sender=Question.questiongroup.through)
+def update_progress_for_question_groups(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if action not in ["post_add", "post_remove", "post_clear"]:
+        return
+
+    if not reverse:
+        update_question_progress_counters([instance.pk])
+    elif pk_set is None:
+        update_question_progress_counters(
+            Question.objects.filter(questiongroup=instance).values("pk")
+        )
+    else:
+        update_question_progress_counters(pk_set)
+
+
+@receiver(post_save, sender=PublicAuthority)
+def update_progress_for_authority(sender, instance, created, **kwargs):
+    # new authorities are not in any sessions until they are added, which
+    # is handled below
+    if created:
+        return
+
+    saved = getattr(instance, "_saved_questiongroup_id", None)
+    if saved is not None and saved == instance.questiongroup_id:
+        return
+
+    for marking_session_id in instance.marking_session.values_list("id", flat=True):
+        update_progress_counters(marking_session_id, authority_ids=[instance.pk])
+    instance._saved_questiongroup_id = instance.questiongroup_id
+
+
+@receiver(m2m_changed, sender=PublicAuthority.marking_session.through)
+def update_progress_for_authority_sessions(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if action not in ["post_add", "post_remove", "post_clear"]:
+        return
+
+    if reverse:
+        update_progress_counters(instance.pk, authority_ids=pk_set)
+        return
+
+    # pk_set is None when clearing, when any session might be affected
+    marking_session_ids = pk_set
+    if marking_session_ids is None:
+        marking_session_ids = MarkingSession.objects.values_list("id", flat=True)
+
+    for marking_session_id in marking_session_ids:
+        update_progress_counters(marking_session_id, authority_ids=[instance.pk])
+
+
+@receiver(post_save, sender=ResponseType)
+def update_progress_for_response_type(sender, instance, created, **kwargs):
+    if not created:
+        return
+
+    # only the counters for the new response type need adding
+    for marking_session_id in MarkingSession.objects.values_list("id", flat=True):
+        update_progress_counters(marking_session_id, response_type_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Assigned)
+def update_progress_for_assigned(sender, instance, **kwargs):
+    # nothing in the counts depends on assignments, but make sure there are
+    # counters for anything newly assigned
+    if instance.section_id is None:
+        return
+
+    counters = ProgressCounter.objects.filter(section_id=instance.section_id)
+    authority_ids = None
+    if instance.authority_id is not None:
+        counters = counters.filter(authority_id=instance.authority_id)
+        authority_ids = [instance.authority_id]
+
+    if not counters.exists():
+        update_progress_counters(
+            instance.marking_session_id,
+            authority_ids=authority_ids,
+            section_ids=[instance.section_id],
+        )
+
+
+@receiver(post_save, sender=MarkingSession)
+@receiver(post_delete, sender=MarkingSession)
+@receiver(post_save, sender=ResponseType)
+@receiver(post_delete, sender=ResponseType)
+def clear_cached_sessions(sender, **kwargs):
+    clear_session_metadata()
@@ -27,7 +27,7 @@ $(function(){
       let $f = $(this);
       let name = get_name_from_input($f[0]);
       let val = $f.val();
-      if (name != "question" && name != "authority" && val) {
+      if (name != "question" && name != "authority" && name != "version" && val) {
         has_values = true;
       }
       data[name] = val;
@@ -55,6 +55,9 @@ $(function(){
     let url = url_parts.join("");
 
     $.post({ url: url, data: data, traditional: true, success: function(r_data) {
+      if (r_data.hasOwnProperty("version")) {
+        $fs.find('input[name$="-version"]').val(r_data["version"]);
+      }
       if (r_data["success"] != 1) {
         $fs.find('.form-select, .form-control, .form-check-input, input[type="hidden"]').each(function() {
           let $f = $(this);
@@ -78,6 +81,13 @@ $(function(){
 
         disable_submit_if_invalid()
       }
+    }, error: function(xhr) {
+      // someone else has saved this answer since the page was loaded
+      if (xhr.status == 409) {
+        $fs.find('.stale-answer').remove();
+        $fs.find('legend').after('<div class="stale-answer text-danger mb-3">' + xhr.responseJSON["errors"]["__all__"] + '</div>');
+        $('#save_all_answers').prop("disabled", true);
+      }
     }});
   });
 });
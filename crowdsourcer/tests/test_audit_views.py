@@ -1,16 +1,21 @@
 from unittest import skip
 
 from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from crowdsourcer.models import (
     Assigned,
     Marker,
     MarkingSession,
+    Option,
+    PublicAuthority,
     Question,
     Response,
     ResponseType,
+    Section,
 )
 
 
@@ -397,6 +402,61 @@ class TestAllAuthorityProgressView(BaseTestCase):
         self.assertEquals(context["councils"]["total"], 4)
 
 
+class TestAuditPageQueries(BaseTestCase):
+    def add_questions(self, count):
+        authority = PublicAuthority.objects.get(name="Aberdeenshire Council")
+        section = Section.objects.get(
+            title="Transport", marking_session__label="Default"
+        )
+        first_mark = ResponseType.objects.get(type="First Mark")
+        ror = ResponseType.objects.get(type="Right of Reply")
+        council = User.objects.get(username="council")
+
+        for i in range(count):
+            q = Question.objects.create(
+                section=section,
+                number=100 + i,
+                description=f"Extra question {i}",
+                question_type="multiple_choice",
+            )
+            q.questiongroup.add(authority.questiongroup)
+            options = [
+                Option.objects.create(
+                    question=q, description=f"Option {i}.{n}", score=n, ordering=n
+                )
+                for n in range(3)
+            ]
+            r = Response.objects.create(
+                authority=authority,
+                question=q,
+                user=self.user,
+                response_type=first_mark,
+            )
+            r.multi_option.set(options[:2])
+            Response.objects.create(
+                authority=authority,
+                question=q,
+                user=council,
+                response_type=ror,
+                agree_with_response=True,
+            )
+
+    def test_query_count_does_not_grow_with_questions(self):
+        url = reverse("authority_audit", args=("Aberdeenshire Council", "Transport"))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        count = len(queries)
+
+        self.add_questions(6)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(len(queries), count)
+        self.assertContains(response, "Option 5.1")
+
+
 class TestSectionProgressView(BaseTestCase):
     fixtures = [
         "authorities.json",
@@ -1,3 +1,4 @@
+import json
 import pathlib
 from datetime import datetime, timedelta
 from io import StringIO
@@ -16,7 +17,9 @@ from crowdsourcer.models import (
     Question,
     Response,
     ResponseType,
+    SectionScore,
 )
+from crowdsourcer.scoring import SCORING_ENGINES
 
 
 class BaseCommandTestCase(TestCase):
@@ -1321,3 +1324,102 @@ class ExpireAccountsWeeksAfterFirstLogin(BaseCommandTestCase):
         )
 
         self.check_accounts_count(5, 0)
+
+
+class BenchmarkScoringTestCase(BaseCommandTestCase):
+    fixtures = ["basics.json"]
+
+    options = {
+        "councils": 8,
+        "sections": 2,
+        "questions": 4,
+        "volunteers": 2,
+        "exceptions": 2,
+    }
+
+    def test_benchmark(self):
+        out, _ = self.call_command("benchmark_scoring", **self.options)
+        report = json.loads(out)
+
+        self.assertEquals(report["session"], "Benchmark")
+        self.assertEquals(report["parameters"]["councils"], 8)
+
+        names = [r["name"] for r in report["results"]]
+        for engine in SCORING_ENGINES.keys():
+            self.assertIn(f"get_scoring_object[{engine}]", names)
+        for name in [
+            "get_all_question_data",
+            "get_exact_duplicates",
+            "get_assignment_progress[First Mark]",
+            "get_assignment_progress[Audit]",
+            "get_assignment_progress_bulk[First Mark]",
+            "get_assignment_progress_bulk[Audit]",
+        ]:
+            self.assertIn(name, names)
+
+        for result in report["results"]:
+            self.assertTrue(result["queries"] > 0, result["name"])
+            self.assertTrue(result["seconds"] >= 0, result["name"])
+
+        self.assertFalse(MarkingSession.objects.filter(label="Benchmark").exists())
+
+    def test_keep_and_existing_session(self):
+        self.call_command("benchmark_scoring", keep=True, only=["x"], **self.options)
+
+        session = MarkingSession.objects.get(label="Benchmark")
+        self.assertEquals(
+            PublicAuthority.objects.filter(marking_session=session).count(), 8
+        )
+        self.assertEquals(
+            Question.objects.filter(section__marking_session=session).count(), 8
+        )
+
+        out, _ = self.call_command(
+            "benchmark_scoring",
+            session="Benchmark",
+            engine=["bulk"],
+            only=["get_scoring_object"],
+        )
+        report = json.loads(out)
+        self.assertEquals(report["parameters"], None)
+        self.assertEquals(
+            [r["name"] for r in report["results"]], ["get_scoring_object[bulk]"]
+        )
+
+    def test_existing_session_scores_untouched(self):
+        self.call_command("benchmark_scoring", keep=True, only=["x"], **self.options)
+        session = MarkingSession.objects.get(label="Benchmark")
+        self.assertFalse(
+            SectionScore.objects.filter(section__marking_session=session).exists()
+        )
+
+        out, _ = self.call_command(
+            "benchmark_scoring",
+            session="Benchmark",
+            keep=True,
+            engine=["materialised"],
+            only=["get_scoring_object"],
+        )
+        report = json.loads(out)
+        self.assertEquals(
+            [r["name"] for r in report["results"]],
+            ["get_scoring_object[materialised]"],
+        )
+        self.assertFalse(
+            SectionScore.objects.filter(section__marking_session=session).exists()
+        )
+
+    def test_explain(self):
+        out, _ = self.call_command(
+            "benchmark_scoring", explain=True, only=["x"], **self.options
+        )
+        report = json.loads(out)
+
+        self.assertEquals(
+            [e["name"] for e in report["explain"]],
+            ["get_section_scores_queryset", "get_grouped_scores_queryset"],
+        )
+        self.assertEquals(len(report["explain"][0]["queries"]), 2)
+        self.assertEquals(len(report["explain"][1]["queries"]), 1)
+        for result in report["explain"]:
+            self.assertTrue(result["total_cost"] > 0)
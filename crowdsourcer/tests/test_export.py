@@ -1,12 +1,57 @@
+import csv
 from copy import deepcopy
+from datetime import timedelta
 from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
 from unittest import mock
 
+from django.contrib.auth.models import User
 from django.core.management import call_command
-from django.test import TestCase
-
-from crowdsourcer.models import MarkingSession, Question, Response, SessionConfig
-from crowdsourcer.scoring import get_section_maxes
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+import pandas as pd
+
+from crowdsourcer.exports import EXPORTS
+from crowdsourcer.jobs import enqueue_export
+from crowdsourcer.models import (
+    ExportJob,
+    MarkingSession,
+    Option,
+    PublicAuthority,
+    Question,
+    QuestionGroup,
+    Response,
+    Section,
+    SectionScore,
+    SessionConfig,
+)
+from crowdsourcer.scoring import (
+    ExceptionIndex,
+    clear_exception_cache,
+    get_all_question_data,
+    get_answer_exceptions_frame,
+    get_config_exceptions_frame,
+    get_councils_frame,
+    get_duplicate_responses,
+    get_exact_duplicates,
+    get_exceptions,
+    get_multi_option_index,
+    get_question_data,
+    get_response_data,
+    get_score_exceptions,
+    get_scoring_object,
+    get_scoring_object_councils,
+    get_section_maxes,
+    get_section_maxes_bulk,
+    get_section_scores,
+    iter_all_question_data,
+    q_is_exception,
+)
 
 SECTION_WEIGHTINGS = {
     "Buildings & Heating": {
@@ -1836,3 +1881,1094 @@ class ExportSecondSessionTestCase(BaseCommandTestCase):
 
         self.assertEquals(raw, self.expected_raw)
         self.assertEquals(percent, self.expected_percent)
+
+
+class BulkScoringEngineTestCase(BaseCommandTestCase):
+    fixtures = [
+        "authorities.json",
+        "authorities_ca.json",
+        "basics.json",
+        "ca_sections.json",
+        "users.json",
+        "questions.json",
+        "options.json",
+        "ca_questions.json",
+        "negative_questions.json",
+        "audit_marking_many_marks.json",
+        "audit_ca_marks.json",
+    ]
+
+    scoring_keys = [
+        "section_maxes",
+        "group_maxes",
+        "q_maxes",
+        "section_weighted_maxes",
+        "q_section_weighted_maxes",
+        "negative_q",
+        "raw_scores",
+        "weighted_scores",
+        "section_totals",
+        "council_totals",
+        "council_maxes",
+    ]
+
+    def assertEnginesMatch(self, engine):
+        clear_exception_cache()
+        expected = get_scoring_object(self.session, engine="default")
+        clear_exception_cache()
+        scoring = get_scoring_object(self.session, engine=engine)
+
+        for key in self.scoring_keys:
+            self.assertEquals(scoring[key], expected[key], key)
+
+        # compare types and ordering as well so the exported files match
+        for key in ["raw_scores", "council_totals", "section_totals", "council_maxes"]:
+            self.assertEquals(repr(scoring[key]), repr(expected[key]), key)
+
+    def test_max_calculation(self):
+        expected = {}
+        get_section_maxes(expected, self.session)
+        scoring = {}
+        get_section_maxes_bulk(scoring, self.session)
+
+        for key in [
+            "section_maxes",
+            "group_maxes",
+            "q_maxes",
+            "section_weighted_maxes",
+            "q_section_weighted_maxes",
+            "negative_q",
+        ]:
+            self.assertEquals(scoring[key], expected[key], key)
+
+    def test_bulk_matches_default(self):
+        self.assertEnginesMatch("bulk")
+
+    def test_vectorized_matches_default(self):
+        self.assertEnginesMatch("vectorized")
+
+    def test_grouped_matches_default(self):
+        self.assertEnginesMatch("grouped")
+
+    def test_engines_match_default_with_duplicates(self):
+        SessionConfig.objects.filter(
+            marking_session=self.session, name="score_exceptions"
+        ).update(json_value={"Transport": {"2": {"max_score": 1, "points_for_max": 4}}})
+
+        # a response with both an option and multi options
+        r = Response.objects.get(pk=14)
+        r.option_id = 161
+        r.save()
+
+        # duplicate responses for the same question and council
+        for pk in [10, 14]:
+            r = Response.objects.get(pk=pk)
+            multi = list(r.multi_option.all())
+            r.pk = None
+            r.save()
+            r.multi_option.set(multi[:1])
+
+        for engine in ["bulk", "grouped", "vectorized"]:
+            self.assertEnginesMatch(engine)
+
+    def test_bulk_matches_default_with_exceptions(self):
+        SessionConfig.objects.filter(
+            marking_session=self.session, name="exceptions"
+        ).update(
+            json_value={
+                **EXCEPTIONS,
+                "answer_exceptions": {
+                    "Buildings & Heating": [
+                        {
+                            "question_number": "4",
+                            "question_part": None,
+                            "answer": "None",
+                            "ignore": ["4", "5"],
+                        }
+                    ]
+                },
+            }
+        )
+        SessionConfig.objects.filter(
+            marking_session=self.session, name="score_exceptions"
+        ).update(json_value=SCORE_EXCEPTIONS)
+        SessionConfig.objects.create(
+            marking_session=self.session,
+            config_type="json",
+            name="negative_exceptions",
+            json_value={"Buildings & Heating": ["5"]},
+        )
+
+        self.assertEnginesMatch("bulk")
+        self.assertEnginesMatch("grouped")
+        self.assertEnginesMatch("vectorized")
+
+    @mock.patch("crowdsourcer.management.commands.export_marks.Command.write_files")
+    def test_export_with_engine(self, write_mock):
+        self.call_command("export_marks", session="Default")
+        expected = write_mock.call_args[0]
+
+        self.call_command("export_marks", session="Default", engine="bulk")
+        self.assertEquals(write_mock.call_args[0], expected)
+
+        self.call_command("export_marks", session="Default", engine="grouped")
+        self.assertEquals(write_mock.call_args[0], expected)
+
+        self.call_command("export_marks", session="Default", engine="vectorized")
+        self.assertEquals(write_mock.call_args[0], expected)
+
+    def test_query_count_independent_of_sections(self):
+        clear_exception_cache()
+        with CaptureQueriesContext(connection) as queries:
+            get_scoring_object(self.session, engine="bulk")
+        count = len(queries)
+
+        groups = QuestionGroup.objects.all()
+        for i in range(5):
+            section = Section.objects.create(
+                title=f"Extra Section {i}", marking_session=self.session
+            )
+            for number in range(1, 4):
+                q = Question.objects.create(
+                    number=number,
+                    section=section,
+                    description=f"Extra question {number}",
+                    question_type="select_one",
+                )
+                q.questiongroup.set(groups)
+                Option.objects.create(question=q, description="Yes", score=1)
+                Option.objects.create(question=q, description="No", score=0)
+
+        clear_exception_cache()
+        with CaptureQueriesContext(connection) as queries:
+            get_scoring_object(self.session, engine="bulk")
+
+        self.assertEquals(len(queries), count)
+
+
+class ExceptionIndexTestCase(BaseCommandTestCase):
+    fixtures = [
+        "authorities.json",
+        "basics.json",
+        "users.json",
+        "questions.json",
+        "options.json",
+        "audit_responses.json",
+    ]
+
+    def setUp(self):
+        super().setUp()
+        SessionConfig.objects.filter(
+            marking_session=self.session, name="exceptions"
+        ).update(
+            json_value={
+                **EXCEPTIONS,
+                "answer_exceptions": {
+                    "Buildings & Heating": [
+                        {
+                            "question_number": "4",
+                            "question_part": None,
+                            "answer": "None",
+                            "ignore": ["4", "5"],
+                        }
+                    ]
+                },
+            }
+        )
+        r = Response.objects.get(question_id=272, authority_id=1)
+        r.option_id = 4
+        r.save()
+        clear_exception_cache()
+
+    def test_matches_q_is_exception(self):
+        scoring = {}
+        get_section_maxes(scoring, self.session)
+        scoring["council_gss_map"], groups, countries, _, _ = PublicAuthority.maps()
+
+        index = ExceptionIndex(self.session, "Audit")
+        exceptions_found = 0
+        for council in PublicAuthority.objects.filter(do_not_mark=False):
+            for section, questions in scoring["q_maxes"].items():
+                for q in questions.keys():
+                    args = [
+                        q,
+                        section,
+                        groups[council.name],
+                        countries[council.name],
+                        council,
+                    ]
+                    expected = q_is_exception(*args, self.session, "Audit")
+                    self.assertEquals(index.is_exception(*args), expected)
+                    if expected:
+                        exceptions_found += 1
+
+        self.assertTrue(exceptions_found > 0)
+
+    def test_frames_match_index(self):
+        scoring = get_scoring_object_councils(self.session)
+        get_section_maxes(scoring, self.session)
+        get_section_scores(scoring, self.session)
+        councils = get_councils_frame(scoring)
+        sections = list(scoring["section_maxes"].keys())
+
+        index = ExceptionIndex(self.session, "Audit")
+        expected = set()
+        for council in councils.itertuples():
+            for section in sections:
+                for q in index.get(
+                    section,
+                    council.group,
+                    council.country,
+                    scoring["councils"][council.council],
+                ):
+                    expected.add((council.council, section, q))
+
+        exceptions = pd.concat(
+            [
+                get_config_exceptions_frame(
+                    index.config_exceptions, sections, councils
+                ),
+                get_answer_exceptions_frame(index, sections, councils),
+            ]
+        )
+        found = set(exceptions.itertuples(index=False, name=None))
+
+        self.assertEquals(found, expected)
+        self.assertIn(("Aberdeen City Council", "Buildings & Heating", "5"), expected)
+
+    def test_query_count(self):
+        _, groups, countries, _, _ = PublicAuthority.maps()
+        councils = list(PublicAuthority.objects.filter(do_not_mark=False))
+        sections = [
+            s.title for s in Section.objects.filter(marking_session=self.session)
+        ]
+
+        # load the exceptions config so only the version and the index
+        # queries are counted
+        ExceptionIndex(self.session, "Audit")
+        with CaptureQueriesContext(connection) as queries:
+            index = ExceptionIndex(self.session, "Audit")
+            for council in councils:
+                for section in sections:
+                    index.is_exception(
+                        "4",
+                        section,
+                        groups[council.name],
+                        countries[council.name],
+                        council,
+                    )
+
+        self.assertEquals(len(queries), 4)
+
+
+@override_settings(SCORING_ENGINE="materialised")
+class MaterialisedScoresTestCase(BaseCommandTestCase):
+    fixtures = [
+        "authorities.json",
+        "basics.json",
+        "users.json",
+        "questions.json",
+        "options.json",
+        "audit_marking_many_marks.json",
+    ]
+
+    def assertMatchesFullCalculation(self):
+        expected = get_scoring_object(self.session, engine="bulk")
+        scoring = get_scoring_object(self.session, engine="materialised")
+
+        for key in ["raw_scores", "council_totals", "section_totals", "council_maxes"]:
+            self.assertEquals(scoring[key], expected[key], key)
+
+        out = self.call_command("materialise_scores", session="Default", check=True)
+        self.assertEquals(out, "All section scores match\n")
+
+    def test_rebuild(self):
+        out = self.call_command("materialise_scores", session="Default", check=True)
+        self.assertRegex(out, r"\d+ section scores do not match")
+
+        self.call_command("materialise_scores", session="Default")
+        self.assertTrue(SectionScore.objects.count() > 0)
+
+        self.assertMatchesFullCalculation()
+
+    def test_updated_on_save(self):
+        self.call_command("materialise_scores", session="Default")
+
+        score = SectionScore.objects.get(
+            authority_id=1, section__title="Buildings & Heating"
+        )
+        old_raw = score.raw
+
+        r = Response.objects.get(pk=10)
+        r.option_id = 3
+        r.save()
+
+        score.refresh_from_db()
+        self.assertEquals(score.raw, old_raw + 1)
+        self.assertMatchesFullCalculation()
+
+    def test_updated_on_option_change(self):
+        self.call_command("materialise_scores", session="Default")
+
+        option = Response.objects.get(pk=10).option
+        with self.captureOnCommitCallbacks(execute=True):
+            option.score = option.score + 2
+            option.save()
+        self.assertMatchesFullCalculation()
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            option.save()
+        self.assertEquals(callbacks, [])
+
+    def test_updated_on_question_change(self):
+        self.call_command("materialise_scores", session="Default")
+
+        question = Response.objects.get(pk=10).question
+        with self.captureOnCommitCallbacks(execute=True):
+            question.weighting = "high"
+            question.save()
+        self.assertMatchesFullCalculation()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            question.questiongroup.remove(question.questiongroup.first())
+        self.assertMatchesFullCalculation()
+
+    def test_updated_on_config_change(self):
+        self.call_command("materialise_scores", session="Default")
+
+        question = Response.objects.get(pk=10).question
+        config = SessionConfig.objects.get(
+            marking_session=self.session, name="score_exceptions"
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            config.json_value = {
+                question.section.title: {
+                    question.number_and_part: {"max_score": 1, "points_for_max": 1}
+                }
+            }
+            config.save()
+        self.assertMatchesFullCalculation()
+
+    def test_updated_on_queryset_update(self):
+        self.call_command("materialise_scores", session="Default")
+
+        score = SectionScore.objects.get(
+            authority_id=1, section__title="Buildings & Heating"
+        )
+        old_raw = score.raw
+
+        Response.objects.filter(pk=10).update(option_id=3)
+
+        score.refresh_from_db()
+        self.assertEquals(score.raw, old_raw + 1)
+        self.assertMatchesFullCalculation()
+
+    def test_updated_on_multi_option_change(self):
+        self.call_command("materialise_scores", session="Default")
+
+        score = SectionScore.objects.get(authority_id=3, section__title="Transport")
+        old_raw = score.raw
+
+        r = Response.objects.get(pk=14)
+        r.multi_option.add(163)
+
+        score.refresh_from_db()
+        self.assertEquals(score.raw, old_raw + 1)
+        self.assertMatchesFullCalculation()
+
+        r.multi_option.clear()
+
+        score.refresh_from_db()
+        self.assertEquals(score.raw, old_raw - 2)
+        self.assertMatchesFullCalculation()
+
+    def test_updated_on_delete(self):
+        self.call_command("materialise_scores", session="Default")
+
+        Response.objects.get(pk=10).delete()
+        self.assertMatchesFullCalculation()
+
+    def test_update_only_loads_section(self):
+        self.call_command("materialise_scores", session="Default")
+
+        r = Response.objects.get(pk=10)
+        r.option_id = 3
+        with mock.patch(
+            "crowdsourcer.scoring.get_question_data", wraps=get_question_data
+        ) as question_data:
+            r.save()
+
+        question_data.assert_called_once_with(
+            r.question.section.marking_session, section=r.question.section
+        )
+        self.assertMatchesFullCalculation()
+
+    @override_settings(SCORING_ENGINE="default")
+    def test_not_updated_for_other_engines(self):
+        SectionScore.objects.all().delete()
+
+        r = Response.objects.get(pk=10)
+        r.option_id = 3
+        r.save()
+
+        self.assertEquals(SectionScore.objects.count(), 0)
+
+
+class CouncilMaxesTestCase(BaseCommandTestCase):
+    fixtures = [
+        "authorities.json",
+        "basics.json",
+        "users.json",
+        "questions.json",
+        "options.json",
+        "audit_responses.json",
+    ]
+
+    def setUp(self):
+        super().setUp()
+        SessionConfig.objects.filter(
+            marking_session=self.session, name="exceptions"
+        ).update(json_value={"Transport": {"Aberdeen City Council": ["1", "2"]}})
+        clear_exception_cache()
+
+    def test_council_maxes_share_base(self):
+        scoring = get_scoring_object(self.session)
+        section_maxes = scoring["section_maxes"]
+        q_maxes = scoring["q_maxes"]
+
+        adur = scoring["council_maxes"]["Adur District Council"]
+        for section in section_maxes.keys():
+            self.assertIs(adur["raw"][section], section_maxes[section])
+            self.assertIs(
+                adur["weighted"][section], scoring["section_weighted_maxes"][section]
+            )
+
+        aberdeen = scoring["council_maxes"]["Aberdeen City Council"]["raw"]
+        self.assertIs(
+            aberdeen["Governance & Finance"], section_maxes["Governance & Finance"]
+        )
+        self.assertEquals(
+            aberdeen["Transport"]["Single Tier"],
+            section_maxes["Transport"]["Single Tier"]
+            - q_maxes["Transport"]["1"]
+            - q_maxes["Transport"]["2"],
+        )
+        self.assertEquals(
+            aberdeen["Transport"]["District"], section_maxes["Transport"]["District"]
+        )
+        self.assertEquals(
+            dict(aberdeen["Transport"]).keys(), section_maxes["Transport"].keys()
+        )
+
+        group_maxes = aberdeen["group_maxes"]
+        self.assertEquals(
+            group_maxes["Single Tier"],
+            scoring["group_maxes"]["Single Tier"]
+            + sum(aberdeen[s]["Single Tier"] for s in section_maxes.keys()),
+        )
+        self.assertEquals(
+            group_maxes["District"], adur["raw"]["group_maxes"]["District"]
+        )
+
+
+class ConfigCacheTestCase(BaseCommandTestCase):
+    fixtures = [
+        "basics.json",
+    ]
+
+    def setUp(self):
+        super().setUp()
+        clear_exception_cache()
+
+    def get_session(self):
+        return MarkingSession.objects.get(label="Default")
+
+    def test_cached_for_instance(self):
+        session = self.get_session()
+        self.assertEquals(get_score_exceptions(session), {})
+        self.assertEquals(get_exceptions(session), {})
+
+        # only the version is looked up each time
+        with self.assertNumQueries(2):
+            self.assertEquals(get_score_exceptions(session), {})
+            self.assertEquals(get_exceptions(session), {})
+
+    def test_cached_between_instances(self):
+        get_score_exceptions(self.get_session())
+
+        session = self.get_session()
+        # only the version is looked up
+        with self.assertNumQueries(1):
+            self.assertEquals(get_score_exceptions(session), {})
+
+    def test_updated_when_config_saved(self):
+        session = self.get_session()
+        self.assertEquals(get_score_exceptions(session), {})
+
+        c = SessionConfig.objects.get(marking_session=session, name="score_exceptions")
+        c.json_value = {"Transport": {"2": {"max_score": 1, "points_for_max": 2}}}
+        c.save()
+
+        self.assertEquals(
+            get_score_exceptions(session),
+            {"Transport": {"2": {"max_score": 1, "points_for_max": 2}}},
+        )
+        self.assertEquals(
+            get_score_exceptions(self.get_session()),
+            {"Transport": {"2": {"max_score": 1, "points_for_max": 2}}},
+        )
+
+    def test_updated_when_config_deleted(self):
+        SessionConfig.objects.filter(
+            marking_session=self.session, name="score_exceptions"
+        ).update(json_value={"Transport": {}})
+        clear_exception_cache()
+
+        self.assertEquals(get_score_exceptions(self.get_session()), {"Transport": {}})
+
+        SessionConfig.objects.get(
+            marking_session=self.session, name="score_exceptions"
+        ).delete()
+
+        self.assertEquals(get_score_exceptions(self.get_session()), {})
+
+    def test_updated_without_invalidation(self):
+        session = self.get_session()
+        self.assertEquals(get_score_exceptions(session), {})
+
+        # as if the change was made by another worker, which would not
+        # have cleared the cache in this process
+        with mock.patch("crowdsourcer.signals.clear_exception_cache"):
+            c = SessionConfig.objects.get(
+                marking_session=session, name="score_exceptions"
+            )
+            c.json_value = {"Transport": {}}
+            c.save()
+
+        self.assertEquals(get_score_exceptions(session), {"Transport": {}})
+
+    def test_sessions_cached_separately(self):
+        second = MarkingSession.objects.get(label="Second Session")
+        SessionConfig.objects.create(
+            marking_session=second,
+            name="score_exceptions",
+            config_type="json",
+            json_value={"Transport": {}},
+        )
+
+        self.assertEquals(get_score_exceptions(self.get_session()), {})
+        self.assertEquals(get_score_exceptions(second), {"Transport": {}})
+
+
+class AllAnswerDataTestCase(BaseCommandTestCase):
+    fixtures = [
+        "authorities.json",
+        "basics.json",
+        "users.json",
+        "questions.json",
+        "options.json",
+        "audit_responses.json",
+    ]
+
+    def test_iter_matches_list(self):
+        scoring = get_scoring_object(self.session)
+        rows = iter_all_question_data(scoring, marking_session="Default")
+        self.assertFalse(isinstance(rows, list))
+
+        answers = get_all_question_data(scoring, marking_session="Default")
+        self.assertEquals(list(rows), answers)
+        self.assertEquals(answers[0][0], "council name")
+        self.assertEquals(len(answers), 8)
+
+    def test_view_streams(self):
+        self.client.force_login(User.objects.get(username="admin"))
+        response = self.client.get(reverse("all_answers_csv"))
+        self.assertEquals(response.status_code, 200)
+        self.assertTrue(response.streaming)
+
+        content = b"".join(response.streaming_content).decode("utf-8")
+        rows = list(csv.reader(StringIO(content)))
+
+        scoring = get_scoring_object(self.session)
+        expected = get_all_question_data(scoring, marking_session="Default")
+        self.assertEquals(rows, [[str(v) for v in row] for row in expected])
+
+    def test_export_writes_answers(self):
+        scoring = get_scoring_object(self.session)
+        answers = get_all_question_data(scoring, marking_session="Default")
+
+        # what the file looked like when it was written using pandas
+        df = pd.DataFrame(answers)
+        df = df.rename(columns=df.iloc[0]).drop(df.index[0])
+        df = df.set_index("council name")
+        expected = df.to_csv()
+
+        with TemporaryDirectory() as tmp:
+            (Path(tmp) / "data").mkdir()
+            with override_settings(BASE_DIR=Path(tmp)):
+                self.call_command(
+                    "export_marks", session="Default", output_answers=True
+                )
+
+            with open(Path(tmp) / "data" / "default" / "all_answer_data.csv") as fp:
+                self.assertEquals(fp.read(), expected)
+
+
+class MultiOptionIndexTestCase(BaseCommandTestCase):
+    fixtures = [
+        "authorities.json",
+        "basics.json",
+        "users.json",
+        "questions.json",
+        "options.json",
+        "audit_responses.json",
+    ]
+
+    def set_multi(self, pk, options):
+        r = Response.objects.get(pk=pk)
+        r.option = None
+        r.save()
+        r.multi_option.set(options)
+        return r
+
+    def add_multi_responses(self):
+        for authority in [1, 3]:
+            r = Response.objects.get(pk=9)
+            r.pk = None
+            r.authority_id = authority
+            r.option = None
+            r.save()
+            r.multi_option.set([163, 164, 165])
+
+    def count_queries(self, fn):
+        with CaptureQueriesContext(connection) as queries:
+            fn()
+        return len(queries)
+
+    def test_index(self):
+        self.set_multi(9, [163, 162])
+
+        index = get_multi_option_index(question__section__marking_session=self.session)
+        self.assertEquals(
+            index,
+            {
+                9: [
+                    (162, 1, Option.objects.get(pk=162).description),
+                    (163, 1, Option.objects.get(pk=163).description),
+                ]
+            },
+        )
+
+        index = get_multi_option_index(response_type__type="First Mark")
+        self.assertEquals(index, {})
+
+    def test_response_data(self):
+        self.set_multi(9, [162, 163])
+        index = get_multi_option_index(question__section__marking_session=self.session)
+        exceptions = get_score_exceptions(self.session)
+
+        r = Response.objects.select_related(
+            "question__section", "authority", "option"
+        ).get(pk=9)
+        with self.assertNumQueries(0):
+            data = get_response_data(
+                r,
+                marking_session=self.session,
+                multi_option_index=index,
+                score_exceptions=exceptions,
+            )
+
+        descs = [Option.objects.get(pk=pk).description for pk in [162, 163]]
+        self.assertEquals(data[0:3], ["Aberdeenshire Council", "|".join(descs), 2])
+
+        # falls back to loading the options
+        r.multi_count = 2
+        self.assertEquals(get_response_data(r, marking_session=self.session), data)
+
+    def test_all_question_data_queries(self):
+        self.set_multi(9, [162, 163])
+        scoring = get_scoring_object(self.session)
+
+        count = self.count_queries(
+            lambda: get_all_question_data(scoring, marking_session="Default")
+        )
+        self.add_multi_responses()
+        self.assertEquals(
+            self.count_queries(
+                lambda: get_all_question_data(scoring, marking_session="Default")
+            ),
+            count,
+        )
+
+    def test_all_question_data_chunks(self):
+        self.set_multi(9, [162, 163])
+        self.add_multi_responses()
+        scoring = get_scoring_object(self.session)
+        expected = get_all_question_data(scoring, marking_session="Default")
+
+        with mock.patch(
+            "crowdsourcer.scoring.get_multi_option_index",
+            wraps=get_multi_option_index,
+        ) as index:
+            rows = list(
+                iter_all_question_data(scoring, marking_session="Default", chunk_size=3)
+            )
+
+        self.assertEquals(rows, expected)
+        self.assertEquals(index.call_count, 3)
+        for call in index.call_args_list:
+            self.assertTrue(len(call.kwargs["id__in"]) <= 3)
+
+    def test_exact_duplicates_queries(self):
+        self.set_multi(9, [162, 163])
+
+        def duplicate(pk):
+            r = Response.objects.get(pk=pk)
+            multi = list(r.multi_option.all())
+            r.pk = None
+            r.save()
+            r.multi_option.set(multi)
+            return r
+
+        first = duplicate(9)
+        dupes = get_exact_duplicates(
+            get_duplicate_responses(self.session), self.session
+        )
+        self.assertEquals([[r.pk for r in d] for d in dupes], [[first.pk]])
+
+        count = self.count_queries(
+            lambda: get_exact_duplicates(
+                get_duplicate_responses(self.session), self.session
+            )
+        )
+
+        second = duplicate(13)
+        different = duplicate(10)
+        different.option_id = 3
+        different.save()
+
+        with self.assertNumQueries(count):
+            dupes = get_exact_duplicates(
+                get_duplicate_responses(self.session), self.session
+            )
+        self.assertEquals(
+            sorted([r.pk for r in d] for d in dupes), [[first.pk], [second.pk]]
+        )
+
+    def test_views_queries(self):
+        self.client.force_login(User.objects.get(username="admin"))
+        self.set_multi(9, [162, 163])
+
+        for url in [
+            reverse("all_audit_marks_csv"),
+            reverse("question_data_csv", args=("audit", "Transport", "2")),
+        ]:
+            # make sure the scoring config is cached
+            self.client.get(url)
+
+            count = self.count_queries(lambda: self.client.get(url))
+            self.add_multi_responses()
+            self.assertEquals(self.count_queries(lambda: self.client.get(url)), count)
+            Response.objects.filter(question_id=282, authority_id__in=[1, 3]).exclude(
+                pk=13
+            ).delete()
+
+    def test_question_data_csv(self):
+        self.client.force_login(User.objects.get(username="admin"))
+        self.set_multi(9, [162, 163])
+
+        response = self.client.get(
+            reverse("question_data_csv", args=("audit", "Transport", "2"))
+        )
+        rows = list(csv.reader(StringIO(response.content.decode("utf-8"))))
+        descs = [Option.objects.get(pk=pk).description for pk in [162, 163]]
+        self.assertEquals(rows[2][0:3], ["Aberdeenshire Council", "|".join(descs), "2"])
+
+
+class ExportJobTestCase(BaseCommandTestCase):
+    fixtures = [
+        "authorities.json",
+        "basics.json",
+        "users.json",
+        "questions.json",
+        "options.json",
+        "audit_responses.json",
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = TemporaryDirectory()
+        self.settings_override = override_settings(EXPORT_DIR=Path(self.tmp.name))
+        self.settings_override.enable()
+        self.client.force_login(User.objects.get(username="admin"))
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmp.cleanup()
+
+    def run_jobs(self):
+        out = StringIO()
+        call_command("run_export_jobs", once=True, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_requests_share_a_job(self):
+        first = enqueue_export(self.session, "weighted_totals")
+        second = enqueue_export(self.session, "weighted_totals")
+        self.assertEquals(first.id, second.id)
+
+        other = enqueue_export(self.session, "raw_and_weighted_totals")
+        self.assertNotEquals(first.id, other.id)
+
+        url = reverse("export_job", args=("weighted_totals",))
+        for _ in range(3):
+            response = self.client.post(url)
+            self.assertEquals(response.status_code, 302)
+
+        self.assertEquals(ExportJob.objects.filter(export="weighted_totals").count(), 1)
+
+    def test_only_one_active_job(self):
+        ExportJob.objects.create(marking_session=self.session, export="weighted_totals")
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                ExportJob.objects.create(
+                    marking_session=self.session,
+                    export="weighted_totals",
+                    status="running",
+                )
+
+    def test_unknown_export(self):
+        with self.assertRaises(ValueError):
+            enqueue_export(self.session, "not_an_export")
+
+        response = self.client.get(reverse("export_job", args=("not_an_export",)))
+        self.assertEquals(response.status_code, 404)
+
+    def test_non_admin_denied(self):
+        self.client.force_login(User.objects.get(username="marker"))
+        url = reverse("export_job", args=("weighted_totals",))
+        self.assertEquals(self.client.get(url).status_code, 403)
+        self.assertEquals(self.client.post(url).status_code, 403)
+        self.assertFalse(ExportJob.objects.exists())
+
+    def test_run_and_download(self):
+        url = reverse("export_job", args=("all_answer_data_audit",))
+        self.client.post(url)
+
+        response = self.client.get(url)
+        self.assertEquals(response.context["job"].status, "pending")
+        self.assertIsNone(response.context["last_complete"])
+
+        self.run_jobs()
+
+        job = ExportJob.objects.get()
+        self.assertEquals(job.status, "complete")
+        self.assertEquals(job.rows_written, 8)
+        self.assertTrue(job.file_path.startswith(self.tmp.name))
+
+        response = self.client.get(url)
+        self.assertIsNone(response.context["job"])
+        self.assertEquals(response.context["last_complete"], job)
+
+        response = self.client.get(reverse("export_job_download", args=(job.id,)))
+        self.assertEquals(response.status_code, 200)
+        self.assertIn("all_answer_data.csv", response["Content-Disposition"])
+        content = b"".join(response.streaming_content).decode("utf-8")
+        rows = list(csv.reader(StringIO(content)))
+
+        scoring = get_scoring_object(self.session)
+        expected = get_all_question_data(scoring, marking_session="Default")
+        self.assertEquals(rows, [[str(v) for v in row] for row in expected])
+
+    def test_matches_views(self):
+        for export, view in [
+            ("weighted_totals", "weighted_totals_csv"),
+            ("raw_and_weighted_totals", "raw_and_weighted_totals_csv"),
+        ]:
+            enqueue_export(self.session, export)
+            self.run_jobs()
+            job = ExportJob.objects.get(export=export)
+
+            response = self.client.get(reverse(view))
+            with open(job.file_path, newline="") as fp:
+                self.assertEquals(fp.read(), response.content.decode("utf-8"))
+
+    def read_job_rows(self, export):
+        job = ExportJob.objects.filter(export=export).latest("created")
+        self.assertEquals(job.status, "complete", job.error)
+        with open(job.file_path, newline="") as fp:
+            return list(csv.reader(fp))
+
+    def test_duplicate_responses(self):
+        def duplicate(pk):
+            r = Response.objects.get(pk=pk)
+            r.pk = None
+            r.save()
+            return r
+
+        exact = duplicate(10)
+        different = duplicate(11)
+        different.page_number = "12"
+        different.save()
+
+        enqueue_export(self.session, "duplicate_responses_audit")
+        self.run_jobs()
+        rows = self.read_job_rows("duplicate_responses_audit")
+
+        self.assertEquals(
+            rows[0][0:4], ["authority", "section", "question", "response id"]
+        )
+        self.assertEquals(
+            sorted((row[3], row[2], row[10]) for row in rows[1:]),
+            sorted(
+                [
+                    ("10", "1", "Y"),
+                    (str(exact.pk), "1", "Y"),
+                    ("11", "4", "N"),
+                    (str(different.pk), "4", "N"),
+                ]
+            ),
+        )
+
+        response = self.client.get(reverse("duplicate_responses"))
+        self.assertEquals(response.context["export"], "duplicate_responses_audit")
+        self.assertEquals(
+            sorted(sorted(r.pk for r in dupe) for dupe in response.context["dupes"]),
+            [[10, exact.pk], [11, different.pk]],
+        )
+
+        response = self.client.get(
+            reverse("duplicate_responses"), {"ignore_exacts": "1"}
+        )
+        self.assertEquals(
+            [[r.pk for r in dupe] for dupe in response.context["dupes"]],
+            [[11, different.pk]],
+        )
+
+    def test_changed_automatic_points(self):
+        data_dir = Path(self.tmp.name) / "data"
+        data_dir.mkdir()
+        SessionConfig.objects.create(
+            marking_session=self.session,
+            config_type="json",
+            name="automatic_points",
+            json_value={
+                "points_file": "points.csv",
+                "option_map_file": "option_map.csv",
+            },
+        )
+        with open(data_dir / "option_map.csv", "w") as fp:
+            fp.write("section,question,prev_option,new_option\n")
+
+        enqueue_export(self.session, "changed_automatic_points")
+        with override_settings(BASE_DIR=Path(self.tmp.name)):
+            self.run_jobs()
+        job = ExportJob.objects.get()
+        self.assertEquals(job.status, "failed")
+        self.assertEquals(job.error, "Could not find points file")
+
+        with open(data_dir / "points.csv", "w") as fp:
+            writer = csv.writer(fp)
+            writer.writerow(
+                [
+                    "section",
+                    "question number",
+                    "question part",
+                    "council type",
+                    "council country",
+                    "council list",
+                    "answer in GRACE",
+                    "page no",
+                    "evidence link",
+                    "evidence notes",
+                    "copy last year answer",
+                ]
+            )
+            writer.writerow(
+                [
+                    "Transport",
+                    "1",
+                    "",
+                    "",
+                    "",
+                    "Aberdeenshire Council",
+                    "No",
+                    "1",
+                    "https://example.org",
+                    "",
+                    "",
+                ]
+            )
+
+        enqueue_export(self.session, "changed_automatic_points")
+        with override_settings(BASE_DIR=Path(self.tmp.name)):
+            self.run_jobs()
+            response = self.client.get(reverse("changed_auto_points"))
+
+        self.assertEquals(
+            self.read_job_rows("changed_automatic_points")[1:],
+            [
+                [
+                    "Transport",
+                    "1",
+                    "Aberdeenshire Council",
+                    "Yes",
+                    "0",
+                    "",
+                    "public notrs",
+                    "No",
+                    "1",
+                    "",
+                    "https://example.org",
+                ]
+            ],
+        )
+        self.assertEquals(
+            [
+                r["saved"].pk
+                for r in response.context["bad_responses"]["Transport"]["1"]
+            ],
+            [8],
+        )
+
+    def test_rerun_removes_old_file(self):
+        enqueue_export(self.session, "weighted_totals")
+        self.run_jobs()
+        first = ExportJob.objects.get()
+
+        enqueue_export(self.session, "weighted_totals")
+        self.run_jobs()
+        second = ExportJob.objects.get()
+
+        self.assertNotEquals(first.id, second.id)
+        self.assertFalse(Path(first.file_path).exists())
+        self.assertTrue(Path(second.file_path).exists())
+
+    def test_failed_job(self):
+        enqueue_export(self.session, "weighted_totals")
+        with mock.patch.dict(
+            EXPORTS["weighted_totals"], {"rows": mock.Mock(side_effect=KeyError("x"))}
+        ):
+            self.run_jobs()
+
+        job = ExportJob.objects.get()
+        self.assertEquals(job.status, "failed")
+        self.assertEquals(job.file_path, "")
+        self.assertEquals(list(Path(self.tmp.name).glob("**/*.*")), [])
+
+        response = self.client.get(reverse("export_job", args=("weighted_totals",)))
+        self.assertEquals(response.context["last_failed"], job)
+
+        # a failed job does not stop it being requested again
+        self.assertNotEquals(enqueue_export(self.session, "weighted_totals"), job)
+
+    def test_stale_job_expired(self):
+        job = enqueue_export(self.session, "weighted_totals")
+        job.status = "running"
+        job.started = timezone.now() - timedelta(hours=2)
+        job.save()
+
+        new_job = enqueue_export(self.session, "weighted_totals")
+        self.assertNotEquals(new_job.id, job.id)
+
+        job.refresh_from_db()
+        self.assertEquals(job.status, "failed")
@@ -1,6 +1,15 @@
+from django.contrib.auth.models import AnonymousUser, User
 from django.test import TestCase
 
-from crowdsourcer.models import Response
+from crowdsourcer.marking import get_progress_counter_differences
+from crowdsourcer.models import (
+    Assigned,
+    MarkingSession,
+    Option,
+    Response,
+    ResponseType,
+    Section,
+)
 
 
 class TestEvidenceLinks(TestCase):
@@ -55,3 +64,219 @@ class TestEvidenceLinks(TestCase):
             r = Response(public_notes=case["in"])
 
             self.assertEquals(r.evidence_links, case["out"])
+
+
+class TestIsAnswered(TestCase):
+    fixtures = [
+        "authorities.json",
+        "basics.json",
+        "users.json",
+        "questions.json",
+        "options.json",
+        "responses.json",
+        "ror_responses.json",
+    ]
+
+    def get_response(self, **kwargs):
+        args = {
+            "authority_id": 3,
+            "question_id": 282,
+            "user_id": 2,
+            "response_type": ResponseType.objects.get(type="First Mark"),
+        }
+        args.update(kwargs)
+        return Response(**args)
+
+    def test_fixtures(self):
+        for r in Response.objects.all():
+            self.assertEqual(r.is_answered, r.get_is_answered(), r.pk)
+
+        self.assertFalse(Response.objects.filter(is_answered=False).exists())
+
+    def test_option(self):
+        r = self.get_response(question_id=281, option_id=14)
+        r.save()
+        self.assertTrue(r.is_answered)
+
+        r.option = None
+        r.save()
+        r.refresh_from_db()
+        self.assertFalse(r.is_answered)
+
+    def test_multi_option(self):
+        r = self.get_response()
+        r.save()
+        r.refresh_from_db()
+        self.assertFalse(r.is_answered)
+
+        r.multi_option.add(160, 161)
+        r.refresh_from_db()
+        self.assertTrue(r.is_answered)
+
+        r.multi_option.remove(160)
+        r.refresh_from_db()
+        self.assertTrue(r.is_answered)
+
+        r.multi_option.clear()
+        r.refresh_from_db()
+        self.assertFalse(r.is_answered)
+
+    def test_multi_option_reverse(self):
+        r = self.get_response()
+        r.save()
+
+        option = r.question.option_set.get(pk=160)
+        option.multi_option.add(r)
+        r.refresh_from_db()
+        self.assertTrue(r.is_answered)
+
+        option.multi_option.clear()
+        r.refresh_from_db()
+        self.assertFalse(r.is_answered)
+
+    def test_right_of_reply(self):
+        r = Response.objects.get(pk=6)
+        self.assertTrue(r.is_answered)
+
+        # the option is copied from the first mark so does not count
+        r.agree_with_response = None
+        r.save()
+        r.refresh_from_db()
+        self.assertFalse(r.is_answered)
+
+        r.agree_with_response = False
+        r.save()
+        r.refresh_from_db()
+        self.assertTrue(r.is_answered)
+
+    def test_update_is_answered(self):
+        Response.objects.update(is_answered=False)
+        Response.update_is_answered(Response.objects.all())
+
+        for r in Response.objects.all():
+            self.assertEqual(r.is_answered, r.get_is_answered(), r.pk)
+
+    def assertAllUpToDate(self):
+        for r in Response.objects.all():
+            self.assertEqual(r.is_answered, r.get_is_answered(), r.pk)
+
+        for session in MarkingSession.objects.all():
+            self.assertEqual(get_progress_counter_differences(session), [])
+
+    def test_queryset_update(self):
+        Response.objects.filter(question_id=281).update(option=None)
+        self.assertTrue(Response.objects.filter(is_answered=False).exists())
+        self.assertAllUpToDate()
+
+        Response.objects.filter(response_type__type="Right of Reply").update(
+            agree_with_response=None
+        )
+        self.assertAllUpToDate()
+
+    def test_bulk_update(self):
+        responses = list(Response.objects.filter(question_id=281))
+        for r in responses:
+            r.option = None
+        Response.objects.bulk_update(responses, ["option"])
+
+        self.assertTrue(Response.objects.filter(is_answered=False).exists())
+        self.assertAllUpToDate()
+
+    def test_option_deleted(self):
+        r = self.get_response()
+        r.save()
+        r.multi_option.add(160)
+        r.refresh_from_db()
+        self.assertTrue(r.is_answered)
+
+        Option.objects.get(pk=160).delete()
+        r.refresh_from_db()
+        self.assertFalse(r.is_answered)
+        self.assertAllUpToDate()
+
+
+class TestIsUserAssigned(TestCase):
+    fixtures = [
+        "authorities.json",
+        "basics.json",
+        "users.json",
+        "questions.json",
+        "assignments.json",
+    ]
+
+    def setUp(self):
+        self.session = MarkingSession.objects.get(label="Default")
+        self.first_mark = ResponseType.objects.get(type="First Mark")
+        self.audit = ResponseType.objects.get(type="Audit")
+
+    def is_assigned(self, **kwargs):
+        args = {
+            "authority": "Aberdeenshire Council",
+            "section": "Transport",
+            "marking_session": self.session,
+            "current_stage": self.first_mark,
+        }
+        args.update(kwargs)
+        return Assigned.is_user_assigned(User.objects.get(username="marker"), **args)
+
+    def test_assigned(self):
+        self.assertTrue(self.is_assigned())
+        self.assertTrue(self.is_assigned(authority="Adur District Council"))
+        self.assertTrue(self.is_assigned(authority=None))
+        self.assertTrue(self.is_assigned(marking_session=None, current_stage=None))
+
+        self.assertFalse(self.is_assigned(section="Biodiversity"))
+        self.assertFalse(self.is_assigned(current_stage=self.audit))
+        self.assertFalse(
+            self.is_assigned(
+                marking_session=MarkingSession.objects.get(label="Second Session")
+            )
+        )
+
+    def test_no_section(self):
+        self.assertTrue(self.is_assigned(section=None))
+        self.assertFalse(self.is_assigned(section=None, current_stage=self.audit))
+
+    def test_inactive(self):
+        Assigned.objects.filter(user__username="marker").update(active=False)
+        self.assertFalse(self.is_assigned())
+
+    def test_section_and_stage_assignments(self):
+        user = User.objects.get(username="marker")
+        Assigned.objects.create(
+            user=user,
+            marking_session=self.session,
+            section=Section.objects.get(title="Biodiversity"),
+            response_type=self.first_mark,
+        )
+        self.assertTrue(self.is_assigned(section="Biodiversity"))
+        self.assertFalse(self.is_assigned(section="Planning & Land Use"))
+
+        Assigned.objects.create(
+            user=user, marking_session=self.session, response_type=self.audit
+        )
+        self.assertTrue(
+            self.is_assigned(section="Planning & Land Use", current_stage=self.audit)
+        )
+
+    def test_superuser_and_anonymous(self):
+        self.assertTrue(
+            Assigned.is_user_assigned(
+                User.objects.get(username="admin"), section="Biodiversity"
+            )
+        )
+        self.assertFalse(
+            Assigned.is_user_assigned(AnonymousUser(), section="Transport")
+        )
+
+    def test_assignments_fetched_once(self):
+        user = User.objects.get(username="marker")
+        with self.assertNumQueries(1):
+            for section in ["Transport", "Biodiversity", "Transport"]:
+                Assigned.is_user_assigned(
+                    user,
+                    section=section,
+                    authority="Aberdeenshire Council",
+                    marking_session=self.session,
+                    current_stage=self.first_mark,
+                )
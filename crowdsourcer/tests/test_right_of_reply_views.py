@@ -2,7 +2,9 @@ import io
 from collections import defaultdict
 
 from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 import pandas as pd
@@ -15,6 +17,7 @@ from crowdsourcer.models import (
     QuestionGroup,
     Response,
     ResponseType,
+    Section,
     SessionConfig,
     SessionProperties,
     SessionPropertyValues,
@@ -140,6 +143,55 @@ class TestAssignmentView(BaseTestCase):
         self.assertEqual(second.complete, 0)
 
 
+class TestSectionListQueries(BaseTestCase):
+    def get_sections(self):
+        url = reverse("authority_ror_sections", args=("Aberdeenshire Council",))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.context["sections"]
+
+    def test_query_count_does_not_grow_with_sections(self):
+        SessionConfig.objects.create(
+            name="right_of_reply_responses_to_ignore",
+            marking_session=MarkingSession.objects.get(label="Default"),
+            config_type="json",
+            json_value=["Car share"],
+        )
+        count, sections = self.get_sections()
+
+        session = MarkingSession.objects.get(label="Default")
+        authority = PublicAuthority.objects.get(name="Aberdeenshire Council")
+        first_mark = ResponseType.objects.get(type="First Mark")
+        for i in range(3):
+            section = Section.objects.create(
+                title=f"Extra section {i}", marking_session=session
+            )
+            for n in range(2):
+                q = Question.objects.create(
+                    section=section,
+                    number=n + 1,
+                    description=f"Extra question {n}",
+                    how_marked="volunteer",
+                )
+                q.questiongroup.add(authority.questiongroup)
+                Response.objects.create(
+                    authority=authority,
+                    question=q,
+                    user=User.objects.get(username="marker"),
+                    response_type=first_mark,
+                )
+
+        new_count, new_sections = self.get_sections()
+        self.assertEqual(len(new_sections), len(sections) + 3)
+        self.assertEqual(new_count, count)
+
+        extra = [s for s in new_sections if s.title.startswith("Extra section")]
+        for section in extra:
+            self.assertEqual(section.total, 2)
+            self.assertEqual(section.complete, 0)
+
+
 class TestTwoCouncilsAssignmentView(BaseTestCase):
     def setUp(self):
         u = User.objects.get(username="council")
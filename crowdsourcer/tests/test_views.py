@@ -1,24 +1,44 @@
 import datetime
 import io
-from unittest import skip
+import json
+import time
+from unittest import mock, skip
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 
 import pandas as pd
 
+from crowdsourcer.benchmark import BenchmarkSession
+from crowdsourcer.marking import (
+    get_assignment_progress,
+    get_assignment_progress_bulk,
+    get_assignment_progress_generation,
+    get_cached_assignment_progress,
+    get_progress_counter_differences,
+    save_cached_assignment_progress,
+    update_progress_counters,
+)
+from crowdsourcer.middleware import clear_session_metadata
 from crowdsourcer.models import (
     Assigned,
     Marker,
     MarkingSession,
+    Option,
+    ProgressCounter,
     PublicAuthority,
     Question,
     Response,
     ResponseType,
     Section,
 )
+from crowdsourcer.views.base import BaseQuestionView
 
 
 class TestEmptyDB(TestCase):
@@ -152,6 +172,87 @@ class TestSelectsCorrectMarkingSession(BaseTestCase):
         self.assertRedirects(response, "/Second%20Session/")
 
 
+@override_settings(MARKING_SESSION_CACHE_TIMEOUT=60)
+class TestSessionMetadataCache(TestSelectsCorrectMarkingSession):
+    """
+    Runs the session selection tests with the session cache turned on, as
+    it is off in tests by default.
+    """
+
+    def setUp(self):
+        clear_session_metadata()
+        self.addCleanup(clear_session_metadata)
+        super().setUp()
+
+    def session_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [
+            q["sql"]
+            for q in queries
+            if MarkingSession._meta.db_table in q["sql"].split("WHERE")[0]
+            or ResponseType._meta.db_table in q["sql"].split("WHERE")[0]
+        ]
+
+    def test_sessions_not_queried_when_cached(self):
+        url = reverse("stats")
+        self.assertNotEqual(self.session_queries(url), [])
+        self.assertEqual(self.session_queries(url), [])
+        self.assertEqual(self.session_queries("/Second Session" + url), [])
+
+    def test_sessions_not_shared_between_requests(self):
+        url = reverse("stats")
+        first = self.client.get(url).context["marking_session"]
+        first.stage = ResponseType.objects.get(type="Audit")
+        first.extra = "set while handling a request"
+
+        second = self.client.get(url).context["marking_session"]
+        self.assertIsNot(first, second)
+        self.assertIsNone(second.stage)
+        self.assertFalse(hasattr(second, "extra"))
+
+    def test_cache_expires(self):
+        url = reverse("stats")
+        self.session_queries(url)
+
+        expires = time.monotonic() + 61
+        with mock.patch("crowdsourcer.middleware.time.monotonic", return_value=expires):
+            self.assertNotEqual(self.session_queries(url), [])
+
+    def test_saving_response_type_clears_cache(self):
+        response = self.client.get("/")
+        self.assertEqual(response.context["marking_session"].label, "Default")
+        self.assertIsNone(response.context["marking_session"].stage)
+
+        ms = MarkingSession.objects.get(label="Default")
+        ms.stage = ResponseType.objects.get(type="Audit")
+        ms.save()
+
+        response = self.client.get("/")
+        self.assertEqual(response.context["marking_session"].stage.type, "Audit")
+
+        rt = ms.stage
+        rt.type = "Renamed"
+        rt.save()
+
+        response = self.client.get("/")
+        self.assertEqual(response.context["marking_session"].stage.type, "Renamed")
+
+    def test_deleting_session_clears_cache(self):
+        response = self.client.get("/Second Session/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["sessions"]), 2)
+
+        MarkingSession.objects.get(label="Second Session").delete()
+
+        response = self.client.get("/Second Session/")
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.get("/")
+        self.assertEqual(len(response.context["sessions"]), 1)
+
+
 class TestAssignmentView(BaseTestCase):
     fixtures = [
         "authorities.json",
@@ -310,6 +411,160 @@ class TestAssignmentCompletionStats(BaseTestCase):
         self.assertEqual(second["complete"], 0)
 
 
+class TestAssignmentProgressBulk(BaseTestCase):
+    def get_progress(self, fn, session="Default", stage="First Mark"):
+        qs = Assigned.objects.filter(
+            marking_session__label=session,
+            section__isnull=False,
+            active=True,
+            response_type__type=stage,
+            user__is_active=True,
+        )
+        return [
+            (
+                p["assignment"].user_id,
+                p["assignment"].section_id,
+                p["complete"],
+                p["started"],
+                p["total"],
+                p["section_link"],
+            )
+            for p in fn(qs, session, stage)
+        ]
+
+    def assertProgressMatches(self, session="Default", stages=["First Mark"]):
+        for stage in stages:
+            expected = self.get_progress(get_assignment_progress, session, stage)
+            self.assertEqual(
+                self.get_progress(get_assignment_progress_bulk, session, stage),
+                expected,
+            )
+
+    def test_matches(self):
+        self.assertProgressMatches()
+
+        Response.objects.filter(question_id=281, user=2).update(option=None)
+        self.assertProgressMatches()
+
+    def test_matches_whole_section_assignment(self):
+        Assigned.objects.filter(user=self.user, section__title="Transport").update(
+            authority=None
+        )
+        self.assertProgressMatches()
+
+    def test_matches_benchmark_session(self):
+        session = BenchmarkSession(
+            councils=12, sections=2, questions=4, volunteers=3, exceptions=0
+        ).create()
+
+        self.assertProgressMatches(session.label, ["First Mark", "Audit"])
+
+    def test_queries(self):
+        session = BenchmarkSession(
+            councils=12, sections=2, questions=4, volunteers=3, exceptions=0
+        ).create()
+        qs = Assigned.objects.filter(marking_session=session, section__isnull=False)
+
+        with self.assertNumQueries(8):
+            progress = get_assignment_progress_bulk(qs, session.label, "First Mark")
+        self.assertEqual(len(progress), 12)
+
+
+class TestAssignmentProgressCache(BaseTestCase):
+    def setUp(self):
+        cache.clear()
+        u = User.objects.get(username="admin")
+        self.client.force_login(u)
+        self.user = u
+
+    def get_overview(self):
+        response = self.client.get("/")
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def add_response(self):
+        Response.objects.create(
+            authority_id=3,
+            question_id=281,
+            user=self.user,
+            option_id=14,
+            response_type_id=1,
+            public_notes="public notes",
+            page_number="0",
+            evidence="",
+            private_notes="private notes",
+        )
+
+    def test_overview_uses_cache(self):
+        context = self.get_overview()
+        computed_at = context["progress_computed_at"]
+        self.assertIsNotNone(computed_at)
+        self.assertContains(self.client.get("/"), "Progress calculated at")
+
+        progress = context["progress"]
+        self.assertEqual(len(progress), 2)
+        self.assertEqual(progress[1]["assignment"]["section"]["title"], "Transport")
+        self.assertEqual(progress[1]["complete"], 1)
+
+        context = self.get_overview()
+        self.assertEqual(context["progress_computed_at"], computed_at)
+
+        self.add_response()
+        context = self.get_overview()
+        self.assertGreater(context["progress_computed_at"], computed_at)
+        self.assertEqual(context["progress"][1]["started"], 2)
+
+    def test_assigned_invalidates(self):
+        session = MarkingSession.objects.get(label="Default")
+        self.get_overview()
+        self.assertIsNotNone(get_cached_assignment_progress(session, "First Mark"))
+
+        Assigned.objects.get(pk=1).delete()
+        self.assertIsNone(get_cached_assignment_progress(session, "First Mark"))
+
+    def test_stale_progress_not_saved(self):
+        session = MarkingSession.objects.get(label="Default")
+        qs = Assigned.objects.filter(
+            marking_session=session, section__isnull=False, response_type_id=1
+        )
+
+        generation = get_assignment_progress_generation(session.id)
+        progress = get_assignment_progress_bulk(qs, session.label, "First Mark")
+        self.add_response()
+        save_cached_assignment_progress(
+            session, "First Mark", progress, generation=generation
+        )
+
+        self.assertIsNone(get_cached_assignment_progress(session, "First Mark"))
+
+    def test_command(self):
+        session = MarkingSession.objects.get(label="Default")
+        call_command("cache_current_progress", session="Default")
+
+        cached = get_cached_assignment_progress(session, "First Mark")
+        # make sure it is plain data that any cache backend can store
+        self.assertEqual(json.loads(json.dumps(cached["progress"])), cached["progress"])
+        self.assertEqual(
+            cached["progress"][0],
+            {
+                "assignment": {
+                    "id": 1,
+                    "user": {"id": 2, "username": "marker"},
+                    "section": {"id": 1, "title": "Buildings & Heating"},
+                    "response_type": "First Mark",
+                },
+                "complete": 0,
+                "started": 1,
+                "total": 1,
+                "section_link": "section_authorities",
+            },
+        )
+
+        context = self.get_overview()
+        self.assertEqual(context["progress"], cached["progress"])
+        self.assertEqual(context["progress_computed_at"], cached["computed_at"])
+
+
 class TestUserSectionProgressView(BaseTestCase):
     def test_view(self):
         url = reverse("section_authorities", args=("Transport",))
@@ -1036,6 +1291,260 @@ class TestSaveView(BaseTestCase):
         self.assertNotEquals(last_update, answers[1].last_update)
 
 
+class TestBulkSave(BaseTestCase):
+    fixtures = [
+        "authorities.json",
+        "basics.json",
+        "users.json",
+        "questions.json",
+        "options.json",
+        "assignments.json",
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse(
+            "authority_question_edit", args=("Aberdeenshire Council", "Transport")
+        )
+        self.session = MarkingSession.objects.get(label="Default")
+        self.data = {
+            "form-INITIAL_FORMS": 2,
+            "form-MAX_NUM_FORMS": 2,
+            "form-MIN_NUM_FORMS": 2,
+            "form-TOTAL_FORMS": 2,
+            "form-0-authority": 2,
+            "form-0-evidence": "foo",
+            "form-0-option": "14",
+            "form-0-page_number": "1",
+            "form-0-private_notes": "qux",
+            "form-0-public_notes": "bar",
+            "form-0-question": "281",
+            "form-1-authority": 2,
+            "form-1-evidence": "foo",
+            "form-1-multi_option": "161",
+            "form-1-page_number": "1",
+            "form-1-private_notes": "qux",
+            "form-1-public_notes": "bar",
+            "form-1-question": "282",
+        }
+
+    def get_answers(self):
+        return Response.objects.filter(
+            authority__name="Aberdeenshire Council",
+            question__section__title="Transport",
+        ).order_by("question__number")
+
+    def test_save_updates_history_and_progress(self):
+        cache.clear()
+        generation = get_assignment_progress_generation(self.session.id)
+
+        response = self.client.post(self.url, data=self.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEquals(
+            response.context.get("message", ""), "Your answers have been saved."
+        )
+
+        answers = self.get_answers()
+        self.assertEquals(answers.count(), 2)
+        for answer in answers:
+            self.assertTrue(answer.is_answered)
+            self.assertEquals(answer.user, self.user)
+            self.assertEquals(answer.response_type.type, "First Mark")
+            self.assertEquals(answer.history.count(), 1)
+
+        self.assertEquals(answers[0].option.description, "Yes")
+        self.assertEquals(
+            list(answers[1].multi_option.values_list("description", flat=True)),
+            ["Car share"],
+        )
+
+        self.assertEqual(get_progress_counter_differences(self.session), [])
+        self.assertNotEqual(
+            get_assignment_progress_generation(self.session.id), generation
+        )
+
+    def test_only_changed_answers_saved(self):
+        self.client.post(self.url, data=self.data)
+        first, second = self.get_answers()
+
+        data = {**self.data, "form-0-evidence": "changed"}
+        response = self.client.post(self.url, data=data)
+        self.assertEqual(response.status_code, 200)
+
+        first.refresh_from_db()
+        self.assertEquals(first.evidence, "changed")
+        self.assertEquals(first.history.count(), 2)
+        self.assertEquals(second.history.count(), 1)
+
+        data = {**data, "form-1-multi_option": ["161", "162"]}
+        self.client.post(self.url, data=data)
+
+        self.assertEquals(first.history.count(), 2)
+        self.assertEquals(second.history.count(), 2)
+        self.assertEquals(
+            sorted(second.multi_option.values_list("id", flat=True)), [161, 162]
+        )
+        self.assertEqual(get_progress_counter_differences(self.session), [])
+
+    def test_resubmission_not_saved(self):
+        self.client.post(self.url, data=self.data)
+        Response.objects.all().delete()
+
+        response = self.client.post(self.url, data=self.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEquals(self.get_answers().count(), 0)
+
+    def test_same_as_saving_each_form(self):
+        self.client.post(self.url, data=self.data)
+        bulk = [
+            (a.option_id, a.evidence, a.is_answered, list(a.multi_option.all()))
+            for a in self.get_answers()
+        ]
+
+        Response.objects.all().delete()
+        session = self.client.session
+        session.pop("form-submission+AuthoritySectionQuestions")
+        session.save()
+        with mock.patch.object(BaseQuestionView, "bulk_save", False):
+            self.client.post(self.url, data=self.data)
+        single = [
+            (a.option_id, a.evidence, a.is_answered, list(a.multi_option.all()))
+            for a in self.get_answers()
+        ]
+
+        self.assertEquals(bulk, single)
+
+
+class TestJSONSave(BaseTestCase):
+    fixtures = [
+        "authorities.json",
+        "basics.json",
+        "users.json",
+        "questions.json",
+        "options.json",
+        "assignments.json",
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse(
+            "authority_json_question_edit",
+            args=("Aberdeenshire Council", "Transport", 281),
+        )
+        self.data = {
+            "authority": 2,
+            "question": 281,
+            "option": 14,
+            "page_number": "1",
+            "evidence": "foo",
+            "public_notes": "bar",
+            "private_notes": "qux",
+        }
+
+    def get_answer(self):
+        return Response.objects.get(
+            authority__name="Aberdeenshire Council", question_id=281
+        )
+
+    def test_save(self):
+        response = self.client.post(self.url, data={**self.data, "version": ""})
+        self.assertEqual(response.status_code, 200)
+
+        answer = self.get_answer()
+        self.assertEqual(answer.option_id, 14)
+        self.assertEqual(response.json(), {"success": 1, "version": answer.version})
+
+    def test_unchanged_not_saved(self):
+        version = self.client.post(self.url, data=self.data).json()["version"]
+        answer = self.get_answer()
+
+        response = self.client.post(self.url, data={**self.data, "version": version})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(), {"success": 1, "unchanged": 1, "version": version}
+        )
+        self.assertEqual(answer.history.count(), 1)
+
+        data = {**self.data, "evidence": "changed", "version": version}
+        response = self.client.post(self.url, data=data)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.json()["version"], version)
+        self.assertEqual(answer.history.count(), 2)
+        self.assertEqual(self.get_answer().evidence, "changed")
+
+    def test_stale_version_rejected(self):
+        version = self.client.post(self.url, data=self.data).json()["version"]
+
+        answer = self.get_answer()
+        answer.evidence = "saved elsewhere"
+        answer.save()
+
+        data = {**self.data, "evidence": "changed", "version": version}
+        response = self.client.post(self.url, data=data)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["stale"], 1)
+        self.assertEqual(response.json()["version"], answer.version)
+        self.assertEqual(self.get_answer().evidence, "saved elsewhere")
+
+        # the page was loaded before the answer was first saved
+        response = self.client.post(self.url, data={**data, "version": ""})
+        self.assertEqual(response.status_code, 409)
+
+        # older pages don't send a version
+        response = self.client.post(
+            self.url, data={**self.data, "evidence": "no version"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_answer().evidence, "no version")
+
+    def test_version_in_page(self):
+        version = self.client.post(self.url, data=self.data).json()["version"]
+
+        response = self.client.get(
+            reverse(
+                "authority_question_edit", args=("Aberdeenshire Council", "Transport")
+            )
+        )
+        self.assertContains(
+            response, f'<input type="hidden" name="form-0-version" value="{version}">'
+        )
+
+
+class TestPermissionQueries(BaseTestCase):
+    def get_assigned_queries(self, method, url, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        return [q for q in queries if '"crowdsourcer_assigned"' in q["sql"]]
+
+    def test_question_page(self):
+        url = reverse(
+            "authority_question_edit", args=("Aberdeenshire Council", "Transport")
+        )
+        self.assertEqual(len(self.get_assigned_queries("get", url)), 1)
+
+    def test_autosave(self):
+        url = reverse(
+            "authority_json_question_edit",
+            args=("Aberdeenshire Council", "Transport", 281),
+        )
+        data = {
+            "authority": 2,
+            "question": 281,
+            "option": 14,
+            "page_number": "1",
+            "evidence": "foo",
+            "public_notes": "bar",
+            "private_notes": "qux",
+        }
+        self.assertEqual(len(self.get_assigned_queries("post", url, data=data)), 1)
+
+    def test_section_authority_list(self):
+        url = reverse("section_authorities", args=("Transport",))
+        # one to check permissions and one for the list of authorities
+        self.assertEqual(len(self.get_assigned_queries("get", url)), 2)
+
+
 class TestSaveWithPreviousQuestionsView(BaseTestCase):
     fixtures = [
         "authorities.json",
@@ -1060,6 +1569,84 @@ class TestSaveWithPreviousQuestionsView(BaseTestCase):
         self.assertTrue(response.context["has_previous_questions"])
 
 
+class TestQuestionPageQueries(BaseTestCase):
+    def add_questions(self, count):
+        authority = PublicAuthority.objects.get(name="Aberdeenshire Council")
+        section = Section.objects.get(
+            title="Transport", marking_session__label="Default"
+        )
+        rt = ResponseType.objects.get(type="First Mark")
+
+        for i in range(count):
+            multiple = i % 2 == 1
+            q = Question.objects.create(
+                section=section,
+                number=100 + i,
+                description=f"Extra question {i}",
+                question_type="multiple_choice" if multiple else "select_one",
+            )
+            q.questiongroup.add(authority.questiongroup)
+            options = [
+                Option.objects.create(
+                    question=q, description=f"Option {i}.{n}", score=n, ordering=n
+                )
+                for n in range(3)
+            ]
+            r = Response.objects.create(
+                authority=authority,
+                question=q,
+                user=self.user,
+                response_type=rt,
+                option=None if multiple else options[0],
+                public_notes="a public note",
+            )
+            if multiple:
+                r.multi_option.set(options[:2])
+
+    def get_query_count(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_query_count_does_not_grow_with_questions(self):
+        url = reverse(
+            "authority_question_edit", args=("Aberdeenshire Council", "Transport")
+        )
+        count, response = self.get_query_count(url)
+        forms = len(response.context["form"].forms)
+
+        self.add_questions(6)
+        new_count, response = self.get_query_count(url)
+
+        self.assertEqual(len(response.context["form"].forms), forms + 6)
+        self.assertEqual(new_count, count)
+        self.assertContains(response, "Option 5.2")
+
+    def test_existing_answers_rendered(self):
+        self.add_questions(2)
+        url = reverse(
+            "authority_question_edit", args=("Aberdeenshire Council", "Transport")
+        )
+        response = self.client.get(url)
+
+        forms = {f.initial["question"].description: f for f in response.context["form"]}
+        single = forms["Extra question 0"]
+        multi = forms["Extra question 1"]
+        self.assertEqual(
+            single["option"].value(),
+            Option.objects.get(description="Option 0.0").id,
+        )
+        self.assertEqual(
+            sorted(multi["multi_option"].value()),
+            sorted(
+                Option.objects.filter(
+                    description__in=["Option 1.0", "Option 1.1"]
+                ).values_list("id", flat=True)
+            ),
+        )
+
+
 class TestAllAuthorityProgressView(BaseTestCase):
     def test_non_admin_denied(self):
         response = self.client.get(reverse("all_authority_progress"))
@@ -1077,6 +1664,217 @@ class TestAllAuthorityProgressView(BaseTestCase):
         self.assertEquals(context["councils"]["total"], 4)
 
 
+class TestSectionProgressView(BaseTestCase):
+    def test_non_admin_denied(self):
+        response = self.client.get(reverse("section_progress", args=("Transport",)))
+        self.assertEquals(response.status_code, 403)
+
+    def test_view(self):
+        u = User.objects.get(username="admin")
+        self.client.force_login(u)
+
+        response = self.client.get(reverse("section_progress", args=("Transport",)))
+        self.assertEquals(response.status_code, 200)
+        context = response.context
+
+        self.assertEquals(context["totals"], {"total": 4, "complete": 1})
+        authorities = context["authorities"]
+        self.assertEquals(authorities[0].name, "Aberdeenshire Council")
+        self.assertEquals(authorities[0].num_responses, 2)
+        self.assertEquals(authorities[0].num_questions, 2)
+
+        Response.objects.get(question_id=281, authority_id=2).delete()
+        response = self.client.get(reverse("section_progress", args=("Transport",)))
+        self.assertEquals(response.context["totals"], {"total": 4, "complete": 0})
+
+
+class TestProgressCounters(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.session = MarkingSession.objects.get(label="Default")
+
+    def get_counter(self, authority_id=2, section="Transport", stage="First Mark"):
+        return ProgressCounter.objects.get(
+            authority_id=authority_id,
+            section__title=section,
+            section__marking_session=self.session,
+            response_type__type=stage,
+            how_marked="volunteer",
+        )
+
+    def assertCountersMatch(self):
+        self.assertEqual(get_progress_counter_differences(self.session), [])
+
+    def add_response(self, **kwargs):
+        args = {
+            "authority_id": 3,
+            "question_id": 281,
+            "user": self.user,
+            "option_id": 14,
+            "response_type": ResponseType.objects.get(type="First Mark"),
+            "public_notes": "public notes",
+            "page_number": "0",
+            "evidence": "",
+            "private_notes": "private notes",
+        }
+        args.update(kwargs)
+        return Response.objects.create(**args)
+
+    def test_built_from_fixtures(self):
+        self.assertCountersMatch()
+
+        counter = self.get_counter()
+        self.assertEqual(counter.required, 2)
+        self.assertEqual(counter.answered, 2)
+        self.assertEqual(counter.challenged, 0)
+
+        counter = self.get_counter(stage="Audit")
+        self.assertEqual(counter.required, 2)
+        self.assertEqual(counter.answered, 0)
+
+    def test_updated_on_response_save(self):
+        self.assertEqual(self.get_counter(authority_id=3).answered, 0)
+
+        r = self.add_response()
+        self.assertEqual(self.get_counter(authority_id=3).answered, 1)
+
+        r.option = None
+        r.save()
+        self.assertEqual(self.get_counter(authority_id=3).answered, 0)
+
+        r.delete()
+        self.assertEqual(self.get_counter(authority_id=3).answered, 0)
+        self.assertCountersMatch()
+
+    def test_updated_on_multi_option_change(self):
+        r = self.add_response(question_id=282, option_id=None)
+        self.assertEqual(self.get_counter(authority_id=3).answered, 0)
+
+        r.multi_option.add(161, 162)
+        self.assertEqual(self.get_counter(authority_id=3).answered, 1)
+
+        r.multi_option.clear()
+        self.assertEqual(self.get_counter(authority_id=3).answered, 0)
+        self.assertCountersMatch()
+
+    def test_right_of_reply_challenges(self):
+        rt = ResponseType.objects.get(type="Right of Reply")
+        self.add_response(
+            authority_id=2, response_type=rt, option_id=None, agree_with_response=True
+        )
+        self.add_response(
+            authority_id=2,
+            question_id=282,
+            response_type=rt,
+            option_id=None,
+            agree_with_response=False,
+        )
+
+        counter = self.get_counter(stage="Right of Reply")
+        self.assertEqual(counter.answered, 2)
+        self.assertEqual(counter.challenged, 1)
+        self.assertCountersMatch()
+
+    def test_updated_on_question_change(self):
+        q = Question.objects.get(pk=282)
+        q.questiongroup.remove(1)
+
+        self.assertEqual(self.get_counter().required, 1)
+        self.assertEqual(self.get_counter().answered, 1)
+        self.assertEqual(self.get_counter(authority_id=3).required, 2)
+
+        q.how_marked = "foi"
+        q.save()
+        self.assertEqual(self.get_counter(authority_id=3).required, 1)
+        self.assertCountersMatch()
+
+        q.delete()
+        self.assertCountersMatch()
+
+    def test_updated_on_authority_change(self):
+        authority = PublicAuthority.objects.get(pk=4)
+        authority.marking_session.remove(self.session)
+        self.assertFalse(
+            ProgressCounter.objects.filter(
+                authority=authority, marking_session=self.session
+            ).exists()
+        )
+
+        authority.marking_session.add(self.session)
+        self.assertEqual(self.get_counter(authority_id=4).required, 2)
+        self.assertCountersMatch()
+
+    def test_updated_on_authority_group_change(self):
+        authority = PublicAuthority.objects.get(pk=2)
+        with mock.patch(
+            "crowdsourcer.signals.update_progress_counters",
+            wraps=update_progress_counters,
+        ) as update:
+            authority.name = "Renamed Council"
+            authority.save()
+            update.assert_not_called()
+
+            authority.questiongroup_id = 5
+            authority.save()
+
+        sessions = set(authority.marking_session.values_list("id", flat=True))
+        self.assertEqual(
+            {c.args[0] for c in update.call_args_list},
+            sessions,
+        )
+        for marking_session in MarkingSession.objects.filter(id__in=sessions):
+            self.assertEqual(get_progress_counter_differences(marking_session), [])
+
+    def test_unchanged_response_save_skipped(self):
+        r = self.add_response()
+        r = Response.objects.get(pk=r.pk)
+
+        with mock.patch(
+            "crowdsourcer.signals.update_response_progress_counters"
+        ) as update:
+            r.public_notes = "new notes"
+            r.save()
+            update.assert_not_called()
+
+            r.option = None
+            r.save()
+            update.assert_called_once()
+
+    def test_updated_on_response_move(self):
+        r = self.add_response()
+        self.assertEqual(self.get_counter(authority_id=3).answered, 1)
+
+        r = Response.objects.get(pk=r.pk)
+        r.authority_id = 4
+        r.save()
+        self.assertEqual(self.get_counter(authority_id=3).answered, 0)
+        self.assertCountersMatch()
+
+    def test_response_type_created(self):
+        ResponseType.objects.create(type="Second Audit", priority=2)
+        self.assertEqual(self.get_counter(stage="Second Audit").required, 2)
+        self.assertCountersMatch()
+
+    def test_command(self):
+        ProgressCounter.objects.filter(authority_id=2).update(answered=0)
+        ProgressCounter.objects.filter(authority_id=3).delete()
+
+        out = io.StringIO()
+        call_command(
+            "rebuild_progress_counters", session="Default", check=True, stdout=out
+        )
+        self.assertRegex(out.getvalue(), r"\d+ progress counters do not match")
+
+        call_command("rebuild_progress_counters", session="Default", stdout=out)
+        self.assertCountersMatch()
+
+        out = io.StringIO()
+        call_command(
+            "rebuild_progress_counters", session="Default", check=True, stdout=out
+        )
+        self.assertEqual(out.getvalue(), "All progress counters match\n")
+
+
 class TestAllSectionProgressView(BaseTestCase):
     def test_non_admin_denied(self):
         response = self.client.get(reverse("all_section_progress"))
@@ -1113,6 +1911,82 @@ class TestAllSectionProgressView(BaseTestCase):
         self.assertEquals(context["Transport"]["assigned"], 2)
         self.assertEquals(context["Transport"]["total"], 4)
 
+    def test_query_count(self):
+        BenchmarkSession(
+            councils=8, sections=30, questions=2, volunteers=2, exceptions=0
+        ).create()
+
+        u = User.objects.get(username="admin")
+        self.client.force_login(u)
+
+        with CaptureQueriesContext(connection) as default_queries:
+            self.client.get(reverse("all_section_progress"))
+
+        with CaptureQueriesContext(connection) as benchmark_queries:
+            response = self.client.get(
+                reverse("session_urls:all_section_progress", args=("Benchmark",))
+            )
+        self.assertEqual(response.status_code, 200)
+
+        progress = response.context["progress"]
+        self.assertEqual(len(progress), 30)
+        self.assertEqual(progress["Section 1"]["total"], 8)
+        self.assertEqual(progress["Section 1"]["assigned"], 8)
+
+        self.assertEqual(len(benchmark_queries), len(default_queries))
+
+
+class TestAllSectionChallengeView(BaseTestCase):
+    def test_non_admin_denied(self):
+        response = self.client.get(reverse("section_ror_progress"))
+        self.assertEquals(response.status_code, 403)
+
+    def test_view(self):
+        rt = ResponseType.objects.get(type="Right of Reply")
+        for question_id, agree in [(281, True), (282, False)]:
+            Response.objects.create(
+                authority_id=2,
+                question_id=question_id,
+                user=self.user,
+                response_type=rt,
+                agree_with_response=agree,
+            )
+
+        u = User.objects.get(username="admin")
+        self.client.force_login(u)
+        response = self.client.get(reverse("section_ror_progress"))
+        self.assertEquals(response.status_code, 200)
+
+        progress = response.context["progress"]
+        self.assertEquals(
+            progress["Transport"],
+            {"total": 4, "complete": 1, "started": 1, "challenges": 1},
+        )
+        self.assertEquals(
+            progress["Buildings & Heating"],
+            {"total": 4, "complete": 0, "started": 0, "challenges": 0},
+        )
+
+    def test_query_count(self):
+        BenchmarkSession(
+            councils=8, sections=30, questions=2, volunteers=2, exceptions=0
+        ).create()
+
+        u = User.objects.get(username="admin")
+        self.client.force_login(u)
+
+        with CaptureQueriesContext(connection) as default_queries:
+            self.client.get(reverse("section_ror_progress"))
+
+        with CaptureQueriesContext(connection) as benchmark_queries:
+            response = self.client.get(
+                reverse("session_urls:section_ror_progress", args=("Benchmark",))
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["progress"]), 30)
+
+        self.assertEqual(len(benchmark_queries), len(default_queries))
+
 
 class TestVolunteerProgressView(BaseTestCase):
     def test_non_admin_denied(self):
@@ -1137,6 +2011,63 @@ class TestVolunteerProgressView(BaseTestCase):
         self.assertEqual(tran["totals"]["total"], 2)
         self.assertEqual(tran["totals"]["complete"], 1)
 
+    def test_authorities(self):
+        u = User.objects.get(username="admin")
+        self.client.force_login(u)
+        response = self.client.get(reverse("volunteer_progress", args=(2,)))
+        tran = response.context["sections"][1]
+
+        first_mark = tran["responses"]["First Mark"]
+        self.assertEqual(first_mark["authority_url_name"], "authority_question_edit")
+        self.assertEqual(
+            first_mark["authorities"],
+            [
+                {
+                    "name": "Aberdeenshire Council",
+                    "num_questions": 2,
+                    "num_responses": 2,
+                },
+                {
+                    "name": "Adur District Council",
+                    "num_questions": 2,
+                    "num_responses": 0,
+                },
+            ],
+        )
+        self.assertEqual(tran["responses"]["Audit"]["authorities"], [])
+
+        response = self.client.get(
+            reverse("volunteer_progress", args=(2,)), {"sort": "asc"}
+        )
+        authorities = response.context["sections"][1]["responses"]["First Mark"][
+            "authorities"
+        ]
+        self.assertEqual(authorities[0]["name"], "Adur District Council")
+
+    def test_query_count(self):
+        u = User.objects.get(username="admin")
+        self.client.force_login(u)
+
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(reverse("volunteer_progress", args=(2,)))
+
+        session = MarkingSession.objects.get(label="Default")
+        for section in Section.objects.filter(marking_session=session):
+            for rt in ResponseType.objects.all():
+                for authority in PublicAuthority.objects.all():
+                    Assigned.objects.get_or_create(
+                        section=section,
+                        authority=authority,
+                        response_type=rt,
+                        defaults={"user_id": 2, "marking_session": session},
+                    )
+
+        with CaptureQueriesContext(connection) as after:
+            response = self.client.get(reverse("volunteer_progress", args=(2,)))
+
+        self.assertEquals(len(response.context["sections"]), 7)
+        self.assertEquals(len(after), len(before))
+
     def test_view_other_session(self):
         u = User.objects.get(username="admin")
         self.client.force_login(u)
@@ -1166,7 +2097,7 @@ class TestVolunteerProgressCSVView(BaseTestCase):
         response = self.client.get(reverse("volunteer_csv_progress"))
         self.assertEquals(response.status_code, 200)
 
-        content = response.content.decode("utf-8")
+        content = b"".join(response.streaming_content).decode("utf-8")
         df = pd.read_csv(io.StringIO(content))
 
         self.assertEquals(df.shape[0], 3)
@@ -1204,7 +2135,7 @@ class TestVolunteerProgressCSVView(BaseTestCase):
         response = self.client.get(reverse("volunteer_csv_progress"))
         self.assertEquals(response.status_code, 200)
 
-        content = response.content.decode("utf-8")
+        content = b"".join(response.streaming_content).decode("utf-8")
         df = pd.read_csv(io.StringIO(content))
 
         self.assertEquals(df.shape[0], 4)
@@ -1228,7 +2159,7 @@ class TestVolunteerProgressCSVView(BaseTestCase):
         response = self.client.get(reverse("volunteer_csv_progress"))
         self.assertEquals(response.status_code, 200)
 
-        content = response.content.decode("utf-8")
+        content = b"".join(response.streaming_content).decode("utf-8")
         df = pd.read_csv(io.StringIO(content))
 
         self.assertEquals(df.shape[0], 4)
@@ -1249,6 +2180,34 @@ class TestVolunteerProgressCSVView(BaseTestCase):
             authority__name="Aberdeenshire Council",
         )
 
+    def get_csv(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        content = b"".join(response.streaming_content).decode("utf-8")
+        return pd.read_csv(io.StringIO(content))
+
+    def test_query_count(self):
+        BenchmarkSession(
+            councils=8, sections=30, questions=2, volunteers=2, exceptions=0
+        ).create()
+
+        u = User.objects.get(username="admin")
+        self.client.force_login(u)
+
+        with CaptureQueriesContext(connection) as default_queries:
+            self.get_csv(reverse("volunteer_csv_progress"))
+
+        with CaptureQueriesContext(connection) as benchmark_queries:
+            df = self.get_csv(
+                reverse("session_urls:volunteer_csv_progress", args=("Benchmark",))
+            )
+
+        self.assertEqual(df.shape[0], 120)
+        self.assertEqual(df["councils_assigned"].sum(), 2 * 8 * 30)
+
+        self.assertEqual(len(benchmark_queries), len(default_queries))
+
 
 class TestAuthorityProgressView(BaseTestCase):
     def test_non_admin_denied(self):
@@ -1271,6 +2230,52 @@ class TestAuthorityProgressView(BaseTestCase):
         self.assertEquals(context["Transport"]["responses"], 0)
         self.assertEquals(context["Transport"]["total"], 2)
 
+    def get_sections(self):
+        response = self.client.get(
+            reverse("authority_progress", args=("Aberdeen City Council",))
+        )
+        self.assertEquals(response.status_code, 200)
+        return response.context["sections"]
+
+    def test_only_counts_authority_responses(self):
+        u = User.objects.get(username="admin")
+        self.client.force_login(u)
+
+        Response.objects.create(
+            authority_id=2,
+            question_id=278,
+            user=self.user,
+            option_id=3,
+            response_type_id=1,
+        )
+        Question.objects.filter(pk=269).update(read_only=True)
+
+        context = self.get_sections()
+        self.assertEquals(context["Buildings & Heating"]["responses"], 2)
+        self.assertEquals(context["Buildings & Heating"]["total"], 6)
+
+    def test_query_count(self):
+        u = User.objects.get(username="admin")
+        self.client.force_login(u)
+
+        with CaptureQueriesContext(connection) as before:
+            self.get_sections()
+
+        session = MarkingSession.objects.get(label="Default")
+        for i in range(10):
+            section = Section.objects.create(
+                title=f"Section {i}", marking_session=session
+            )
+            q = Question.objects.create(section=section, number=1, description="q")
+            q.questiongroup.add(1)
+
+        with CaptureQueriesContext(connection) as after:
+            context = self.get_sections()
+
+        self.assertEquals(len(context.keys()), 17)
+        self.assertEquals(context["Section 1"], {"responses": 0, "total": 1})
+        self.assertEquals(len(after), len(before))
+
 
 class TestAuthorityLoginView(BaseTestCase):
     def test_view(self):
@@ -38,27 +38,31 @@ class AuthorityAuditSectionQuestions(BaseQuestionView):
         first_rt = ResponseType.objects.get(type="First Mark")
         ror_rt = ResponseType.objects.get(type="Right of Reply")
 
-        first_responses = Response.objects.filter(
-            authority=self.authority,
-            question__in=self.questions,
-            response_type=first_rt,
-        ).select_related("question")
+        first_responses = (
+            Response.objects.filter(
+                authority=self.authority,
+                question__in=self.questions,
+                response_type=first_rt,
+            )
+            .select_related("option")
+            .prefetch_related("multi_option")
+        )
 
         ror_responses = Response.objects.filter(
             authority=self.authority, question__in=self.questions, response_type=ror_rt
-        ).select_related("question")
+        )
 
         for r in first_responses:
-            data = initial[r.question.id]
+            data = initial[r.question_id]
             data["original_response"] = r
 
-            initial[r.question.id] = data
+            initial[r.question_id] = data
 
         for r in ror_responses:
-            data = initial[r.question.id]
+            data = initial[r.question_id]
             data["ror_response"] = r
 
-            initial[r.question.id] = data
+            initial[r.question_id] = data
 
         return initial
 
@@ -73,8 +77,7 @@ class AuthorityAuditSectionQuestions(BaseQuestionView):
 
         return permitted
 
-    def process_form(self, form):
-        log_start = f"[{self.request.user.id}-{self.authority.id}-{self.section.id}]"
+    def should_save_form(self, form):
         cleaned_data = form.cleaned_data
         # XXX work out what the field is
         if (
@@ -83,13 +86,10 @@ class AuthorityAuditSectionQuestions(BaseQuestionView):
         ):
             form.instance.response_type = self.rt
             form.instance.user = self.request.user
-            form.save()
-            logger.debug(f"{log_start} saved form {form.prefix}")
-        elif form.initial.get("id", None) is not None:
-            form.save()
-            logger.debug(f"{log_start} saved blank form {form.prefix}")
-        else:
-            logger.debug(f"{log_start} did not save form {form.prefix}")
+            return True
+
+        # blank out an existing answer
+        return form.initial.get("id", None) is not None
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
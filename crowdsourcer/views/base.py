@@ -1,3 +1,4 @@
+import csv
 import logging
 
 from django.conf import settings
@@ -6,14 +7,24 @@ from django.contrib.auth.models import User
 from django.contrib.auth.signals import user_logged_in, user_login_failed
 from django.core.exceptions import PermissionDenied
 from django.core.mail import mail_admins
+from django.db import transaction
 from django.db.models import Count, F, FloatField, OuterRef, Subquery
 from django.db.models.functions import Cast, Now
 from django.dispatch import receiver
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from django.views.generic import ListView, TemplateView
 
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
+
 from crowdsourcer.forms import ResponseForm, ResponseFormset
+from crowdsourcer.marking import (
+    annotate_progress_counts,
+    get_section_progress,
+    invalidate_assignment_progress,
+    update_progress_counters,
+)
 from crowdsourcer.models import (
     Assigned,
     Marker,
@@ -23,10 +34,36 @@ from crowdsourcer.models import (
     ResponseType,
     Section,
 )
+from crowdsourcer.scoring import materialised_scores_enabled, update_section_score
 
 logger = logging.getLogger(__name__)
 
 
+class Echo:
+    """
+    File like object for csv.writer that returns each line rather than
+    storing it so that rows can be streamed.
+    """
+
+    def write(self, value):
+        return value
+
+
+class StreamingCSVMixin:
+    """
+    Streams context["rows"] as a CSV file, so if rows is a generator the
+    whole file never needs to be held in memory.
+    """
+
+    def render_to_response(self, context, **response_kwargs):
+        writer = csv.writer(Echo())
+        return StreamingHttpResponse(
+            (writer.writerow(row) for row in context["rows"]),
+            content_type="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="{self.file_name}"'},
+        )
+
+
 class BaseQuestionView(TemplateView):
     model = Response
     formset = ResponseFormset
@@ -36,6 +73,7 @@ class BaseQuestionView(TemplateView):
     how_marked_in = ["volunteer", "national_volunteer"]
     has_previous_questions = False
     read_only_questions = True
+    bulk_save = True
 
     def setup(self, request, *args, **kwargs):
         super().setup(request, *args, **kwargs)
@@ -80,15 +118,19 @@ class BaseQuestionView(TemplateView):
 
     def add_previous(self, initial, rt):
         question_list = self.questions.values_list("previous_question_id", flat=True)
-        prev_responses = Response.objects.filter(
-            authority=self.authority,
-            question_id__in=question_list,
-            response_type=rt,
-        ).select_related("question")
+        prev_responses = (
+            Response.objects.filter(
+                authority=self.authority,
+                question_id__in=question_list,
+                response_type=rt,
+            )
+            .select_related("option")
+            .prefetch_related("multi_option")
+        )
 
         response_map = {}
         for r in prev_responses:
-            response_map[r.question.id] = r
+            response_map[r.question_id] = r
 
         for q in self.questions:
             data = initial[q.id]
@@ -99,27 +141,34 @@ class BaseQuestionView(TemplateView):
         return initial
 
     def get_initial_obj(self):
-        self.authority = get_object_or_404(PublicAuthority, name=self.kwargs["name"])
+        self.authority = get_object_or_404(
+            PublicAuthority.objects.select_related("questiongroup"),
+            name=self.kwargs["name"],
+        )
         section = get_object_or_404(
-            Section,
+            Section.objects.select_related("marking_session"),
             title=self.kwargs["section_title"],
             marking_session=self.request.current_session,
         )
         self.section = section
-        self.questions = Question.objects.filter(
-            section=section,
-            questiongroup=self.authority.questiongroup,
-            how_marked__in=self.how_marked_in,
-        ).order_by("number", "number_part")
+        self.questions = (
+            Question.objects.filter(
+                section=section,
+                questiongroup=self.authority.questiongroup,
+                how_marked__in=self.how_marked_in,
+            )
+            .select_related("section__marking_session")
+            .order_by("number", "number_part")
+        )
         if self.read_only_questions and not self.request.user.is_superuser:
             self.questions = self.questions.exclude(read_only=True)
 
         responses = Response.objects.filter(
             authority=self.authority, question__in=self.questions, response_type=self.rt
-        ).select_related("question")
+        ).only("id", "question_id", "private_notes")
 
         initial = {}
-        for q in self.questions.all():
+        for q in self.questions:
             data = {
                 "authority": self.authority,
                 "question": q,
@@ -127,11 +176,11 @@ class BaseQuestionView(TemplateView):
             initial[q.id] = data
 
         for r in responses:
-            data = initial[r.question.id]
+            data = initial[r.question_id]
             data["id"] = r.id
             data["private_notes"] = r.private_notes
 
-            initial[r.question.id] = data
+            initial[r.question_id] = data
 
         return initial
 
@@ -174,6 +223,113 @@ class BaseQuestionView(TemplateView):
 
         return post_hash != previous_post_hash
 
+    def should_save_form(self, form):
+        """
+        Returns True if the answer in the form should be saved, setting
+        anything on the response that isn't in the form.
+        """
+        return True
+
+    def process_form(self, form):
+        if self.should_save_form(form):
+            form.save()
+            logger.debug(f"saved form {form.prefix}")
+        else:
+            logger.debug(f"did not save form {form.prefix}")
+
+    def get_is_answered(self, form):
+        # the same as Response.get_is_answered but using the submitted multi
+        # options as they are not saved yet
+        response = form.instance
+        if self.rt.type == "Right of Reply":
+            return response.agree_with_response is not None
+
+        return response.option_id is not None or bool(
+            form.cleaned_data.get("multi_option", None)
+        )
+
+    def save_forms_bulk(self, formset):
+        """
+        Save the answers that have changed with a few bulk queries rather
+        than several for each form. This skips the Response signals so the
+        progress counts, cached progress and scores they keep up to date are
+        updated once for the section afterwards.
+        """
+        forms = [
+            form
+            for form in formset
+            if form.has_changed() and self.should_save_form(form)
+        ]
+        if not forms:
+            return 0
+
+        now = timezone.now()
+        response_fields = {
+            f.name for f in Response._meta.concrete_fields if not f.primary_key
+        }
+        update_fields = {"user", "response_type", "last_update", "is_answered"}
+
+        created = []
+        updated = []
+        multi_options = []
+        for form in forms:
+            response = form.instance
+            response.last_update = now
+            response.is_answered = self.get_is_answered(form)
+
+            if response.pk is None:
+                created.append(response)
+            else:
+                updated.append(response)
+                update_fields.update(
+                    name for name in form.changed_data if name in response_fields
+                )
+
+            if "multi_option" in form.fields and (
+                response.pk is None or "multi_option" in form.changed_data
+            ):
+                multi_options.append((response, form.cleaned_data["multi_option"]))
+
+        session_id = self.section.marking_session_id
+        with transaction.atomic():
+            if created:
+                bulk_create_with_history(created, Response, default_date=now)
+            if updated:
+                # the multi options are not saved yet, so is_answered and the
+                # progress are brought up to date below instead
+                bulk_update_with_history(
+                    updated,
+                    Response,
+                    sorted(update_fields),
+                    default_date=now,
+                    manager=Response.objects.without_changed_signal(),
+                )
+
+            if multi_options:
+                through = Response.multi_option.through
+                through.objects.filter(
+                    response_id__in=[response.pk for response, _ in multi_options]
+                ).delete()
+                through.objects.bulk_create(
+                    [
+                        through(response_id=response.pk, option_id=option.pk)
+                        for response, options in multi_options
+                        for option in options
+                    ]
+                )
+
+            update_progress_counters(
+                session_id,
+                authority_ids=[self.authority.id],
+                section_ids=[self.section.id],
+            )
+            if materialised_scores_enabled() and self.rt.type == "Audit":
+                update_section_score(self.authority, self.section)
+
+        invalidate_assignment_progress(session_id)
+
+        return len(forms)
+
     def post(self, *args, **kwargs):
         self.check_permissions()
         section_title = self.kwargs.get("section_title", "")
@@ -189,9 +345,13 @@ class BaseQuestionView(TemplateView):
             logger.debug(f"{log_start} form IS VALID")
             post_hash = self.get_post_hash()
             if self.check_form_not_resubmitted(post_hash):
-                logger.debug(f"{log_start} form saved")
-                for form in formset:
-                    self.process_form(form)
+                if self.bulk_save:
+                    saved = self.save_forms_bulk(formset)
+                    logger.debug(f"{log_start} form saved, {saved} answers changed")
+                else:
+                    logger.debug(f"{log_start} form saved")
+                    for form in formset:
+                        self.process_form(form)
                 self.request.session[self.session_form_hash()] = post_hash
             else:
                 logger.debug(f"{log_start} form RESUBMITTED, not saving")
@@ -205,7 +365,10 @@ class BaseQuestionView(TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        form = self.get_form()
+        # an invalid formset is passed in so there's no need to build it again
+        form = kwargs.get("form", None)
+        if form is None:
+            form = self.get_form()
 
         if self.read_only_questions and not self.request.user.is_superuser:
             for q_form in form:
@@ -216,9 +379,7 @@ class BaseQuestionView(TemplateView):
 
         context["form"] = form
         context["section_title"] = self.kwargs.get("section_title", "")
-        context["authority"] = PublicAuthority.objects.get(
-            name=self.kwargs.get("name", "")
-        )
+        context["authority"] = self.authority
         context["authority_name"] = self.kwargs.get("name", "")
         context["page_title"] = (
             f"{self.title_start}{context['authority_name']}: {context['section_title']}"
@@ -267,7 +428,9 @@ class BaseResponseJSONView(TemplateView):
 
     def get_initial_obj(self):
         self.authority = PublicAuthority.objects.get(name=self.kwargs["name"])
-        self.question = Question.objects.get(id=self.kwargs["question"])
+        self.question = Question.objects.select_related("section__marking_session").get(
+            id=self.kwargs["question"]
+        )
         instance = None
         log_start = f"{self.log_start}[{self.request.user.id}-{self.question.id}]"
 
@@ -278,10 +441,14 @@ class BaseResponseJSONView(TemplateView):
         logger.debug(
             f"{log_start} checking for initial object for {self.authority}, {self.question}, {self.rt}"
         )
+        responses = Response.objects.filter(
+            authority=self.authority, question=self.question, response_type=self.rt
+        )
+        # lock the response while checking the version and saving
+        if self.request.POST:
+            responses = responses.select_for_update()
         try:
-            instance = Response.objects.get(
-                authority=self.authority, question=self.question, response_type=self.rt
-            )
+            instance = responses.get()
             logger.debug(
                 f"{log_start} FOUND initial object for {self.authority}, {self.question}, {self.rt}"
             )
@@ -295,6 +462,7 @@ class BaseResponseJSONView(TemplateView):
                 "public_notes",
             ]:
                 initial[f] = getattr(instance, f)
+            initial["multi_option"] = list(instance.multi_option.all())
             logger.debug(f"{log_start} initial data is {initial}")
         except Response.DoesNotExist:
             logger.debug(
@@ -305,15 +473,7 @@ class BaseResponseJSONView(TemplateView):
             logger.debug(
                 f"{log_start} DUPLICATES for find initial object for {self.authority}, {self.question}, {self.rt}, selecting latest"
             )
-            instance = (
-                Response.objects.filter(
-                    authority=self.authority,
-                    question=self.question,
-                    response_type=self.rt,
-                )
-                .order_by("-pk")
-                .first()
-            )
+            instance = responses.order_by("-pk").first()
             section_title = self.kwargs.get("section_title", "")
             mail_admins(
                 f"Duplicate response for {self.authority}, {section_title}, {self.question.number_and_part} {self.rt}",
@@ -367,10 +527,42 @@ Found a duplicate response when doing a JSON save. Have selected the most recent
         )
         logger.debug(f"post data is {self.request.POST}")
 
-        form = self.get_form()
-        logger.debug(f"{log_start} got form")
-        if form.is_valid():
+        with transaction.atomic():
+            form = self.get_form()
+            logger.debug(f"{log_start} got form")
+            if not form.is_valid():
+                logger.debug(f"{log_start} form NOT VALID, errors are {form.errors}")
+                return JsonResponse({"success": 0, "errors": form.errors})
+
             logger.debug(f"{log_start} form IS VALID")
+            current_version = form.instance.version
+            if not form.has_changed():
+                logger.debug(f"{log_start} form UNCHANGED, not saving")
+                return JsonResponse(
+                    {"success": 1, "unchanged": 1, "version": current_version}
+                )
+
+            # the version the page was loaded with, missing if the page was
+            # loaded before versions were added
+            version = self.request.POST.get("version", None)
+            if version is not None and version != current_version:
+                logger.debug(
+                    f"{log_start} form STALE, version {version} is not {current_version}"
+                )
+                return JsonResponse(
+                    {
+                        "success": 0,
+                        "stale": 1,
+                        "version": current_version,
+                        "errors": {
+                            "__all__": [
+                                "This answer has been changed since the page was loaded, please reload the page"
+                            ]
+                        },
+                    },
+                    status=409,
+                )
+
             post_hash = self.get_post_hash()
             if self.check_form_not_resubmitted(post_hash):
                 logger.debug(f"{log_start} form GOOD, saving")
@@ -380,11 +572,8 @@ Found a duplicate response when doing a JSON save. Have selected the most recent
                 self.request.session[self.session_form_hash()] = post_hash
             else:
                 logger.debug(f"{log_start} form RESUBMITTED, not saving")
-        else:
-            logger.debug(f"{log_start} form NOT VALID, errors are {form.errors}")
-            return JsonResponse({"success": 0, "errors": form.errors})
 
-        return JsonResponse({"success": 1})
+        return JsonResponse({"success": 1, "version": form.instance.version})
 
     # there are occassional issues with the same form being resubmitted twice the first time
     # someone saves a result which means you get two responses saved for the same question which
@@ -475,38 +664,17 @@ class BaseAllSectionProgressView(UserPassesTestMixin, ListView):
 
         rt = ResponseType.objects.get(type=self.response_type)
 
+        section_progress = get_section_progress(
+            self.request.current_session, rt, self.types
+        )
+
         progress = {}
         for section in context["sections"]:
-            questions = Question.objects.filter(
-                section=section, how_marked__in=self.types
-            )
-            question_list = list(questions.values_list("id", flat=True))
-            authorities = PublicAuthority.response_counts(
-                question_list,
-                section.title,
-                self.request.user,
-                self.request.current_session,
-                question_types=self.types,
-                response_type=rt,
-            ).distinct()
-
-            total = 0
-            complete = 0
-            started = 0
-            for authority in authorities:
-                total = total + 1
-                if authority.num_responses is not None and authority.num_responses > 0:
-                    started = started + 1
-                if (
-                    authority.num_questions is not None
-                    and authority.num_responses == authority.num_questions
-                ):
-                    complete = complete + 1
-
+            counts = section_progress[section.id]
             progress[section.title] = {
-                "total": total,
-                "complete": complete,
-                "started": started,
+                "total": counts["total"],
+                "complete": counts["complete"],
+                "started": counts["started"],
             }
 
         assigned = Section.objects.filter(
@@ -548,21 +716,19 @@ class BaseSectionProgressView(UserPassesTestMixin, ListView):
             title=self.kwargs["section_title"],
             marking_session=self.request.current_session,
         )
-        questions = Question.objects.filter(section=section, how_marked__in=self.types)
         rt = ResponseType.objects.get(type=self.response_type)
 
-        question_list = list(questions.values_list("id", flat=True))
-
         authorities = (
-            PublicAuthority.response_counts(
-                question_list,
-                section.title,
-                self.request.user,
+            annotate_progress_counts(
+                PublicAuthority.objects.filter(
+                    marking_session=self.request.current_session
+                ),
                 self.request.current_session,
-                question_types=self.types,
-                response_type=rt,
+                rt,
+                self.types,
+                section=section,
             )
-            .distinct()
+            .filter(num_questions__gt=0)
             .annotate(
                 qs_left=Cast(F("num_responses"), FloatField())
                 / Cast(F("num_questions"), FloatField())
@@ -7,10 +7,15 @@ from django.urls import reverse
 from django.views.generic import FormView, ListView, TemplateView
 
 from crowdsourcer.forms import SessionPropertyForm
-from crowdsourcer.marking import get_assignment_progress, get_cached_assignment_progress
+from crowdsourcer.marking import (
+    get_assignment_progress_bulk,
+    get_assignment_progress_generation,
+    get_cached_assignment_progress,
+    save_cached_assignment_progress,
+)
+from crowdsourcer.middleware import get_active_sessions
 from crowdsourcer.models import (
     Assigned,
-    MarkingSession,
     PublicAuthority,
     ResponseType,
     SessionProperties,
@@ -37,6 +42,8 @@ class OverviewView(ListView):
     template_name = "crowdsourcer/assignments.html"
     model = Assigned
     context_object_name = "assignments"
+    # use the shared progress cache for users who can see all assignments
+    cache_progress = True
 
     def dispatch(self, request, *args, **kwargs):
         user = self.request.user
@@ -158,24 +165,37 @@ class OverviewView(ListView):
             return context
 
         progress = None
-        if user.has_perm("crowdsourcer.can_view_all_responses"):
+        if self.cache_progress and user.has_perm("crowdsourcer.can_view_all_responses"):
             if hasattr(user, "marker"):
                 m = user.marker
                 response_type = m.response_type.type
             else:
                 response_type = self.request.current_stage.type
-            progress = get_cached_assignment_progress(
-                f"{self.request.current_session.label} {response_type}"
-            )
+
+            session = self.request.current_session
+            cached = get_cached_assignment_progress(session, response_type)
+            if cached is None:
+                generation = get_assignment_progress_generation(session.id)
+                progress = get_assignment_progress_bulk(
+                    context["assignments"].filter(response_type__type=response_type),
+                    session.label,
+                    response_type,
+                )
+                cached = save_cached_assignment_progress(
+                    session, response_type, progress, generation=generation
+                )
+
+            progress = cached["progress"]
+            context["progress_computed_at"] = cached["computed_at"]
 
         if progress is None:
-            progress = get_assignment_progress(
+            progress = get_assignment_progress_bulk(
                 context["assignments"],
                 self.request.current_session.label,
                 self.request.current_stage.type,
             )
 
-        context["sessions"] = MarkingSession.objects.filter(active=True)
+        context["sessions"] = get_active_sessions()
         context["progress"] = progress
 
         context["page_title"] = "Assignments"
@@ -205,7 +225,7 @@ class AuthoritySectionQuestions(BaseQuestionView):
 
         return initial
 
-    def process_form(self, form):
+    def should_save_form(self, form):
         cleaned_data = form.cleaned_data
         if (
             cleaned_data.get("option", None) is not None
@@ -213,13 +233,12 @@ class AuthoritySectionQuestions(BaseQuestionView):
         ):
             form.instance.response_type = self.rt
             form.instance.user = self.request.user
-            form.save()
-            logger.debug(f"saved form {form.prefix}")
-        else:
-            logger.debug(f"did not save form {form.prefix}")
-            logger.debug(
-                f"option is {cleaned_data.get('option', None)}, multi is {cleaned_data.get('multi_option', None)}"
-            )
+            return True
+
+        logger.debug(
+            f"option is {cleaned_data.get('option', None)}, multi is {cleaned_data.get('multi_option', None)}"
+        )
+        return False
 
 
 class AuthoritySectionJSONQuestion(BaseResponseJSONView):
@@ -4,25 +4,33 @@ from datetime import datetime
 
 from django.contrib.auth.mixins import UserPassesTestMixin
 from django.contrib.auth.models import User
-from django.db.models import Count, F, FloatField, OuterRef, Subquery
+from django.db.models import (
+    Count,
+    F,
+    FilteredRelation,
+    FloatField,
+    OuterRef,
+    Q,
+    Subquery,
+)
 from django.db.models.functions import Cast
 from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
 from django.utils.timezone import make_aware
 from django.views.generic import ListView
 
-from crowdsourcer.models import (
-    Assigned,
-    Marker,
-    PublicAuthority,
-    Question,
-    Response,
-    ResponseType,
-    Section,
+from crowdsourcer.marking import (
+    annotate_progress_counts,
+    get_section_progress,
+    get_volunteer_progress,
+    iter_assignment_progress_bulk,
 )
+from crowdsourcer.models import Assigned, Marker, PublicAuthority, ResponseType, Section
 from crowdsourcer.views.base import (
     BaseAllSectionProgressView,
     BaseAuthorityAssignmentView,
     BaseSectionProgressView,
+    StreamingCSVMixin,
 )
 from crowdsourcer.views.marking import OverviewView
 
@@ -66,42 +74,17 @@ class BaseAllAuthorityProgressView(UserPassesTestMixin, ListView):
 
     def get_queryset(self):
         response_type = ResponseType.objects.get(type=self.stage)
-        qs = (
+        qs = annotate_progress_counts(
             PublicAuthority.objects.filter(
                 marking_session=self.request.current_session,
                 questiongroup__marking_session=self.request.current_session,
-            )
-            .annotate(
-                num_questions=Subquery(
-                    Question.objects.filter(
-                        questiongroup=OuterRef("questiongroup"),
-                        section__marking_session=self.request.current_session,
-                        how_marked__in=self.types,
-                    )
-                    .values("questiongroup")
-                    .annotate(num_questions=Count("pk"))
-                    .values("num_questions")
-                ),
-            )
-            .annotate(
-                num_responses=Subquery(
-                    Response.objects.filter(
-                        question__questiongroup=OuterRef("questiongroup"),
-                        question__section__marking_session=self.request.current_session,
-                        authority=OuterRef("pk"),
-                        response_type=response_type,
-                        question__how_marked__in=self.types,
-                    )
-                    .exclude(id__in=Response.null_responses(stage_name=self.stage))
-                    .values("authority")
-                    .annotate(response_count=Count("question_id", distinct=True))
-                    .values("response_count")
-                )
-            )
-            .annotate(
-                qs_left=Cast(F("num_responses"), FloatField())
-                / Cast(F("num_questions"), FloatField())
-            )
+            ),
+            self.request.current_session,
+            response_type,
+            self.types,
+        ).annotate(
+            qs_left=Cast(F("num_responses"), FloatField())
+            / Cast(F("num_questions"), FloatField())
         )
 
         return qs
@@ -166,54 +149,44 @@ class BaseAuthorityProgressView(UserPassesTestMixin, ListView):
         context = super().get_context_data(**kwargs)
 
         name = self.kwargs["name"]
-        progress = {}
-
+        authority = get_object_or_404(PublicAuthority, name=name)
         stage = ResponseType.objects.get(type=self.stage)
-        sections = context["sections"]
 
-        for section in sections:
-            questions = Question.objects.filter(
-                section=section, how_marked__in=self.types
-            )
-            if self.ignore_read_only:
-                questions = questions.exclude(read_only=True)
-
-            question_list = list(questions.values_list("id", flat=True))
-            qs = (
-                PublicAuthority.objects.filter(name=name)
-                .annotate(
-                    num_questions=Subquery(
-                        Question.objects.filter(
-                            questiongroup=OuterRef("questiongroup"),
-                            how_marked__in=self.types,
-                            pk__in=question_list,
-                        )
-                        .values("questiongroup")
-                        .annotate(num_questions=Count("pk"))
-                        .values("num_questions")
+        questions = Q(
+            question__how_marked__in=self.types,
+            question__questiongroup=authority.questiongroup_id,
+        )
+        if self.ignore_read_only:
+            questions &= Q(question__read_only=False)
+
+        answered = Q(authority_responses__is_answered=True)
+
+        # count the questions and answered questions for every section in one
+        # query by only joining this authority's responses for the stage
+        sections = (
+            context["sections"]
+            .annotate(
+                authority_responses=FilteredRelation(
+                    "question__response",
+                    condition=Q(
+                        question__response__authority=authority,
+                        question__response__response_type=stage,
                     ),
                 )
-                .annotate(
-                    num_responses=Subquery(
-                        Response.objects.filter(
-                            authority=OuterRef("pk"),
-                            question__in=question_list,
-                            response_type=stage,
-                        )
-                        .exclude(id__in=Response.null_responses(stage_name=self.stage))
-                        .values("authority")
-                        .annotate(response_count=Count("question_id", distict=True))
-                        .values("response_count")
-                    )
-                )
             )
-            authority = qs.first()
-            responses = authority.num_responses
-            if responses is None:
-                responses = 0
+            .annotate(
+                num_questions=Count("question", distinct=True, filter=questions),
+                num_responses=Count(
+                    "question", distinct=True, filter=questions & answered
+                ),
+            )
+        )
+
+        progress = {}
+        for section in sections:
             progress[section.title] = {
-                "responses": responses,
-                "total": authority.num_questions,
+                "responses": section.num_responses,
+                "total": section.num_questions,
             }
 
         context["sections"] = progress
@@ -237,115 +210,87 @@ class VolunteerProgressView(UserPassesTestMixin, ListView):
         return self.request.user.is_superuser
 
     def get_queryset(self):
-        user = User.objects.get(id=self.kwargs["id"])
+        self.volunteer = get_object_or_404(User, id=self.kwargs["id"])
 
         # XXX need to show stage on list
         sections = Section.objects.filter(
             marking_session=self.request.current_session,
-            id__in=Assigned.objects.filter(user=user).values_list("section", flat=True),
+            id__in=Assigned.objects.filter(user=self.volunteer).values_list(
+                "section", flat=True
+            ),
         )
 
         return sections
 
+    def sort_authorities(self, authorities):
+        def qs_left(authority):
+            if not authority["num_questions"]:
+                return None
+            return authority["num_responses"] / authority["num_questions"]
+
+        if self.request.GET.get("sort", None) == "asc":
+            return sorted(
+                authorities,
+                key=lambda a: (qs_left(a) is not None, qs_left(a) or 0, a["name"]),
+            )
+
+        return sorted(
+            authorities,
+            key=lambda a: (qs_left(a) is None, -(qs_left(a) or 0), a["name"]),
+        )
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         sections = context["sections"]
 
-        user = User.objects.get(id=self.kwargs["id"])
-        progress = []
+        user = self.volunteer
+        volunteer_progress = get_volunteer_progress(
+            Assigned.objects.filter(user=user), self.request.current_session
+        )
 
-        types = {
-            "First Mark": Question.VOLUNTEER_TYPES,
-            "Right of Reply": Question.VOLUNTEER_TYPES,
-            "Audit": ["volunteer", "national_volunteer", "foi"],
+        authority_url_names = {
+            "First Mark": "authority_question_edit",
+            "Right of Reply": "authority_ror",
+            "Audit": "authority_audit",
         }
 
+        progress = []
+        response_types = list(ResponseType.objects.all())
         for section in sections:
             section_details = {
                 "section": section,
                 "totals": {"total": 0, "complete": 0},
                 "responses": {},
             }
-            for rt in ResponseType.objects.all():
-                assigned = Assigned.objects.filter(
-                    user=user,
-                    section=section,
-                    response_type=rt,
-                ).values_list("authority", flat=True)
-
-                authorities = (
-                    PublicAuthority.objects.filter(id__in=assigned)
-                    .annotate(
-                        num_questions=Subquery(
-                            Question.objects.filter(
-                                section=section,
-                                questiongroup=OuterRef("questiongroup"),
-                                how_marked__in=types[rt.type],
-                            )
-                            .values("questiongroup")
-                            .annotate(num_questions=Count("pk"))
-                            .values("num_questions")
-                        ),
-                    )
-                    .annotate(
-                        num_responses=Subquery(
-                            Response.objects.filter(
-                                question__section=section,
-                                question__questiongroup=OuterRef("questiongroup"),
-                                authority=OuterRef("pk"),
-                                response_type=rt,
-                                question__how_marked__in=types[rt.type],
-                            )
-                            .exclude(id__in=Response.null_responses(stage_name=rt.type))
-                            .values("authority")
-                            .annotate(
-                                response_count=Count("question_id", distinct=True)
-                            )
-                            .values("response_count")
-                        )
-                    )
-                    .annotate(
-                        qs_left=Cast(F("num_responses"), FloatField())
-                        / Cast(F("num_questions"), FloatField())
-                    )
+            for rt in response_types:
+                authorities = self.sort_authorities(
+                    volunteer_progress.get((user.id, section.id, rt.id), [])
                 )
 
-                sort_order = self.request.GET.get("sort", None)
-                if sort_order is None or sort_order != "asc":
-                    authorities = authorities.order_by(
-                        F("qs_left").desc(nulls_last=True), "name"
-                    )
-
-                else:
-                    authorities = authorities.order_by(
-                        F("qs_left").asc(nulls_first=True), "name"
-                    )
-
                 council_totals = {"total": 0, "complete": 0}
-
                 for a in authorities:
                     council_totals["total"] = council_totals["total"] + 1
-                    if a.num_questions == a.num_responses:
+                    if (
+                        a["num_questions"] is not None
+                        and a["num_questions"] == a["num_responses"]
+                    ):
                         council_totals["complete"] = council_totals["complete"] + 1
 
-                if rt.type == "First Mark":
-                    authority_url_name = "authority_question_edit"
-                elif rt.type == "Audit":
-                    authority_url_name = "authority_audit"
                 section_details["responses"][rt.type] = {
                     "authorities": authorities,
                     "totals": council_totals,
-                    "authority_url_name": authority_url_name,
+                    "authority_url_name": authority_url_names.get(
+                        rt.type, "authority_question_edit"
+                    ),
                 }
                 section_details["totals"]["total"] += council_totals["total"]
                 section_details["totals"]["complete"] += council_totals["complete"]
 
             progress.append(section_details)
 
-        if self.request.current_stage.type == "First Mark":
-            authority_url_name = "authority_question_edit"
-        elif self.request.current_stage.type == "Audit":
-            authority_url_name = "authority_audit"
+        authority_url_name = authority_url_names.get(
+            self.request.current_stage.type, "authority_question_edit"
+        )
 
         context["user"] = user
         context["sections"] = progress
@@ -355,7 +300,10 @@ class VolunteerProgressView(UserPassesTestMixin, ListView):
         return context
 
 
-class VolunteerProgressCSVView(UserPassesTestMixin, OverviewView):
+class VolunteerProgressCSVView(UserPassesTestMixin, StreamingCSVMixin, ListView):
+    model = Assigned
+    file_name = "volunteer_progress.csv"
+
     def test_func(self):
         return self.request.user.is_superuser
 
@@ -370,10 +318,8 @@ class VolunteerProgressCSVView(UserPassesTestMixin, OverviewView):
             )
         return assigned
 
-    def render_to_response(self, context, **response_kwargs):
-        response = HttpResponse(content_type="text/csv")
-        writer = csv.writer(response)
-        headers = [
+    def get_rows(self, progress):
+        yield [
             "username",
             "section",
             "stage",
@@ -381,8 +327,8 @@ class VolunteerProgressCSVView(UserPassesTestMixin, OverviewView):
             "councils_started",
             "councils_completed",
         ]
-        writer.writerow(headers)
-        for stats in context["progress"]:
+
+        for stats in progress:
             a = stats["assignment"]
             section = "No section assigned"
             stage = "No stage assigned"
@@ -390,7 +336,7 @@ class VolunteerProgressCSVView(UserPassesTestMixin, OverviewView):
                 section = a.section.title
             if a.response_type is not None:
                 stage = a.response_type.type
-            row = [
+            yield [
                 a.user.username,
                 section,
                 stage,
@@ -398,8 +344,16 @@ class VolunteerProgressCSVView(UserPassesTestMixin, OverviewView):
                 stats["started"],
                 stats["complete"],
             ]
-            writer.writerow(row)
-        return response
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        progress = iter_assignment_progress_bulk(
+            context["object_list"],
+            self.request.current_session.label,
+            self.request.current_stage.type,
+        )
+        context["rows"] = self.get_rows(progress)
+        return context
 
 
 class AuthorityAssignmentView(BaseAuthorityAssignmentView):
@@ -498,57 +452,15 @@ class AllSectionChallengeView(UserPassesTestMixin, ListView):
         context = super().get_context_data(**kwargs)
 
         types = ["volunteer", "national_volunteer", "foi"]
-        response_types = ResponseType.objects.get(type="Right of Reply")
+        response_type = ResponseType.objects.get(type="Right of Reply")
+
+        section_progress = get_section_progress(
+            self.request.current_session, response_type, types
+        )
 
         progress = {}
         for section in context["sections"]:
-            questions = Question.objects.filter(section=section, how_marked__in=types)
-            question_list = list(questions.values_list("id", flat=True))
-            authorities = (
-                PublicAuthority.response_counts(
-                    question_list,
-                    section.title,
-                    self.request.user,
-                    self.request.current_session,
-                    response_type=response_types,
-                    question_types=types,
-                    right_of_reply=True,
-                )
-                .annotate(
-                    num_challenges=Subquery(
-                        Response.objects.filter(
-                            authority=OuterRef("pk"),
-                            question__in=question_list,
-                            response_type=response_types,
-                            agree_with_response=False,
-                        )
-                        .values("authority")
-                        .annotate(response_count=Count("question_id", distict=True))
-                        .values("response_count")
-                    )
-                )
-                .distinct()
-            )
-
-            total = 0
-            complete = 0
-            started = 0
-            challenges = 0
-            for authority in authorities:
-                total = total + 1
-                if authority.num_responses is not None and authority.num_responses > 0:
-                    started = started + 1
-                if authority.num_responses == authority.num_questions:
-                    complete = complete + 1
-                if authority.num_challenges is not None:
-                    challenges = challenges + authority.num_challenges
-
-            progress[section.title] = {
-                "total": total,
-                "complete": complete,
-                "started": started,
-                "challenges": challenges,
-            }
+            progress[section.title] = section_progress[section.id]
 
         context["page_title"] = "Section Challenges"
         context["progress"] = progress
@@ -10,6 +10,7 @@ from django.urls import reverse
 from django.views.generic import ListView
 
 from crowdsourcer.forms import RORResponseFormset
+from crowdsourcer.marking import get_authority_ror_section_progress
 from crowdsourcer.models import (
     Assigned,
     Marker,
@@ -73,6 +74,7 @@ class AuthorityRORSectionList(ListView):
             raise PermissionDenied
 
         authority = PublicAuthority.objects.get(name=self.kwargs["name"])
+        self.authority = authority
         if user.is_superuser is False:
             if hasattr(user, "marker"):
                 marker = user.marker
@@ -113,53 +115,20 @@ class AuthorityRORSectionList(ListView):
         question_types = ["volunteer", "national_volunteer", "foi"]
 
         response_type = ResponseType.objects.get(type="Right of Reply")
-        authority = PublicAuthority.objects.get(name=context["authority_name"])
+        responses_to_ignore = SessionConfig.get_config(
+            self.request.current_session, "right_of_reply_responses_to_ignore"
+        )
 
+        progress = get_authority_ror_section_progress(
+            self.authority,
+            sections,
+            self.request.current_session,
+            question_types,
+            responses_to_ignore=responses_to_ignore,
+        )
         for section in sections:
-            responses_to_ignore = SessionConfig.get_config(
-                self.request.current_session, "right_of_reply_responses_to_ignore"
-            )
-            if responses_to_ignore:
-                questions = (
-                    Response.objects.filter(
-                        authority=authority,
-                        question__section=section,
-                        question__how_marked__in=question_types,
-                        response_type=ResponseType.objects.get(type="First Mark"),
-                    )
-                    .exclude(option__description__in=responses_to_ignore)
-                    .exclude(multi_option__description__in=responses_to_ignore)
-                )
-                question_list = list(questions.values_list("question_id", flat=True))
-            else:
-                questions = Question.objects.filter(
-                    section=section,
-                    how_marked__in=question_types,
-                )
-                question_list = list(questions.values_list("id", flat=True))
-
-            args = [
-                question_list,
-                section.title,
-                self.request.user,
-                self.request.current_session,
-            ]
-
-            response_counts = PublicAuthority.response_counts(
-                *args,
-                assigned=[authority.id],
-                response_type=response_type,
-                question_types=question_types,
-                right_of_reply=True,
-            ).distinct()
-
-            section.complete = 0
-            section.total = 0
-            if response_counts.exists():
-                section.complete = response_counts.first().num_responses
-                section.total = response_counts.first().num_questions
-                if section.complete is None:
-                    section.complete = 0
+            section.complete = progress[section.id]["complete"]
+            section.total = progress[section.id]["total"]
 
         context["ror_user"] = True
         context["has_properties"] = SessionProperties.objects.filter(
@@ -193,15 +162,19 @@ class AuthorityRORSectionQuestions(BaseQuestionView):
         initial = super().get_initial_obj()
 
         rt = ResponseType.objects.get(type="First Mark")
-        responses = Response.objects.filter(
-            authority=self.authority, question__in=self.questions, response_type=rt
-        ).select_related("question")
+        responses = (
+            Response.objects.filter(
+                authority=self.authority, question__in=self.questions, response_type=rt
+            )
+            .select_related("option")
+            .prefetch_related("multi_option")
+        )
 
         for r in responses:
-            data = initial[r.question.id]
+            data = initial[r.question_id]
             data["original_response"] = r
 
-            initial[r.question.id] = data
+            initial[r.question_id] = data
 
         responses_to_ignore = SessionConfig.get_config(
             self.request.current_session, "right_of_reply_responses_to_ignore"
@@ -260,22 +233,21 @@ class AuthorityRORSectionQuestions(BaseQuestionView):
         if denied:
             raise PermissionDenied
 
-    def process_form(self, form):
-        rt = ResponseType.objects.get(type="Right of Reply")
+    def should_save_form(self, form):
         cleaned_data = form.cleaned_data
         if cleaned_data.get("agree_with_response", None) is not None:
-            form.instance.response_type = rt
+            form.instance.response_type = self.rt
             form.instance.user = self.request.user
-            form.save()
-            logger.debug(f"saved form {form.prefix}")
-        elif form.initial.get("id", None) is not None:
-            form.save()
-            logger.debug(f"saved blank form {form.prefix}")
-        else:
-            logger.debug(f"did not save form {form.prefix}")
-            logger.debug(
-                f"agree_with_response is {cleaned_data.get('agree_with_response', None)}"
-            )
+            return True
+
+        # blank out an existing answer
+        if form.initial.get("id", None) is not None:
+            return True
+
+        logger.debug(
+            f"agree_with_response is {cleaned_data.get('agree_with_response', None)}"
+        )
+        return False
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -3,18 +3,28 @@ import logging
 import re
 from collections import defaultdict
 
-from django.conf import settings
 from django.contrib.auth.mixins import UserPassesTestMixin
 from django.db.models import Count
-from django.http import HttpResponse, JsonResponse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.urls import reverse
 from django.utils.text import slugify
-from django.views.generic import ListView, TemplateView
+from django.views.generic import ListView, TemplateView, View
 
-import pandas as pd
 from django_filters.views import FilterView
 
+from crowdsourcer.exports import (
+    EXPORTS,
+    ChangedAutomaticPoints,
+    get_duplicate_response_sets,
+    get_exact_duplicate_ids,
+    get_section_scores_rows,
+    get_weighted_totals_rows,
+)
 from crowdsourcer.filters import ResponseFilter
+from crowdsourcer.jobs import enqueue_export
 from crowdsourcer.models import (
+    ExportJob,
     MarkingSession,
     Option,
     PublicAuthority,
@@ -22,19 +32,19 @@ from crowdsourcer.models import (
     Response,
     ResponseType,
     Section,
-    SessionConfig,
     SessionPropertyValues,
 )
 from crowdsourcer.scoring import (
-    clear_exception_cache,
-    get_all_question_data,
     get_duplicate_responses,
-    get_exact_duplicates,
+    get_multi_option_index,
     get_response_data,
+    get_score_exceptions,
     get_scoring_object,
     get_section_maxes,
+    iter_all_question_data,
     weighting_to_points,
 )
+from crowdsourcer.views.base import StreamingCSVMixin
 
 logger = logging.getLogger(__name__)
 
@@ -61,11 +71,14 @@ class AllMarksBaseCSVView(StatsUserTestMixin, ListView):
     file_name = "grace_first_mark_scores.csv"
 
     def get_queryset(self):
+        filters = {
+            "response_type__type": self.response_type,
+            "question__section__marking_session": self.request.current_session,
+        }
+        self.multi_option_index = get_multi_option_index(**filters)
+
         return (
-            Response.objects.filter(
-                response_type__type=self.response_type,
-                question__section__marking_session=self.request.current_session,
-            )
+            Response.objects.filter(**filters)
             .select_related("question", "authority", "question__section", "option")
             .order_by(
                 "authority",
@@ -73,17 +86,17 @@ class AllMarksBaseCSVView(StatsUserTestMixin, ListView):
                 "question__number",
                 "question__number_part",
             )
-            .annotate(multi_count=Count("multi_option__pk"))
         )
 
     def get_response_score(self, response):
         score = 0
 
+        multi = self.multi_option_index.get(response.id)
         if response.question.question_type == "negative":
             score = response.points
-        elif response.multi_count > 0:
-            for opt in response.multi_option.all():
-                score += opt.score
+        elif multi:
+            for _, opt_score, _ in multi:
+                score += opt_score
         elif response.option is not None:
             score = response.option.score
         else:
@@ -277,29 +290,34 @@ class QuestionDataCSVView(StatsUserTestMixin, ListView):
         q = self.kwargs["question"]
 
         q_number, q_part = re.search(r"(\d+)(\w*)", q).groups()
-        responses = (
-            Response.objects.filter(
-                question__section__marking_session=self.request.current_session,
-                question__section__title=section,
-                question__number=q_number,
-                response_type__type=self.response_type,
-            )
-            .annotate(multi_count=Count("multi_option__pk"))
-            .select_related("authority", "option")
-            .order_by("authority")
-        )
-
+        filters = {
+            "question__section__marking_session": self.request.current_session,
+            "question__section__title": section,
+            "question__number": q_number,
+            "response_type__type": self.response_type,
+        }
         if q_part is not None and q_part != "":
-            responses = responses.filter(question__number_part=q_part)
+            filters["question__number_part"] = q_part
 
-        return responses
+        self.multi_option_index = get_multi_option_index(**filters)
+        self.score_exceptions = get_score_exceptions(self.request.current_session)
+
+        return (
+            Response.objects.filter(**filters)
+            .select_related("authority", "option", "question", "question__section")
+            .order_by("authority")
+        )
 
     def blank_row(self, authority):
         return [authority, "-", "-", "-", "-", "-", "-"]
 
     def get_response_data(self, response):
         return get_response_data(
-            response, include_private=True, marking_session=self.request.current_session
+            response,
+            include_private=True,
+            marking_session=self.request.current_session,
+            multi_option_index=self.multi_option_index,
+            score_exceptions=self.score_exceptions,
         )
 
     def get_context_data(self, **kwargs):
@@ -307,7 +325,6 @@ class QuestionDataCSVView(StatsUserTestMixin, ListView):
 
         answers = {}
 
-        clear_exception_cache()
         for response in context["responses"]:
             data = self.get_response_data(response)
             answers[response.authority.name] = data
@@ -380,7 +397,6 @@ class RoRQuestionDataCSVView(QuestionDataCSVView):
 
 class BaseScoresView(StatsUserTestMixin, TemplateView):
     def get_scores(self):
-        clear_exception_cache()
         self.scoring = get_scoring_object(self.request.current_session)
 
     def render_to_response(self, context, **response_kwargs):
@@ -394,7 +410,7 @@ class BaseScoresView(StatsUserTestMixin, TemplateView):
         return response
 
 
-class AllAnswerDataView(BaseScoresView):
+class AllAnswerDataView(StreamingCSVMixin, BaseScoresView):
     file_name = "all_answer_data.csv"
 
     def get_context_data(self, **kwargs):
@@ -406,13 +422,87 @@ class AllAnswerDataView(BaseScoresView):
             self.file_name = f"all_answer_data_{slugify(args['response_type'])}.csv"
 
         self.get_scores()
-        context["rows"] = get_all_question_data(
+        context["rows"] = iter_all_question_data(
             self.scoring, marking_session=self.request.current_session.label, **args
         )
 
         return context
 
 
+class ExportJobView(StatsUserTestMixin, TemplateView):
+    """
+    Shows the progress of the background job for an export, and a link to
+    download the file from the last run. POSTing queues a new run.
+    """
+
+    template_name = "crowdsourcer/stats/export_job.html"
+
+    def get_export(self):
+        export = EXPORTS.get(self.kwargs["export"])
+        if export is None:
+            raise Http404("No such export")
+        return export
+
+    def post(self, request, *args, **kwargs):
+        self.get_export()
+        enqueue_export(
+            self.request.current_session, self.kwargs["export"], user=request.user
+        )
+        return redirect(
+            reverse(
+                "session_urls:export_job",
+                kwargs={
+                    "marking_session": self.request.current_session.label,
+                    "export": self.kwargs["export"],
+                },
+            )
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        export = self.get_export()
+
+        jobs = ExportJob.objects.filter(
+            marking_session=self.request.current_session,
+            export=self.kwargs["export"],
+        ).order_by("-created")
+
+        context["page_title"] = export["title"]
+        context["export"] = self.kwargs["export"]
+        context["job"] = jobs.filter(status__in=ExportJob.ACTIVE_STATUSES).first()
+
+        # only show a failure if it's more recent than the last good run
+        last_complete = jobs.filter(status="complete").first()
+        failed = jobs.filter(status="failed")
+        if last_complete is not None:
+            failed = failed.filter(created__gt=last_complete.created)
+        context["last_complete"] = last_complete
+        context["last_failed"] = failed.first()
+
+        return context
+
+
+class ExportJobDownloadView(StatsUserTestMixin, View):
+    def get(self, request, *args, **kwargs):
+        job = get_object_or_404(
+            ExportJob,
+            pk=self.kwargs["job"],
+            marking_session=self.request.current_session,
+            status="complete",
+        )
+        try:
+            fp = open(job.file_path, "rb")
+        except FileNotFoundError:
+            raise Http404("Export file not found")
+
+        return FileResponse(
+            fp,
+            as_attachment=True,
+            filename=EXPORTS[job.export]["file_name"],
+            content_type="text/csv",
+        )
+
+
 class FoiRoRResponseCSVView(StatsUserTestMixin, ListView):
     context_object_name = "responses"
     response_type = "Right of Reply"
@@ -548,48 +638,10 @@ class WeightedScoresDataCSVView(BaseScoresView):
     file_name = "all_sections_scores.csv"
 
     def get_context_data(self, **kwargs):
-        ordered_sections = [
-            "Buildings & Heating",
-            "Transport",
-            "Planning & Land Use",
-            "Governance & Finance",
-            "Biodiversity",
-            "Collaboration & Engagement",
-            "Waste Reduction & Food",
-            "Transport (CA)",
-            "Buildings & Heating & Green Skills (CA)",
-            "Governance & Finance (CA)",
-            "Planning & Biodiversity (CA)",
-            "Collaboration & Engagement (CA)",
-        ]
         context = super().get_context_data(**kwargs)
 
         self.get_scores()
-
-        rows = []
-        rows.append(
-            [
-                "council",
-            ]
-            + ordered_sections
-            + [
-                "total",
-            ]
-        )
-
-        for council, council_score in self.scoring["section_totals"].items():
-            row = [council]
-            for section in ordered_sections:
-                if council_score.get(section, None) is not None:
-                    row.append(council_score[section]["weighted"])
-                else:
-                    row.append(0)
-
-            row.append(self.scoring["council_totals"][council]["weighted_total"])
-
-            rows.append(row)
-
-        context["rows"] = rows
+        context["rows"] = get_weighted_totals_rows(self.scoring)
 
         return context
 
@@ -601,66 +653,7 @@ class SectionScoresDataCSVView(BaseScoresView):
         context = super().get_context_data(**kwargs)
 
         self.get_scores()
-
-        rows = []
-        rows.append(
-            [
-                "council",
-                "country",
-                "type",
-                "political_control",
-                "section",
-                "raw score",
-                "raw max",
-                "raw weighted",
-                "weighted max",
-                "weighted score",
-                "section weighted score",
-            ]
-        )
-
-        for council, council_score in self.scoring["section_totals"].items():
-            country = self.scoring["council_countries"][council]
-            council_type = self.scoring["council_type"][council]
-            control = self.scoring["council_control"][council]
-            for section, scores in council_score.items():
-                row = [
-                    council,
-                    country,
-                    council_type,
-                    control,
-                    section,
-                    scores["raw"],
-                    self.scoring["council_maxes"][council]["raw"][section][
-                        self.scoring["council_groups"][council]
-                    ],
-                    scores["raw_weighted"],
-                    self.scoring["council_maxes"][council]["weighted"][section][
-                        self.scoring["council_groups"][council]
-                    ],
-                    scores["unweighted_percentage"],
-                    scores["weighted"],
-                ]
-
-                rows.append(row)
-            total = self.scoring["council_totals"][council]["weighted_total"]
-            rows.append(
-                [
-                    council,
-                    country,
-                    council_type,
-                    control,
-                    "Total",
-                    "-",
-                    "-",
-                    "-",
-                    "-",
-                    "-",
-                    f"{total:.2f}",
-                ]
-            )
-
-        context["rows"] = rows
+        context["rows"] = get_section_scores_rows(self.scoring)
 
         return context
 
@@ -685,7 +678,6 @@ class QuestionScoresCSV(StatsUserTestMixin, ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        clear_exception_cache()
         scoring = {}
         get_section_maxes(scoring, self.request.current_session)
 
@@ -783,8 +775,7 @@ class BadResponsesView(StatsUserTestMixin, ListView):
         responses = (
             Response.objects.filter(
                 response_type__type="Audit",
-                option__isnull=True,
-                multi_option__isnull=True,
+                is_answered=False,
                 question__section__marking_session=self.request.current_session,
             )
             .select_related("authority", "question", "question__section")
@@ -821,31 +812,16 @@ class DuplicateResponsesView(StatsUserTestMixin, ListView):
             progress_link = "authority_ror_progress"
             question_link = "authority_ror"
 
-        exact_duplicates = get_exact_duplicates(
-            duplicates, self.request.current_session
+        exact_ids = get_exact_duplicate_ids(
+            duplicates, self.request.current_session, response_type=response_type
         )
 
-        exact_ids = []
-        for exact in exact_duplicates:
-            exact_ids.append(f"{exact[0].question_id}:{exact[0].authority_id}")
-
         dupes = []
-        for d in duplicates:
-            exact_id = f"{d['question_id']}:{d['authority_id']}"
-
-            if ignore_exacts == "1" and exact_id in exact_ids:
+        for dupe in get_duplicate_response_sets(
+            self.request.current_session, response_type, duplicates
+        ):
+            if ignore_exacts == "1" and dupe[0].dupe_id in exact_ids:
                 continue
-
-            rs = Response.objects.filter(
-                question_id=d["question_id"],
-                authority_id=d["authority_id"],
-                response_type__type=response_type,
-            ).select_related("authority", "question", "question__section")
-
-            dupe = []
-            for r in rs:
-                r.dupe_id = f"{r.question_id}:{r.authority_id}"
-                dupe.append(r)
             dupes.append(dupe)
 
         context["progress_link"] = progress_link
@@ -855,6 +831,10 @@ class DuplicateResponsesView(StatsUserTestMixin, ListView):
         context["exact_dupes"] = exact_ids
         context["dupes"] = dupes
 
+        export = "duplicate_responses_" + slugify(response_type).replace("-", "_")
+        if export in EXPORTS:
+            context["export"] = export
+
         return context
 
 
@@ -1119,259 +1099,17 @@ class CheckAutomaticPointsView(StatsUserTestMixin, TemplateView):
     context_object_name = "responses"
     template_name = "crowdsourcer/changed_automatic_points.html"
 
-    cols = {
-        "answer": "answer in GRACE",
-        "section": "section",
-        "authority_type": "council type",
-        "authority_country": "council country",
-        "authority_list": "council list",
-        "page_number": "page no",
-        "public_notes": "evidence link",
-        "evidence": "evidence notes",
-    }
-
-    def scrub_council_type(self, types):
-        type_map = {
-            "COMB": "COMB",
-            "CTY": "CTY",
-            "LGD": "LGD",
-            "MD": "MTD",
-            "MTD": "MTD",
-            "UTA": "UTA",
-            "COI": "COI",
-            "NMD": "NMD",
-            "DIS": "DIS",
-            "CC": "LBO",
-            "LBO": "LBO",
-            "SCO": "UTA",
-            "WPA": "UTA",
-            "NID": "UTA",
-            "UA": "UTA",
-            "SRA": "COMB",
-        }
-        scrubbed = []
-        for t in types:
-            t = t.strip()
-            if type_map.get(t) is not None:
-                scrubbed.append(type_map[t])
-            else:
-                self.print_error(f"bad council type {t}")
-        return scrubbed
-
-    def get_config(self):
-        try:
-            c = SessionConfig.objects.get(
-                marking_session=self.request.current_session, name="automatic_points"
-            )
-            conf = c.value
-        except SessionConfig.DoesNotExist:
-            conf = {
-                "data_subdir": None,
-                "points_file": "automatic_points.csv",
-                "option_map_file": None,
-            }
-
-        return conf
-
-    def get_df(self, file_name, data_subdir=None):
-        data_dir = settings.BASE_DIR / "data"
-        if data_subdir:
-            data_dir = data_dir / data_subdir
-
-        file = data_dir / file_name
-        try:
-            df = pd.read_csv(file)
-        except FileNotFoundError:
-            return None
-
-        return df
-
-    def get_points_file(self):
-        df = self.get_df(self.conf["points_file"], self.conf.get("data_subdir"))
-
-        if df is not None:
-            df[self.cols["answer"]] = df[self.cols["answer"]].astype(str)
-
-        return df
-
-    def get_option_map(self):
-        df = self.get_df(self.conf["option_map_file"], self.conf.get("data_subdir"))
-
-        df.question = df.question.astype(str)
-
-        option_map = defaultdict(dict)
-        for _, option in df.iterrows():
-            if option_map[option["section"]].get(option["question"]) is None:
-                option_map[option["section"]][option["question"]] = {}
-
-            option_map[option["section"]][option["question"]][option["prev_option"]] = (
-                option["new_option"]
-            )
-
-        return option_map
-
-    def get_mapped_answer(self, answer, q, answer_map):
-        if (
-            answer_map.get(q.section.title) is not None
-            and answer_map[q.section.title].get(q.number_and_part) is not None
-            and answer_map[q.section.title][q.number_and_part].get(answer) is not None
-        ):
-            return answer_map[q.section.title][q.number_and_part][answer]
-
-        return answer
-
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        bad_responses = defaultdict(dict)
-
-        self.conf = self.get_config()
+        context["export"] = "changed_automatic_points"
 
-        points = self.get_points_file()
-        if points is None:
+        bad_responses = ChangedAutomaticPoints(
+            self.request.current_session
+        ).get_bad_responses()
+        if bad_responses is None:
             context["error"] = "Could not find points file"
             return context
 
-        answer_map = self.get_option_map()
-
-        for _, point in points.iterrows():
-            copy_last_year = False
-            if point[self.cols["section"]] == "Practice":
-                continue
-
-            if pd.isna(point["question number"]):
-                continue
-
-            if point[self.cols["section"]] == "":
-                continue
-
-            c_args = {}
-            if (
-                point.get(self.cols["authority_type"]) is not None
-                and pd.isna(point[self.cols["authority_type"]]) is False
-            ):
-                types = point[self.cols["authority_type"]].strip()
-                if types != "":
-                    types = self.scrub_council_type(types.split(","))
-                    c_args["type__in"] = types
-
-            if (
-                point.get(self.cols["authority_country"], None) is not None
-                and pd.isna(point[self.cols["authority_country"]]) is False
-            ):
-                countries = point[self.cols["authority_country"]].strip()
-                if countries != "":
-                    countries = countries.split(",")
-                    c_args["country__in"] = [c.lower() for c in countries]
-
-            if (
-                point.get(self.cols["authority_list"]) is not None
-                and pd.isna(point[self.cols["authority_list"]]) is False
-            ):
-                councils = point[self.cols["authority_list"]].strip()
-                if councils != "" and "Single-Tier" not in councils.split(","):
-                    councils = [c.strip() for c in councils.split(",")]
-                    c_args = {"name__in": councils}
-
-            councils = PublicAuthority.objects.filter(
-                marking_session=self.request.current_session, **c_args
-            )
-            q_args = {"number": point["question number"]}
-            if (
-                not pd.isna(point["question part"])
-                and point.get("question part", None) is not None
-            ):
-                q_args["number_part"] = point["question part"].strip()
-
-            try:
-                question = Question.objects.get(
-                    section__marking_session=self.request.current_session,
-                    section__title=point[self.cols["section"]],
-                    **q_args,
-                )
-            except Question.DoesNotExist:
-                continue
-
-            if not pd.isna(point["copy last year answer"]):
-                if point["copy last year answer"] == "Y":
-                    copy_last_year = True
-
-            responses = Response.objects.filter(
-                authority__in=councils,
-                question=question,
-                response_type__type="Audit",
-            )
-            bad_q_responses = []
-            for r in responses.all():
-                if copy_last_year:
-                    try:
-                        prev_response = Response.objects.get(
-                            authority=r.authority,
-                            question=question.previous_question,
-                            response_type__type="Audit",
-                        )
-                    except Response.DoesNotExist:
-                        continue
-
-                    if prev_response.option:
-                        past_answer = self.get_mapped_answer(
-                            prev_response.option.description, question, answer_map
-                        )
-                    else:
-                        continue
-                    page_number = prev_response.page_number
-                    if not pd.isna(point[self.cols["page_number"]]):
-                        page_number = point[self.cols["page_number"]]
-
-                    public_notes = prev_response.public_notes
-                    if not pd.isna(point[self.cols["public_notes"]]):
-                        public_notes = point[self.cols["public_notes"]]
-
-                    evidence = prev_response.evidence
-                    if not pd.isna(point[self.cols["evidence"]]):
-                        evidence = point[self.cols["evidence"]]
-
-                    if (
-                        r.option.description != past_answer
-                        or r.page_number != page_number
-                        or r.public_notes != public_notes
-                        or r.evidence != evidence
-                    ):
-                        bad_response = {
-                            "saved": r,
-                            "expected": {
-                                "option": past_answer,
-                                "page_number": page_number,
-                                "public_notes": public_notes,
-                                "evidence": evidence,
-                            },
-                        }
-                        bad_q_responses.append(bad_response)
-                else:
-                    answer = self.get_mapped_answer(
-                        point[self.cols["answer"]], question, answer_map
-                    )
-
-                    if (
-                        r.option.description != answer
-                        or r.page_number != point["page no"]
-                        or r.public_notes != point["evidence link"]
-                        or r.evidence != point["evidence notes"]
-                    ):
-                        bad_response = {
-                            "saved": r,
-                            "expected": {
-                                "option": answer,
-                                "page_number": point[self.cols["page_number"]],
-                                "public_notes": point[self.cols["public_notes"]],
-                                "evidence": point[self.cols["evidence"]],
-                            },
-                        }
-                        bad_q_responses.append(bad_response)
-
-            bad_responses[point[self.cols["section"]]][
-                question.number_and_part
-            ] = bad_q_responses
-
-        context["bad_responses"] = dict(bad_responses)
+        context["bad_responses"] = bad_responses
 
         return context